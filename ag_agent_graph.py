@@ -0,0 +1,233 @@
+import asyncio
+from typing import Any, AsyncGenerator, Dict, List, Mapping, NamedTuple, Optional, Sequence, Set, Tuple
+from autogen_agentchat.base import ChatAgent, Response, TaskResult, Team, TerminationCondition
+from autogen_agentchat.messages import BaseAgentEvent, BaseChatMessage, MessageFactory, TextMessage
+from autogen_core import CancellationToken
+
+
+class AgentNode(NamedTuple):
+    agent: ChatAgent
+    depends_on: Tuple[str, ...] = ()
+
+
+class AgentGraphTeam(Team):
+    """
+    Team running agents along a declared dependency graph.
+
+    An agent starts once all the agents it depends on have answered, so
+    independent agents run concurrently. Each agent is given the task and
+    the answers of the agents it transitively depends on. Streaming events
+    are yielded as they come; the answers are added to the history in the
+    declaration order of their agents, whatever order they finish in.
+
+    A run stopped by the termination condition is resumed by the next run
+    without a task, from the agents that had not answered yet.
+    """
+
+    def __init__(self,
+                 nodes: Sequence[AgentNode],
+                 termination_condition: Optional[TerminationCondition] = None,
+                 name: str = "AgentGraphTeam",
+                 description: str = "A team of agents running along a dependency graph."):
+        self._name = name
+        self._description = description
+        self.nodes: Dict[str, AgentNode] = {}
+        for node in nodes:
+            for dependency in node.depends_on:
+                # Declaring dependencies first also rules out cycles
+                if dependency not in self.nodes:
+                    raise ValueError(f"Agent {node.agent.name} depends on {dependency}, "
+                                     f"which is not declared before it")
+            self.nodes[node.agent.name] = node
+        self.order = list(self.nodes)
+        self.ancestors: Dict[str, Set[str]] = {}
+        for name, node in self.nodes.items():
+            self.ancestors[name] = set(node.depends_on).union(
+                *(self.ancestors[dependency] for dependency in node.depends_on))
+        self.termination_condition = termination_condition
+        self._task: List[BaseChatMessage] = []
+        self._outputs: Dict[str, List[BaseChatMessage]] = {}
+        self._emitted = 0
+
+    @property
+    def name(self) -> str:
+        return self._name
+
+    @property
+    def description(self) -> str:
+        return self._description
+
+    async def run_stream(self,
+                         *,
+                         task: Optional[str | BaseChatMessage | Sequence[BaseChatMessage]] = None,
+                         cancellation_token: Optional[CancellationToken] = None,
+                         output_task_messages: bool = True
+                         ) -> AsyncGenerator[BaseAgentEvent | BaseChatMessage | TaskResult, None]:
+        """
+        Run the graph, yielding the events and answers of the agents and then the result.
+        """
+        cancellation_token = cancellation_token or CancellationToken()
+        messages: List[BaseChatMessage] = []
+        if task is not None or self._emitted == len(self.order):
+            # A new task starts the graph over
+            if isinstance(task, str):
+                task = [TextMessage(content=task, source="user")]
+            elif isinstance(task, BaseChatMessage):
+                task = [task]
+            self._task = list(task or [])
+            self._outputs = {}
+            self._emitted = 0
+            if output_task_messages:
+                messages.extend(self._task)
+                for message in self._task:
+                    yield message
+
+        queue: asyncio.Queue = asyncio.Queue()
+        running: Dict[str, asyncio.Task] = {}
+        stop_reason = None
+        try:
+            self._start_ready(running, queue, cancellation_token)
+            while running:
+                kind, name, item = await queue.get()
+                if kind == "event":
+                    yield item
+                    continue
+                del running[name]
+                if kind == "error":
+                    raise item
+                self._outputs[name] = [item.chat_message]
+                # Answers join the history in declaration order
+                while self._emitted < len(self.order) and self.order[self._emitted] in self._outputs:
+                    emitted = self._outputs[self.order[self._emitted]]
+                    self._emitted += 1
+                    messages.extend(emitted)
+                    for message in emitted:
+                        yield message
+                    if self.termination_condition is not None:
+                        stop = await self.termination_condition(emitted)
+                        if stop is not None:
+                            stop_reason = stop.content
+                            break
+                if stop_reason is not None:
+                    break
+                self._start_ready(running, queue, cancellation_token)
+        finally:
+            for pending in running.values():
+                pending.cancel()
+            if running:
+                await asyncio.gather(*running.values(), return_exceptions=True)
+            # Answers not added to the history yet are produced again on resume
+            for name in self.order[self._emitted:]:
+                self._outputs.pop(name, None)
+
+        if self.termination_condition is not None:
+            await self.termination_condition.reset()
+        yield TaskResult(messages=messages,
+                         stop_reason=stop_reason or "All agents of the graph have answered.")
+
+    async def run(self,
+                  *,
+                  task: Optional[str | BaseChatMessage | Sequence[BaseChatMessage]] = None,
+                  cancellation_token: Optional[CancellationToken] = None,
+                  output_task_messages: bool = True) -> TaskResult:
+        """
+        Run the graph to completion.
+        """
+        result = None
+        async for message in self.run_stream(task=task, cancellation_token=cancellation_token,
+                                             output_task_messages=output_task_messages):
+            if isinstance(message, TaskResult):
+                result = message
+        return result  # type: ignore
+
+    async def reset(self) -> None:
+        """
+        Reset the agents and start the next run from the top of the graph.
+        """
+        for node in self.nodes.values():
+            await node.agent.on_reset(CancellationToken())
+        if self.termination_condition is not None:
+            await self.termination_condition.reset()
+        self._task = []
+        self._outputs = {}
+        self._emitted = 0
+
+    async def pause(self) -> None:
+        """
+        Pause the agents, which keep the run alive until they are resumed.
+        """
+        for node in self.nodes.values():
+            await node.agent.on_pause(CancellationToken())
+
+    async def resume(self) -> None:
+        """
+        Resume the agents paused by `pause`.
+        """
+        for node in self.nodes.values():
+            await node.agent.on_resume(CancellationToken())
+
+    async def save_state(self) -> Mapping[str, Any]:
+        """
+        Get the state of the agents and of the run in progress, as JSON.
+        """
+        return {
+            "type": "AgentGraphTeamState",
+            "version": "1.0.0",
+            "agent_states": {name: await node.agent.save_state() for name, node in self.nodes.items()},
+            "task": [message.dump() for message in self._task],
+            "outputs": {name: [message.dump() for message in messages]
+                        for name, messages in self._outputs.items()},
+            "emitted": self._emitted,
+        }
+
+    async def load_state(self, state: Mapping[str, Any]) -> None:
+        """
+        Restore the state saved by `save_state`.
+        """
+        for name, agent_state in state["agent_states"].items():
+            if name in self.nodes:
+                await self.nodes[name].agent.load_state(agent_state)
+        factory = MessageFactory()
+        self._task = [factory.create(message) for message in state["task"]]
+        self._outputs = {name: [factory.create(message) for message in messages]
+                         for name, messages in state["outputs"].items()}
+        self._emitted = state["emitted"]
+
+    def _start_ready(self,
+                     running: Dict[str, asyncio.Task],
+                     queue: asyncio.Queue,
+                     cancellation_token: CancellationToken) -> None:
+        for name, node in self.nodes.items():
+            if name in self._outputs or name in running:
+                continue
+            if all(dependency in self._outputs for dependency in node.depends_on):
+                running[name] = asyncio.create_task(
+                    self._run_agent(node.agent, self._inputs(name), queue, cancellation_token))
+                # Cancelling the token stops the agents that are running
+                cancellation_token.link_future(running[name])
+
+    def _inputs(self, name: str) -> List[BaseChatMessage]:
+        inputs = list(self._task)
+        for ancestor in self.order:
+            if ancestor in self.ancestors[name]:
+                inputs.extend(self._outputs[ancestor])
+        return inputs
+
+    @staticmethod
+    async def _run_agent(agent: ChatAgent,
+                         messages: List[BaseChatMessage],
+                         queue: asyncio.Queue,
+                         cancellation_token: CancellationToken) -> None:
+        try:
+            async for item in agent.on_messages_stream(messages, cancellation_token):
+                if isinstance(item, Response):
+                    await queue.put(("done", agent.name, item))
+                    return
+                await queue.put(("event", agent.name, item))
+            raise RuntimeError(f"Agent {agent.name} did not return a response")
+        except asyncio.CancelledError:
+            # The run is told when the token, not the run itself, cancelled the agent
+            queue.put_nowait(("error", agent.name, asyncio.CancelledError()))
+            raise
+        except Exception as e:
+            await queue.put(("error", agent.name, e))
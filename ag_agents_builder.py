@@ -1,8 +1,19 @@
+from dataclasses import dataclass
+from typing import Awaitable, Callable, Optional, Tuple
 from autogen_agentchat.agents import AssistantAgent, UserProxyAgent
-from ag_model_builder import create_model_client
+from autogen_agentchat.base import ChatAgent
+from ag_agent_graph import AgentNode
+from ag_diagram_compiler import ARCHITECTURE_MODEL_INSTRUCTIONS
+from ag_diagram_speculation import (COMPILED_DIAGRAMS_ENABLED, SPECULATIVE_DIAGRAMS_ENABLED, CompiledDiagramAgent,
+                                    DiagramSpeculator, SpeculativeDiagramAgent)
+from ag_history import create_model_context
+from ag_model_builder import ModelClientLease, model_client_pool
+from ag_response_cache import create_cached_client
 from autogen_core import CancellationToken
+from autogen_core.tools import FunctionTool
 import chainlit as cl
-from ag_tools_builder import generate_mermaid_diagram, get_date
+from ag_tools_builder import generate_mermaid_diagram, get_date, search_azure_guidance
+from vectordb_retriever import GUIDANCE_RETRIEVAL_ENABLED
 
 
 async def user_input_func(prompt: str, cancellation_token: CancellationToken | None = None) -> str:
@@ -41,29 +52,101 @@ async def user_action_func(prompt: str, cancellation_token: CancellationToken |
         return "User did not provide any input."
 
 
-def get_participants() -> list[str]:
-    """Get the list of participants in the conversation."""
+@dataclass(frozen=True)
+class AgentTemplate:
+    """Immutable definition of an agent, instantiated once per chat session.
 
-    # Create the user input agent.
-    user_input_agent = UserProxyAgent(
-        name="user_input_agent",
-        input_func=user_input_func,
-        description="A human user to provide input to the agent.",
-    )
+    Templates with an `input_func` become user proxy agents, `speculative`
+    templates diagram agents fed by a speculator, `compiled` templates
+    diagram agents compiling the architect's component model, and the others
+    assistant agents backed by a pooled model client. Only `cacheable`
+    agents go through the response cache, when it is enabled. With history
+    compaction enabled, assistant agents send their model a compact history
+    of at most `history_budget` tokens, or the default budget.
+    """
+    name: str
+    description: str = "An agent that provides assistance with ability to use tools."
+    system_message: Optional[str] = None
+    model_name: Optional[str] = None
+    function_calling: bool = False
+    json_output: bool = False
+    tools: Tuple[FunctionTool, ...] = ()
+    reflect_on_tool_use: bool = False
+    cacheable: bool = False
+    speculative: bool = False
+    compiled: bool = False
+    history_budget: Optional[int] = None
+    input_func: Optional[Callable[[str, Optional[CancellationToken]], Awaitable[str]]] = None
 
-    # Create the user approval agent.
-    user_approval_agent = UserProxyAgent(
-        name="user_approval_agent",
-        input_func=user_action_func,
-        description="A human user to approve or reject the architecture.",
-    )
 
-    # Create the questioner agent.
-    questioner_agent = AssistantAgent(
-        name="questioner_agent",
-        model_client=create_model_client("gpt-4o-mini"),
+def build_agent(template: AgentTemplate,
+                lease: ModelClientLease,
+                speculator: DiagramSpeculator | None = None) -> ChatAgent:
+    """Instantiate an agent from its template for one chat session."""
+    if template.input_func is not None:
+        return UserProxyAgent(
+            name=template.name,
+            input_func=template.input_func,
+            description=template.description,
+        )
+    if template.compiled:
+        return CompiledDiagramAgent(
+            name=template.name,
+            description=template.description,
+            speculator=speculator or create_diagram_speculator(lease, template),
+        )
+    if template.speculative:
+        return SpeculativeDiagramAgent(
+            name=template.name,
+            description=template.description,
+            speculator=speculator or create_diagram_speculator(lease, template),
+        )
+    model_client = lease.acquire(
+        template.model_name,
+        function_calling=template.function_calling,
+        json_output=template.json_output)
+    if template.cacheable:
+        model_client = create_cached_client(model_client, template.model_name)
+    return AssistantAgent(
+        name=template.name,
+        description=template.description,
+        model_client=model_client,
+        tools=list(template.tools) or None,
+        reflect_on_tool_use=template.reflect_on_tool_use,
         model_client_stream=True,
-        system_message="""
+        system_message=template.system_message,
+        model_context=create_model_context(template.history_budget),
+    )
+
+
+# The tools are wrapped once per process, their schemas are shared by all sessions.
+MERMAID_DIAGRAM_TOOL = FunctionTool(
+    generate_mermaid_diagram, description=generate_mermaid_diagram.__doc__ or "")
+DATE_TOOL = FunctionTool(get_date, description=get_date.__doc__ or "")
+GUIDANCE_TOOL = FunctionTool(
+    search_azure_guidance, description=search_azure_guidance.__doc__ or "")
+
+# The user input agent.
+USER_INPUT_AGENT = AgentTemplate(
+    name="user_input_agent",
+    input_func=user_input_func,
+    description="A human user to provide input to the agent.",
+)
+
+# The user approval agent.
+USER_APPROVAL_AGENT = AgentTemplate(
+    name="user_approval_agent",
+    input_func=user_action_func,
+    description="A human user to approve or reject the architecture.",
+)
+
+# The questioner agent.
+QUESTIONER_AGENT = AgentTemplate(
+    name="questioner_agent",
+    model_name="gpt-4o-mini",
+    cacheable=True,
+    history_budget=2000,
+    system_message="""
             You are an Azure requirements specialist responsible for gathering essential information about the user's cloud architecture project. Your role is to:
             
             1. Ask targeted questions (maximum 5) to understand the user's Azure project requirements
@@ -78,14 +161,18 @@ def get_participants() -> list[str]:
             Ensure questions are clear, relevant, and build upon previous responses. Do not request any sensitive information such as credentials, personal data, or specific security configurations.
             Keep the conversation professional and focused on gathering actionable requirements for architectural planning.
         """,
-    )
+)
 
-    # Create the architect agent.
-    architect_agent = AssistantAgent(
-        name="architect_agent",
-        model_client=create_model_client("gpt-4o-mini"),
-        model_client_stream=True,
-        system_message="""
+# The architect agent.
+ARCHITECT_AGENT = AgentTemplate(
+    name="architect_agent",
+    model_name="gpt-4o-mini",
+    cacheable=True,
+    # Ground the answer in the guidance index instead of model memory, when it is built.
+    function_calling=GUIDANCE_RETRIEVAL_ENABLED,
+    tools=(GUIDANCE_TOOL,) if GUIDANCE_RETRIEVAL_ENABLED else (),
+    reflect_on_tool_use=GUIDANCE_RETRIEVAL_ENABLED,
+    system_message="""
             You are a professional Azure Solutions Architect with expertise in cloud design principles. When users present requirements for an Azure solution, please:
             
             1. Create a high-level architecture recommendation aligned with Microsoft's best practices from:
@@ -102,22 +189,26 @@ def get_participants() -> list[str]:
             
             3. Provide links to relevant Azure documentation and resources for further guidance.
             
+            If a guidance search tool is available, search it once with the key requirements and base
+            your recommendation on the returned excerpts, citing their sources, instead of generic content.
+            
             Keep responses clear, concise, and actionable while following Azure architectural best practices.
             Add Emojis to make the response more engaging and visually appealing.
-        """,
-    )
+        """ + (ARCHITECTURE_MODEL_INSTRUCTIONS if COMPILED_DIAGRAMS_ENABLED else ""),
+)
 
-    # Create the diagram agent.
-    diagram_agent = AssistantAgent(
-        name="diagram_agent",
-        model_client=create_model_client(
-            "mistral-small-2503",
-            function_calling=True,
-            json_output=True),
-        tools=[generate_mermaid_diagram],
-        reflect_on_tool_use=True,
-        model_client_stream=True,
-        system_message="""
+# The diagram agent.
+DIAGRAM_AGENT = AgentTemplate(
+    name="diagram_agent",
+    model_name="mistral-small-2503",
+    function_calling=True,
+    json_output=True,
+    tools=(MERMAID_DIAGRAM_TOOL,),
+    reflect_on_tool_use=True,
+    cacheable=True,
+    # Room for the whole answer of the architect.
+    history_budget=3000,
+    system_message="""
             You're a Mermaid diagram generation specialist working with Azure architectures.
             
             When presented with a high-level architecture from the architect agent:
@@ -130,19 +221,19 @@ def get_participants() -> list[str]:
             - Exclude any styling, CSS formatting, or comments from the diagram code            
             - Generate clean, minimal code that will render correctly in standard Mermaid viewers
         """,
-    )
+)
 
-    # Create the illustrator agent.
-    illustrator_agent = AssistantAgent(
-        name="illustrator_agent",
-        model_client=create_model_client(
-            "mistral-small-2503",
-            function_calling=True,
-            json_output=True),
-        tools=[generate_mermaid_diagram],
-        reflect_on_tool_use=True,
-        model_client_stream=True,
-        system_message="""
+# The illustrator agent.
+ILLUSTRATOR_AGENT = AgentTemplate(
+    name="illustrator_agent",
+    model_name="mistral-small-2503",
+    function_calling=True,
+    json_output=True,
+    tools=(MERMAID_DIAGRAM_TOOL,),
+    reflect_on_tool_use=True,
+    # Only the Mermaid code of the diagram agent is needed.
+    history_budget=1500,
+    system_message="""
             You're a diagram illustrator specialist.
             When presented with Mermaid code from the diagram agent:
             - Keep new lines and indentation from the provided code
@@ -150,31 +241,136 @@ def get_participants() -> list[str]:
             - If the answer from the tool is valid, return the diagram filename.
             - If the answer from the tool is invalid, return an error message.
         """,
-    )
+)
 
-    # Create the architect agent."""
-    calendar_agent = AssistantAgent(
-        name="calendar_agent",
-        model_client=create_model_client(
-            "mistral-small-2503",
-            function_calling=True,
-            json_output=True),
-        tools=[get_date],
-        reflect_on_tool_use=True,
-        model_client_stream=True,
-        system_message="""            
+# The cost reviewer agent, only part of the graph team.
+COST_REVIEWER_AGENT = AgentTemplate(
+    name="cost_reviewer_agent",
+    model_name="gpt-4o-mini",
+    cacheable=True,
+    system_message="""
+            You are an Azure cost optimization reviewer.
+            When presented with a high-level architecture from the architect agent:
+            - Identify the main cost drivers among the proposed services
+            - Suggest cheaper tiers, reservations or alternative services where they fit the requirements
+            - Point out components that could scale to zero or be shared
+            Keep the review short and do not repeat the architecture.
+        """,
+)
+
+# The security reviewer agent, only part of the graph team.
+SECURITY_REVIEWER_AGENT = AgentTemplate(
+    name="security_reviewer_agent",
+    model_name="gpt-4o-mini",
+    cacheable=True,
+    system_message="""
+            You are an Azure security reviewer following the Well-Architected Framework security pillar.
+            When presented with a high-level architecture from the architect agent:
+            - Identify missing identity, network isolation, secret management and data protection controls
+            - Point out compliance risks for the stated requirements
+            - Recommend the Azure services or settings that close each gap
+            Keep the review short and do not repeat the architecture.
+        """,
+)
+
+# The diagram agent drafting the diagram while the architect is streaming,
+# in place of the diagram and illustrator agents.
+SPECULATIVE_DIAGRAM_AGENT = AgentTemplate(
+    name="diagram_agent",
+    description="An agent that draws the architecture diagram.",
+    model_name="mistral-small-2503",
+    speculative=True,
+    system_message="""
+            You're a Mermaid diagram generation specialist working with Azure architectures.
+            
+            When presented with a high-level architecture, possibly still incomplete:
+            - Draw the key components and their connections as a simple flowchart
+            - Exclude subgraphs, parentheses, special characters and symbols
+            - Use clear, descriptive node labels and meaningful connection descriptions
+            - Exclude any styling, CSS formatting, or comments from the diagram code
+            
+            Answer with the Mermaid code only.
+        """,
+)
+
+# The diagram agent compiling the architect's component model, in place of
+# the diagram and illustrator agents. It drafts with the model when the
+# answer has no usable component model.
+COMPILED_DIAGRAM_AGENT = AgentTemplate(
+    name="diagram_agent",
+    description="An agent that draws the architecture diagram.",
+    model_name=SPECULATIVE_DIAGRAM_AGENT.model_name,
+    compiled=True,
+    system_message=SPECULATIVE_DIAGRAM_AGENT.system_message,
+)
+
+# The calendar agent, not part of the conversation.
+CALENDAR_AGENT = AgentTemplate(
+    name="calendar_agent",
+    model_name="mistral-small-2503",
+    function_calling=True,
+    json_output=True,
+    tools=(DATE_TOOL,),
+    reflect_on_tool_use=True,
+    system_message="""            
             You're a helpful assistant.
         """,
-    )
+)
+
+# The agents turning the architecture into a picture, with the agents each one waits for.
+DIAGRAM_GRAPH_TEMPLATES: Tuple[Tuple[AgentTemplate, Tuple[str, ...]], ...] = (
+    ((COMPILED_DIAGRAM_AGENT, ("architect_agent",)),) if COMPILED_DIAGRAMS_ENABLED else
+    ((SPECULATIVE_DIAGRAM_AGENT, ("architect_agent",)),) if SPECULATIVE_DIAGRAMS_ENABLED else
+    ((DIAGRAM_AGENT, ("architect_agent",)), (ILLUSTRATOR_AGENT, ("diagram_agent",))))
+DIAGRAM_TEMPLATES = tuple(template for template, _ in DIAGRAM_GRAPH_TEMPLATES)
+
+# The participants of the conversation, in speaking order.
+PARTICIPANT_TEMPLATES: Tuple[AgentTemplate, ...] = (
+    QUESTIONER_AGENT,
+    USER_INPUT_AGENT,
+    ARCHITECT_AGENT,
+    *DIAGRAM_TEMPLATES,
+    USER_APPROVAL_AGENT,
+)
+
+# The agents of the graph team and the agents each one waits for. Once the
+# architect has answered, the reviews and the diagram are produced concurrently.
+GRAPH_TEMPLATES: Tuple[Tuple[AgentTemplate, Tuple[str, ...]], ...] = (
+    (QUESTIONER_AGENT, ()),
+    (USER_INPUT_AGENT, ("questioner_agent",)),
+    (ARCHITECT_AGENT, ("user_input_agent",)),
+    (COST_REVIEWER_AGENT, ("architect_agent",)),
+    (SECURITY_REVIEWER_AGENT, ("architect_agent",)),
+    *DIAGRAM_GRAPH_TEMPLATES,
+    (USER_APPROVAL_AGENT, ("cost_reviewer_agent", "security_reviewer_agent", DIAGRAM_TEMPLATES[-1].name)),
+)
+
+
+def create_diagram_speculator(lease: ModelClientLease,
+                              template: AgentTemplate = SPECULATIVE_DIAGRAM_AGENT) -> DiagramSpeculator:
+    """Create the diagram speculator of a chat session.
+
+    The chat handler feeds it the architect's stream, the speculative diagram
+    agent awaits its drafts.
+    """
+    return DiagramSpeculator(lease.acquire(template.model_name), template.system_message or "")
+
+
+def get_participants(lease: ModelClientLease | None = None,
+                     speculator: DiagramSpeculator | None = None) -> list[ChatAgent]:
+    """Get the list of participants in the conversation.
+
+    The agents are instantiated from the prebuilt templates. Their model
+    clients come from the process-wide pool and are tracked by the given
+    lease, so the caller can release them when the session ends.
+    """
+    lease = lease or model_client_pool.lease()
+    return [build_agent(template, lease, speculator) for template in PARTICIPANT_TEMPLATES]
+
 
-    return [
-        questioner_agent,
-        user_input_agent,
-        architect_agent,
-        diagram_agent,
-        illustrator_agent,
-        user_approval_agent
-
-        # calendar_agent,
-        # user_approval_agent,
-    ]
+def get_graph_nodes(lease: ModelClientLease | None = None,
+                    speculator: DiagramSpeculator | None = None) -> list[AgentNode]:
+    """Get the agents of the graph team with their dependencies, in history order."""
+    lease = lease or model_client_pool.lease()
+    return [AgentNode(build_agent(template, lease, speculator), depends_on)
+            for template, depends_on in GRAPH_TEMPLATES]
@@ -0,0 +1,115 @@
+import json
+import re
+from typing import Dict, List, NamedTuple, Optional, Tuple
+from ag_mermaid import quote_label
+
+
+# Instructions appended to the architect's system message so its answer carries a diagram model.
+ARCHITECTURE_MODEL_INSTRUCTIONS = """
+            End your answer with the components of the architecture and their connections,
+            as a JSON code block in this format:
+            ```json
+            {"direction": "LR",
+             "components": [{"id": "frontdoor", "name": "Azure Front Door"}, {"id": "app", "name": "Azure App Service"}],
+             "connections": [{"from": "frontdoor", "to": "app", "label": "HTTPS"}]}
+            ```
+        """
+
+JSON_BLOCK_PATTERN = re.compile(r'```json\s*\n(.*?)```', re.DOTALL)
+DIRECTIONS = ('LR', 'RL', 'TD', 'TB', 'BT')
+
+
+class Component(NamedTuple):
+    id: str
+    name: str
+
+
+class Connection(NamedTuple):
+    source: str
+    target: str
+    label: str = ""
+
+
+class ArchitectureModel(NamedTuple):
+    components: Tuple[Component, ...]
+    connections: Tuple[Connection, ...]
+    direction: str = "LR"
+
+
+def parse_architecture_model(data: dict) -> ArchitectureModel:
+    """
+    Build an architecture model from its JSON form.
+
+    Connections may refer to components by id or by name; components only
+    named by a connection are added to the model.
+    """
+    if not isinstance(data, dict) or not isinstance(data.get("components"), list):
+        raise ValueError("Expected an object with a list of components")
+    components: Dict[str, Component] = {}
+    aliases: Dict[str, str] = {}
+    for item in data["components"]:
+        if isinstance(item, str):
+            item = {"name": item}
+        if not isinstance(item, dict):
+            raise ValueError(f"Expected a component, got {item!r}")
+        name = str(item.get("name") or item.get("id") or "").strip()
+        if not name:
+            raise ValueError(f"Component without a name: {item}")
+        component_id = str(item.get("id") or name).strip()
+        components.setdefault(component_id, Component(component_id, name))
+        aliases.setdefault(component_id.lower(), component_id)
+        aliases.setdefault(name.lower(), component_id)
+
+    def resolve(reference) -> str:
+        reference = str(reference or "").strip()
+        if not reference:
+            raise ValueError("Connection without an endpoint")
+        component_id = aliases.get(reference.lower())
+        if component_id is None:
+            component_id = aliases[reference.lower()] = reference
+            components[reference] = Component(reference, reference)
+        return component_id
+
+    connections = []
+    for item in data.get("connections") or []:
+        if not isinstance(item, dict):
+            raise ValueError(f"Expected a connection, got {item!r}")
+        connections.append(Connection(resolve(item.get("from") or item.get("source")),
+                                      resolve(item.get("to") or item.get("target")),
+                                      str(item.get("label") or "").strip()))
+    direction = str(data.get("direction") or "LR").upper()
+    if direction not in DIRECTIONS:
+        raise ValueError(f"Unknown direction: {direction}")
+    return ArchitectureModel(tuple(components.values()), tuple(connections), direction)
+
+
+def extract_architecture_model(text: str) -> Optional[ArchitectureModel]:
+    """
+    Get the architecture model of the last JSON block of an answer that holds one.
+    """
+    for block in reversed(JSON_BLOCK_PATTERN.findall(text)):
+        try:
+            return parse_architecture_model(json.loads(block))
+        except ValueError:
+            # json.JSONDecodeError is a ValueError too
+            continue
+    return None
+
+
+def compile_mermaid(model: ArchitectureModel) -> str:
+    """
+    Compile an architecture model to Mermaid flowchart code.
+
+    Nodes get generated ids, so component ids never clash with Mermaid
+    keywords, and every label is quoted.
+    """
+    if not model.components:
+        raise ValueError("The architecture has no components")
+    node_ids = {component.id: f"N{number}" for number, component in enumerate(model.components, start=1)}
+    lines: List[str] = [f"flowchart {model.direction}"]
+    for component in model.components:
+        lines.append(f"    {node_ids[component.id]}[{quote_label(component.name)}]")
+    for connection in model.connections:
+        link = f"-->|{quote_label(connection.label)}|" if connection.label else "-->"
+        lines.append(f"    {node_ids[connection.source]} {link} {node_ids[connection.target]}")
+    return "\n".join(lines)
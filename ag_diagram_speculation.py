@@ -0,0 +1,237 @@
+import asyncio
+import logging
+import os
+import re
+from typing import Any, AsyncGenerator, Awaitable, Callable, Dict, List, NamedTuple, Optional, Sequence, Tuple
+from autogen_agentchat.agents import BaseChatAgent
+from autogen_agentchat.base import Response
+from autogen_agentchat.messages import BaseAgentEvent, BaseChatMessage, ModelClientStreamingChunkEvent, TextMessage
+from autogen_core import CancellationToken
+from autogen_core.models import ChatCompletionClient, SystemMessage, UserMessage
+from ag_diagram_compiler import compile_mermaid, extract_architecture_model
+from ag_tools_builder import render_diagram
+
+
+# Opt-in switch of the speculative diagram agent.
+SPECULATIVE_DIAGRAMS_ENABLED = os.getenv("SPECULATIVE_DIAGRAMS_ENABLED", "false").lower() in ("1", "true", "yes")
+
+# Opt-in switch of the diagrams compiled from the architect's component model.
+COMPILED_DIAGRAMS_ENABLED = os.getenv("COMPILED_DIAGRAMS_ENABLED", "false").lower() in ("1", "true", "yes")
+
+# Lines starting a section of the architect's answer: markdown headings,
+# numbered items and lines in bold.
+HEADING_PATTERN = re.compile(r'^\s*(?:#{1,6}\s+.*|\d+[.)]\s+.*|\*\*[^*]+\*\*:?\s*)$')
+BULLET_PATTERN = re.compile(r'^\s*[-*+]\s+(.+)$')
+# Name of a component: its bold text, or the text before a colon or dash.
+COMPONENT_NAME_PATTERN = re.compile(r'^\*\*([^*]+)\*\*|^([^:–—]+?)\s*(?::|\s-\s|–|—|$)')
+MERMAID_BLOCK_PATTERN = re.compile(r'```(?:mermaid)?\s*\n(.*?)```', re.DOTALL)
+
+
+def extract_components(text: str, final: bool = False) -> Optional[Tuple[str, ...]]:
+    """
+    Get the normalized names of the components listed in an architecture.
+
+    The components are the bullets of the first section whose heading
+    mentions components. The list is only complete once the next section
+    has started, or at the end of a `final` text.
+    """
+    components: Optional[List[str]] = None
+    for line in text.splitlines():
+        if HEADING_PATTERN.match(line):
+            if components:
+                return tuple(sorted(set(components)))
+            if components is None and 'component' in line.lower():
+                components = []
+            continue
+        bullet = BULLET_PATTERN.match(line)
+        if components is not None and bullet:
+            match = COMPONENT_NAME_PATTERN.match(bullet.group(1).strip())
+            name = (match.group(1) or match.group(2)) if match else bullet.group(1)
+            name = re.sub(r'[^a-z0-9]+', ' ', name.lower()).strip()
+            if name:
+                components.append(name)
+    if final and components:
+        return tuple(sorted(set(components)))
+    return None
+
+
+def extract_mermaid_code(content: str) -> str:
+    """
+    Get the Mermaid code of a model answer, with or without a code fence.
+    """
+    match = MERMAID_BLOCK_PATTERN.search(content)
+    return (match.group(1) if match else content).strip()
+
+
+class DiagramDraft(NamedTuple):
+    components: Tuple[str, ...]
+    task: "asyncio.Future[Dict[str, Any]]"
+
+
+class DiagramSpeculator:
+    """
+    Draft the diagram of an architecture while the architect is still streaming it.
+
+    The architect's chunks are fed as they arrive, a chunk of a new message
+    of the architect drops the previous one. Once its component list is
+    complete, a Mermaid draft is generated and rendered in the background.
+    When the architect has finished, the draft is used if the final answer
+    lists the same components, otherwise it is cancelled and the diagram is
+    drafted again from the final answer.
+    """
+
+    def __init__(self,
+                 model_client: ChatCompletionClient,
+                 system_message: str,
+                 render: Optional[Callable[[str], Awaitable[Dict[str, Any]]]] = None):
+        self.model_client = model_client
+        self.system_message = system_message
+        self.render = render or render_diagram
+        self.text = ""
+        self.message_id: Optional[str] = None
+        self.draft: Optional[DiagramDraft] = None
+        self.hits = 0
+        self.misses = 0
+
+    def feed(self, chunk: str, message_id: Optional[str] = None) -> None:
+        """
+        Add a chunk of the architect's answer, starting the draft once the components are known.
+
+        `message_id` is the id of the message the chunk belongs to.
+        """
+        if message_id != self.message_id:
+            # The architect answered again before its previous answer was drafted
+            self.reset()
+            self.message_id = message_id
+        self.text += chunk
+        if self.draft is None:
+            components = extract_components(self.text)
+            if components:
+                self.draft = DiagramDraft(components, asyncio.ensure_future(self._generate(self.text)))
+
+    async def result(self, architecture: str) -> Dict[str, Any]:
+        """
+        Get the rendered diagram of the final architecture, from the draft when it matches.
+        """
+        draft, self.draft, self.text, self.message_id = self.draft, None, "", None
+        components = extract_components(architecture, final=True)
+        if draft is not None and draft.components == components:
+            self.hits += 1
+            try:
+                return await draft.task
+            except Exception as e:
+                logging.warning(f"Speculative diagram draft failed, drafting again: {str(e)}")
+        else:
+            self.misses += 1
+            if draft is not None:
+                draft.task.cancel()
+        return await self._generate(architecture)
+
+    def reset(self) -> None:
+        """
+        Drop the partial answer and cancel the draft in progress.
+        """
+        if self.draft is not None:
+            self.draft.task.cancel()
+        self.draft = None
+        self.text = ""
+        self.message_id = None
+
+    def stats(self) -> Dict[str, int]:
+        """
+        Get the number of drafts used and redone.
+        """
+        return {"hits": self.hits, "misses": self.misses}
+
+    async def _generate(self, architecture: str) -> Dict[str, Any]:
+        result = await self.model_client.create([
+            SystemMessage(content=self.system_message),
+            UserMessage(content=architecture, source="architect_agent"),
+        ])
+        diagram_code = extract_mermaid_code(str(result.content))
+        rendered = await self.render(diagram_code)
+        return {**rendered, "diagram_code": diagram_code}
+
+
+class SpeculativeDiagramAgent(BaseChatAgent):
+    """
+    Agent answering with the diagram of the architect's last answer, drafted by a speculator.
+
+    It replaces the diagram and illustrator agents: the Mermaid code and the
+    render come from one model call, usually started before the architect
+    has finished.
+    """
+
+    def __init__(self, name: str, description: str, speculator: DiagramSpeculator):
+        super().__init__(name, description)
+        self.speculator = speculator
+
+    @property
+    def produced_message_types(self) -> Sequence[type[BaseChatMessage]]:
+        return (TextMessage,)
+
+    async def on_messages(self,
+                          messages: Sequence[BaseChatMessage],
+                          cancellation_token: CancellationToken) -> Response:
+        response = None
+        async for item in self.on_messages_stream(messages, cancellation_token):
+            if isinstance(item, Response):
+                response = item
+        return response  # type: ignore
+
+    async def on_messages_stream(self,
+                                 messages: Sequence[BaseChatMessage],
+                                 cancellation_token: CancellationToken
+                                 ) -> AsyncGenerator[BaseAgentEvent | BaseChatMessage | Response, None]:
+        architecture = next((message.to_text() for message in reversed(messages)
+                             if message.source == "architect_agent"), None)
+        if architecture is None:
+            architecture = messages[-1].to_text() if messages else ""
+        result = await self.diagram(architecture)
+        if result.get("valid"):
+            content = f"Architecture diagram: {result['filename']}"
+        else:
+            content = f"The diagram could not be rendered: {result.get('error', 'unknown error')}"
+        # Streamed like the model agents so the UI shows it under its own header
+        yield ModelClientStreamingChunkEvent(content=content, source=self.name)
+        yield Response(chat_message=TextMessage(content=content, source=self.name))
+
+    async def diagram(self, architecture: str) -> Dict[str, Any]:
+        """
+        Get the rendered diagram of the architecture.
+        """
+        return await self.speculator.result(architecture)
+
+    async def on_reset(self, cancellation_token: CancellationToken) -> None:
+        self.speculator.reset()
+
+
+class CompiledDiagramAgent(SpeculativeDiagramAgent):
+    """
+    Agent compiling the component model of the architect's answer to Mermaid, without a model call.
+
+    Answers without a valid model, or whose diagram does not render, fall
+    back to the speculator's draft.
+    """
+
+    def __init__(self, name: str, description: str, speculator: DiagramSpeculator):
+        super().__init__(name, description, speculator)
+        self.compiled = 0
+        self.fallbacks = 0
+
+    async def diagram(self, architecture: str) -> Dict[str, Any]:
+        model = extract_architecture_model(architecture)
+        if model is not None:
+            try:
+                diagram_code = compile_mermaid(model)
+                result = await self.speculator.render(diagram_code)
+                if result.get("valid"):
+                    # A draft started from the architect's stream is not needed
+                    self.speculator.reset()
+                    self.compiled += 1
+                    return {**result, "diagram_code": diagram_code}
+                logging.warning(f"Compiled diagram did not render: {result.get('error')}")
+            except ValueError as e:
+                logging.warning(f"Architecture model could not be compiled: {str(e)}")
+        self.fallbacks += 1
+        return await super().diagram(architecture)
@@ -0,0 +1,205 @@
+import asyncio
+import logging
+import os
+import time
+from collections import OrderedDict
+from typing import Dict, List, NamedTuple, Optional, Set
+from ag_files_store import FilesStore
+
+
+# Temporary files older than this are left over from interrupted writes.
+STALE_TEMP_AGE = 10 * 60
+
+
+class SweepReport(NamedTuple):
+    files: int
+    bytes: int
+
+
+class FilesLifecycleManager:
+    """
+    Bound the size and age of the generated files in a FilesStore.
+
+    Files are claimed by the chat sessions that display them. A background
+    sweeper deletes files older than `max_age` seconds, then the oldest files
+    until the store is below `max_bytes`, preferring files no session owns.
+    A session that owns more than `session_max_bytes` gives up its oldest
+    files, which are deleted unless another session owns them.
+
+    Each sweep rescans the directory, so the files written by other workers
+    sharing it count towards the quotas. Ownership is tracked per worker:
+    the sweeper of a worker does not know the files the sessions of the
+    others display, and only spares them while they are recent.
+    """
+
+    def __init__(self,
+                 store: FilesStore,
+                 max_bytes: int = 500 * 1024 * 1024,
+                 max_age: float = 7 * 24 * 3600,
+                 session_max_bytes: int = 50 * 1024 * 1024,
+                 sweep_interval: float = 300.0):
+        self.store = store
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.session_max_bytes = session_max_bytes
+        self.sweep_interval = sweep_interval
+        self.owners: Dict[str, Set[str]] = {}
+        self.sessions: Dict[str, "OrderedDict[str, int]"] = {}
+        self.reclaimed_files = 0
+        self.reclaimed_bytes = 0
+        self._task: Optional[asyncio.Task] = None
+
+    async def claim(self, session_id: str, filename: str) -> SweepReport:
+        """
+        Record that a session displays a file, and delete the oldest files of
+        the session once it is over its quota.
+        """
+        size = self.store.size_of(filename)
+        if size is None:
+            return SweepReport(0, 0)
+        files = self.sessions.setdefault(session_id, OrderedDict())
+        files.pop(filename, None)
+        files[filename] = size
+        self.owners.setdefault(filename, set()).add(session_id)
+
+        released = []
+        while sum(files.values()) > self.session_max_bytes and len(files) > 1:
+            oldest, _ = files.popitem(last=False)
+            self._disown(session_id, oldest)
+            if oldest not in self.owners:
+                released.append(oldest)
+        if not released:
+            return SweepReport(0, 0)
+        freed = await asyncio.to_thread(lambda: [self.store.remove(name) for name in released])
+        return self._report(len(released), sum(freed))
+
+    def is_owned(self, filename: str) -> bool:
+        """
+        Check whether a session displays a file.
+        """
+        return filename in self.owners
+
+    def release_session(self, session_id: str) -> None:
+        """
+        Drop the ownership of every file of a session that ended.
+        """
+        for filename in self.sessions.pop(session_id, {}):
+            self._disown(session_id, filename)
+
+    def owned_files(self, session_id: str) -> List[str]:
+        """
+        Get the files a session owns, oldest first.
+        """
+        return list(self.sessions.get(session_id, {}))
+
+    async def sweep(self) -> SweepReport:
+        """
+        Delete the files over the age and size quotas.
+        """
+        index = dict(await asyncio.to_thread(self.store.rescan))
+        now = time.time()
+        expired = {name for name, stored in index.items() if now - stored.modified > self.max_age}
+
+        # Over the size quota, delete unowned files before owned ones, oldest first
+        remaining = sum(stored.size for name, stored in index.items() if name not in expired)
+        if remaining > self.max_bytes:
+            candidates = sorted(
+                (name for name in index if name not in expired),
+                key=lambda name: (name in self.owners, index[name].modified))
+            for name in candidates:
+                if remaining <= self.max_bytes:
+                    break
+                expired.add(name)
+                remaining -= index[name].size
+
+        if not expired:
+            return SweepReport(0, 0)
+        freed = await asyncio.to_thread(lambda: [self.store.remove(name) for name in expired])
+        for name in expired:
+            for session_id in self.owners.pop(name, set()):
+                self.sessions.get(session_id, {}).pop(name, None)
+        return self._report(len(expired), sum(freed))
+
+    async def compact(self) -> SweepReport:
+        """
+        Clean up after previous runs: delete interrupted writes, then sweep.
+        """
+        stale = self._report(*await asyncio.to_thread(self._remove_stale_temp_files))
+        swept = await self.sweep()
+        return SweepReport(stale.files + swept.files, stale.bytes + swept.bytes)
+
+    def start(self) -> None:
+        """
+        Start the background sweeper, beginning with a compaction pass.
+        """
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """
+        Stop the background sweeper.
+        """
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def stats(self) -> Dict[str, int]:
+        """
+        Get the storage counters.
+        """
+        index = self.store.load()
+        return {
+            "files": len(index),
+            "bytes": sum(stored.size for stored in index.values()),
+            "owned_files": len(self.owners),
+            "sessions": len(self.sessions),
+            "reclaimed_files": self.reclaimed_files,
+            "reclaimed_bytes": self.reclaimed_bytes,
+        }
+
+    async def _run(self) -> None:
+        try:
+            report = await self.compact()
+            logging.info(f"Startup compaction reclaimed {report.files} files ({report.bytes} bytes)")
+        except Exception as e:
+            logging.error(f"Startup compaction failed: {str(e)}")
+        while True:
+            await asyncio.sleep(self.sweep_interval)
+            try:
+                report = await self.sweep()
+                if report.files:
+                    logging.info(f"Sweep reclaimed {report.files} files ({report.bytes} bytes)")
+            except Exception as e:
+                logging.error(f"Sweep failed: {str(e)}")
+
+    def _disown(self, session_id: str, filename: str) -> None:
+        owners = self.owners.get(filename)
+        if owners is not None:
+            owners.discard(session_id)
+            if not owners:
+                del self.owners[filename]
+
+    def _remove_stale_temp_files(self) -> SweepReport:
+        self.store.load()
+        files, freed = 0, 0
+        now = time.time()
+        for entry in os.scandir(self.store.files_dir):
+            if entry.name.startswith('.') and entry.name.endswith('.tmp') and entry.is_file():
+                stat = entry.stat()
+                if now - stat.st_mtime > STALE_TEMP_AGE:
+                    try:
+                        os.remove(entry.path)
+                    except OSError:
+                        continue
+                    files += 1
+                    freed += stat.st_size
+        return SweepReport(files, freed)
+
+    def _report(self, files: int, freed: int) -> SweepReport:
+        self.reclaimed_files += files
+        self.reclaimed_bytes += freed
+        return SweepReport(files, freed)
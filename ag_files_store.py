@@ -0,0 +1,182 @@
+import asyncio
+import logging
+import os
+import re
+import threading
+import time
+import uuid
+from typing import AsyncIterator, Dict, NamedTuple, Optional
+
+
+# Generated files are named in UUID format, which the chat UI looks for.
+RENDER_FILENAME_PATTERN = re.compile(
+    r'^[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}\.(png|jpg|jpeg|svg|pdf|gif)$')
+
+# Chunks are buffered up to this size before each write to the file.
+WRITE_BUFFER_SIZE = 64 * 1024
+
+
+async def iterate_chunks(data: bytes, chunk_size: int = WRITE_BUFFER_SIZE) -> AsyncIterator[bytes]:
+    """
+    Iterate over in-memory data in chunks, like a streamed response.
+    """
+    for start in range(0, len(data), chunk_size):
+        yield data[start:start + chunk_size]
+
+
+class StoredFile(NamedTuple):
+    size: int
+    modified: float
+
+
+class FilesStore:
+    """
+    Store of the generated files served to the chat UI.
+
+    Files are streamed to a temporary file and atomically renamed into place
+    with the blocking I/O running off the event loop. An in-memory index of
+    the known files answers lookups without touching the filesystem.
+
+    Each process has its own index of the directory. When several workers
+    share the directory, the files written or removed by the others are
+    only seen after a `rescan`.
+    """
+
+    def __init__(self, files_dir: str):
+        self.files_dir = files_dir
+        self.index: Dict[str, StoredFile] = {}
+        self._lock = threading.Lock()
+        self._loaded = False
+
+    def load(self) -> Dict[str, StoredFile]:
+        """
+        Index the files already on disk, oldest first, once per process.
+        """
+        with self._lock:
+            if not self._loaded:
+                self._loaded = True
+                self.index.update(self._scan())
+            return self.index
+
+    def rescan(self) -> Dict[str, StoredFile]:
+        """
+        Index the files on disk again, with the ones written and removed by
+        other processes sharing the directory.
+        """
+        started = time.time()
+        scanned = self._scan()
+        with self._lock:
+            self._loaded = True
+            # Files this process wrote while the directory was scanned
+            written = {name: stored for name, stored in self.index.items()
+                       if stored.modified >= started and name not in scanned}
+            self.index.clear()
+            self.index.update(scanned)
+            self.index.update(written)
+            return self.index
+
+    def _scan(self) -> Dict[str, StoredFile]:
+        os.makedirs(self.files_dir, exist_ok=True)
+        found = []
+        for entry in os.scandir(self.files_dir):
+            if entry.is_file() and RENDER_FILENAME_PATTERN.match(entry.name):
+                stat = entry.stat()
+                found.append((stat.st_mtime, entry.name, stat.st_size))
+        return {name: StoredFile(size, modified) for modified, name, size in sorted(found)}
+
+    def contains(self, filename: str) -> bool:
+        """
+        Check whether a file is known to the store.
+        """
+        return filename in self.load()
+
+    def path_for(self, filename: str) -> Optional[str]:
+        """
+        Get the path of a known file, or None if the store does not have it.
+        """
+        if filename in self.load():
+            return os.path.join(self.files_dir, filename)
+        return None
+
+    def size_of(self, filename: str) -> Optional[int]:
+        """
+        Get the size of a known file.
+        """
+        stored = self.load().get(filename)
+        return stored.size if stored else None
+
+    async def write(self, filename: str, data: bytes) -> int:
+        """
+        Write in-memory data to a file and return its size.
+        """
+        return await self.write_stream(filename, iterate_chunks(data))
+
+    async def write_stream(self, filename: str, chunks: AsyncIterator[bytes]) -> int:
+        """
+        Stream chunks to a temporary file, rename it into place and return its size.
+        """
+        self.load()
+        final_path = os.path.join(self.files_dir, filename)
+        # The leading dot keeps partial files out of the index and the UI.
+        temp_path = os.path.join(self.files_dir, f".{filename}.{uuid.uuid4().hex}.tmp")
+
+        file = await asyncio.to_thread(open, temp_path, 'wb')
+        size = 0
+        buffer = bytearray()
+        try:
+            async for chunk in chunks:
+                buffer.extend(chunk)
+                if len(buffer) >= WRITE_BUFFER_SIZE:
+                    await asyncio.to_thread(file.write, bytes(buffer))
+                    size += len(buffer)
+                    buffer.clear()
+            if buffer:
+                await asyncio.to_thread(file.write, bytes(buffer))
+                size += len(buffer)
+            await asyncio.to_thread(file.close)
+            await asyncio.to_thread(os.replace, temp_path, final_path)
+        except BaseException:
+            await asyncio.to_thread(self._discard_temp, file, temp_path)
+            raise
+        finally:
+            aclose = getattr(chunks, "aclose", None)
+            if aclose is not None:
+                await aclose()
+
+        with self._lock:
+            self.index.pop(filename, None)
+            self.index[filename] = StoredFile(size, time.time())
+        return size
+
+    def remove(self, filename: str) -> int:
+        """
+        Delete a file and return the number of bytes freed. Blocking, call it
+        off the event loop.
+        """
+        with self._lock:
+            stored = self.index.pop(filename, None)
+        try:
+            size = stored.size if stored else os.path.getsize(
+                os.path.join(self.files_dir, filename))
+            os.remove(os.path.join(self.files_dir, filename))
+        except FileNotFoundError:
+            return 0
+        except OSError as e:
+            logging.warning(f"Could not remove file {filename}: {str(e)}")
+            return 0
+        return size
+
+    def forget(self, filename: str) -> None:
+        """
+        Drop a file from the index without deleting it.
+        """
+        with self._lock:
+            self.index.pop(filename, None)
+
+    @staticmethod
+    def _discard_temp(file, temp_path: str) -> None:
+        file.close()
+        try:
+            os.remove(temp_path)
+        except OSError:
+            pass
@@ -0,0 +1,134 @@
+import os
+import re
+from typing import List, Optional
+from autogen_core.model_context import ChatCompletionContext
+from autogen_core.models import FunctionExecutionResultMessage, LLMMessage, UserMessage
+
+
+# Opt-in switch of the compacted model contexts.
+HISTORY_COMPACTION_ENABLED = os.getenv("HISTORY_COMPACTION_ENABLED", "false").lower() in ("1", "true", "yes")
+
+# Default token budget of the history an agent sends to its model.
+HISTORY_TOKEN_BUDGET = int(os.getenv("HISTORY_TOKEN_BUDGET", 4000))
+
+# Part of the budget given to the summary of the older turns.
+HISTORY_SUMMARY_BUDGET = int(os.getenv("HISTORY_SUMMARY_BUDGET", 600))
+
+# Emoji, markdown markers and other symbols, dropped from the summaries.
+SYMBOL_PATTERN = re.compile(r'[^\w\s.,:;!?()\'"/%+-]')
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Estimate the number of tokens of a text without a tokenizer.
+
+    Plain text averages four characters per token, while emoji and other
+    non-ASCII symbols take about one token each.
+    """
+    ascii_length = len(text.encode('ascii', 'ignore'))
+    return (ascii_length + 3) // 4 + len(text) - ascii_length
+
+
+def message_text(message: LLMMessage) -> str:
+    """
+    Get the text of a message, including function calls and their results.
+    """
+    content = message.content
+    if isinstance(content, str):
+        return content
+    parts = []
+    for item in content:
+        if isinstance(item, str):
+            parts.append(item)
+        elif hasattr(item, "arguments"):
+            parts.append(f"{item.name}({item.arguments})")
+        elif hasattr(item, "content"):
+            parts.append(str(item.content))
+    return "\n".join(parts)
+
+
+class CompactChatCompletionContext(ChatCompletionContext):
+    """
+    Model context sending a compact view of the conversation to the model.
+
+    The full history is kept. When it exceeds `token_budget`, the model is
+    sent the most recent messages that fit, preceded by an extractive
+    summary of the older ones of at most `summary_budget` tokens: the source
+    and the opening of each message, without emoji and markdown. Summary
+    lines and token counts are computed once per message.
+    """
+
+    def __init__(self,
+                 token_budget: int = HISTORY_TOKEN_BUDGET,
+                 summary_budget: int = HISTORY_SUMMARY_BUDGET,
+                 summary_chars: int = 240,
+                 initial_messages: Optional[List[LLMMessage]] = None):
+        super().__init__(initial_messages)
+        self.token_budget = token_budget
+        self.summary_budget = min(summary_budget, token_budget // 2)
+        self.summary_chars = summary_chars
+        self._tokens: List[int] = []
+        self._summary_lines: List[str] = []
+        self.compactions = 0
+        self.saved_tokens = 0
+
+    async def get_messages(self) -> List[LLMMessage]:
+        messages = self._messages
+        while len(self._tokens) < len(messages):
+            self._tokens.append(estimate_tokens(message_text(messages[len(self._tokens)])))
+        total = sum(self._tokens)
+        if total <= self.token_budget:
+            return list(messages)
+
+        # Keep the most recent messages that fit next to the summary
+        recent_budget = self.token_budget - self.summary_budget
+        cut = len(messages) - 1
+        used = self._tokens[cut]
+        while cut > 0 and used + self._tokens[cut - 1] <= recent_budget:
+            cut -= 1
+            used += self._tokens[cut]
+        # A function result is never separated from its call
+        while cut > 0 and isinstance(messages[cut], FunctionExecutionResultMessage):
+            cut -= 1
+            used += self._tokens[cut]
+        if cut == 0:
+            return list(messages)
+
+        summary = self._summary(cut)
+        self.compactions += 1
+        self.saved_tokens += total - used - estimate_tokens(summary)
+        return [UserMessage(content=summary, source="history"), *messages[cut:]]
+
+    async def clear(self) -> None:
+        await super().clear()
+        self._tokens = []
+        self._summary_lines = []
+
+    def _summary(self, cut: int) -> str:
+        while len(self._summary_lines) < cut:
+            message = self._messages[len(self._summary_lines)]
+            text = re.sub(r'\s+', ' ', SYMBOL_PATTERN.sub('', message_text(message))).strip()
+            if len(text) > self.summary_chars:
+                text = text[:self.summary_chars].rsplit(' ', 1)[0] + " ..."
+            source = getattr(message, "source", None) or type(message).__name__
+            self._summary_lines.append(f"- {source}: {text}")
+
+        # The newest lines that fit in the summary budget
+        header = "Summary of the earlier conversation:"
+        lines: List[str] = []
+        used = estimate_tokens(header)
+        for line in reversed(self._summary_lines[:cut]):
+            used += estimate_tokens(line) + 1
+            if used > self.summary_budget:
+                break
+            lines.append(line)
+        return "\n".join([header, *reversed(lines)])
+
+
+def create_model_context(token_budget: Optional[int] = None) -> Optional[ChatCompletionContext]:
+    """
+    Create the model context of an agent, compacted when history compaction is enabled.
+    """
+    if not HISTORY_COMPACTION_ENABLED:
+        return None
+    return CompactChatCompletionContext(token_budget or HISTORY_TOKEN_BUDGET)
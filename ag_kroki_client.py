@@ -0,0 +1,152 @@
+import asyncio
+import logging
+import os
+from typing import AsyncIterator, Optional
+import httpx
+from ag_telemetry import traced
+
+
+# Status codes worth retrying, every other error is returned to the caller.
+RETRY_STATUS_CODES = {429, 502, 503, 504}
+
+
+class KrokiClient:
+    """
+    Shared async client for the Kroki API.
+
+    Keeps a keep-alive connection pool, bounds the number of renders in flight
+    and retries transient failures with exponential backoff.
+    """
+
+    def __init__(self,
+                 base_url: str = "https://kroki.io",
+                 timeout: float = 20.0,
+                 max_connections: int = 10,
+                 max_concurrency: int = 8,
+                 retries: int = 2,
+                 backoff: float = 0.5):
+        self.base_url = base_url.rstrip("/")
+        self.retries = retries
+        self.backoff = backoff
+        self.client = httpx.AsyncClient(
+            base_url=self.base_url,
+            timeout=httpx.Timeout(timeout, connect=min(timeout, 5.0)),
+            limits=httpx.Limits(max_connections=max_connections,
+                                max_keepalive_connections=max_connections),
+        )
+        self.semaphore = asyncio.Semaphore(max_concurrency)
+
+    async def render(self,
+                     diagram_code: str,
+                     diagram_type: str = 'mermaid',
+                     output_format: str = 'png') -> bytes:
+        """
+        Render the diagram code and return the image data.
+        """
+        return await self.request(
+            "POST", f"/{diagram_type}/{output_format}", content=diagram_code.encode('utf-8'))
+
+    async def request(self, method: str, path: str, content: Optional[bytes] = None) -> bytes:
+        """
+        Send a request to Kroki, retrying transient failures, and return the body.
+        """
+        response = await self.open_stream(method, path, content)
+        try:
+            return await response.aread()
+        finally:
+            await response.aclose()
+
+    async def stream(self,
+                     diagram_code: str,
+                     diagram_type: str = 'mermaid',
+                     output_format: str = 'png') -> AsyncIterator[bytes]:
+        """
+        Render the diagram code and return an iterator over the image data chunks.
+        """
+        response = await self.open_stream(
+            "POST", f"/{diagram_type}/{output_format}", content=diagram_code.encode('utf-8'))
+        return iterate_response(response)
+
+    @traced("kroki.request")
+    async def open_stream(self,
+                          method: str,
+                          path: str,
+                          content: Optional[bytes] = None) -> httpx.Response:
+        """
+        Send a request to Kroki, retrying transient failures, and return the
+        successful response with its body not read yet.
+        """
+        async with self.semaphore:
+            for attempt in range(self.retries + 1):
+                try:
+                    request = self.client.build_request(method, path, content=content)
+                    response = await self.client.send(request, stream=True)
+                    if response.status_code not in RETRY_STATUS_CODES or attempt == self.retries:
+                        if response.is_error:
+                            await response.aread()
+                            await response.aclose()
+                            response.raise_for_status()
+                        return response
+                    await response.aclose()
+                    logging.warning(
+                        f"Kroki returned {response.status_code}, retrying ({attempt + 1}/{self.retries})")
+                except httpx.TransportError as e:
+                    if attempt == self.retries:
+                        raise
+                    logging.warning(
+                        f"Kroki request failed: {str(e)}, retrying ({attempt + 1}/{self.retries})")
+                await asyncio.sleep(self.backoff * 2 ** attempt)
+
+    async def aclose(self) -> None:
+        """
+        Close the connection pool.
+        """
+        await self.client.aclose()
+
+
+async def iterate_response(response: httpx.Response) -> AsyncIterator[bytes]:
+    """
+    Iterate over the body of a streamed response and close it when done.
+    """
+    try:
+        async for chunk in response.aiter_bytes():
+            yield chunk
+    finally:
+        await response.aclose()
+
+
+_kroki_client: Optional[KrokiClient] = None
+
+
+def get_kroki_client() -> KrokiClient:
+    """
+    Get the process-wide Kroki client, creating it on first use.
+    """
+    global _kroki_client
+    if _kroki_client is None:
+        _kroki_client = KrokiClient(
+            base_url=os.getenv("KROKI_URL", "https://kroki.io"),
+            timeout=float(os.getenv("KROKI_TIMEOUT", 20.0)),
+            max_connections=int(os.getenv("KROKI_MAX_CONNECTIONS", 10)),
+            max_concurrency=int(os.getenv("KROKI_MAX_CONCURRENCY", 8)),
+            retries=int(os.getenv("KROKI_RETRIES", 2)),
+        )
+    return _kroki_client
+
+
+def set_kroki_client(client: Optional[KrokiClient]) -> None:
+    """
+    Replace the process-wide Kroki client, e.g. with one pointing at a stub server.
+    """
+    global _kroki_client
+    _kroki_client = client
+
+
+async def close_kroki_client() -> None:
+    """
+    Close the process-wide Kroki client.
+    """
+    global _kroki_client
+    if _kroki_client is not None:
+        await _kroki_client.aclose()
+        _kroki_client = None
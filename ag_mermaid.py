@@ -0,0 +1,385 @@
+import re
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+
+HEADER_PATTERN = re.compile(r'(flowchart|graph)\b[ \t]*(TD|TB|BT|LR|RL)?\b[ \t]*;?', re.IGNORECASE)
+KEYWORD_PATTERN = re.compile(r'(style|classDef|class|linkStyle|click|subgraph|end|direction)\b')
+ID_PATTERN = re.compile(r'\w+')
+CLASS_PATTERN = re.compile(r':::[\w-]+')
+# Arrowheads: an arrow, or a circle or cross that is not the start of a node id
+LINK_PATTERN = re.compile(
+    r'(?:<|[ox](?=[-=]))?(?:-\.+-(?:>|[ox](?!\w))?|-{2,}(?:>|[ox](?!\w))|-{3,}|={2,}(?:>|[ox](?!\w))|={3,}|~{3,})')
+TEXT_LINK_PATTERN = re.compile(
+    r'(?P<open>--|==|-\.)(?![-=>.])\s*(?P<text>"(?:[^"\\]|\\.)*"|[^"|]*?)\s*'
+    r'(?P<close>-{2,}(?:>|[ox](?!\w))|-{3,}|={2,}(?:>|[ox](?!\w))|={3,}|\.+->|\.+-)')
+QUOTED_PATTERN = re.compile(r'"(?:[^"\\]|\\.)*"')
+EDGE_LABEL_PATTERN = re.compile(
+    r'[ \t]*\|[ \t]*(?:(?P<quoted>"(?:[^"\\]|\\.)*")|(?P<label>[^|]*?))[ \t]*\|')
+# Parallelogram and trapezoid nodes, kept as written: A[/text/], A[\text\], A[/text\] and A[\text/]
+SLANTED_PATTERN = re.compile(r'\[(?P<open>[/\\])(?P<label>"(?:[^"\\]|\\.)*"|[^"\]]*?)(?P<close>[/\\])\]')
+
+# Node shapes by opening delimiter, longest first.
+SHAPES: Tuple[Tuple[str, str, str], ...] = (
+    ('((', '))', 'circle'),
+    ('([', '])', 'stadium'),
+    ('[(', ')]', 'cylinder'),
+    ('[[', ']]', 'subroutine'),
+    ('{{', '}}', 'hexagon'),
+    ('[', ']', 'rect'),
+    ('(', ')', 'round'),
+    ('{', '}', 'rhombus'),
+    ('>', ']', 'asymmetric'),
+)
+SLANTED_SHAPES = {
+    ('/', '/'): 'lean_right',
+    ('\\', '\\'): 'lean_left',
+    ('/', '\\'): 'trapezoid',
+    ('\\', '/'): 'inv_trapezoid',
+}
+OPENING_BRACKETS = '([{'
+CLOSING_BRACKETS = ')]}'
+
+# Words Mermaid reads as keywords wherever a node id is expected.
+RESERVED_IDS = ('end',)
+
+
+class Node(NamedTuple):
+    id: str
+    label: str
+    shape: str
+
+
+class Edge(NamedTuple):
+    source: str
+    target: str
+    link: str
+    label: str
+
+
+class MermaidError(NamedTuple):
+    line: int
+    column: int
+    message: str
+
+    def __str__(self) -> str:
+        return f"Line {self.line}, column {self.column}: {self.message}"
+
+
+class MermaidSyntaxError(ValueError):
+    """
+    Invalid Mermaid code, with every error found.
+    """
+
+    def __init__(self, errors: List[MermaidError]):
+        self.errors = errors
+        super().__init__("; ".join(str(error) for error in errors))
+
+
+class Flowchart:
+    """
+    A parsed flowchart: its nodes, edges and normalized statements.
+    """
+
+    def __init__(self):
+        self.direction: Optional[str] = None
+        self.directives: List[str] = []
+        self.nodes: Dict[str, Node] = {}
+        self.edges: List[Edge] = []
+        self.statements: List[str] = []
+        self.errors: List[MermaidError] = []
+
+    @property
+    def valid(self) -> bool:
+        return self.direction is not None and not self.errors
+
+    def to_code(self) -> str:
+        """
+        Get the normalized code of the flowchart, one statement per line with quoted labels.
+        """
+        lines = self.directives + [f"flowchart {self.direction or 'TD'}"]
+        lines.extend(f"    {statement}" for statement in self.statements)
+        return "\n".join(lines)
+
+
+class FlowchartParser:
+    """
+    Line by line parser of the flowchart subset of Mermaid.
+
+    Lines can be fed as they are streamed; each call only parses the new
+    line. Statements end at a line break, a semicolon or, as Mermaid allows,
+    at whitespace followed by the next node.
+    """
+
+    def __init__(self):
+        self.flowchart = Flowchart()
+        self.stopped = False
+
+    def parse_line(self, line: str, number: int) -> List[MermaidError]:
+        """
+        Parse one line and get the errors it has.
+        """
+        if self.stopped:
+            return []
+        errors: List[MermaidError] = []
+        stripped = line.strip()
+        if not stripped:
+            return errors
+        if stripped.startswith('%%'):
+            # Directives are kept, comments dropped
+            if stripped.startswith('%%{') and self.flowchart.direction is None:
+                self.flowchart.directives.append(stripped)
+            return errors
+
+        position = len(line) - len(line.lstrip())
+        if self.flowchart.direction is None:
+            header = HEADER_PATTERN.match(line, position)
+            if not header:
+                errors.append(MermaidError(number, position + 1, "expected a flowchart or graph header"))
+                self.stopped = True
+                self.flowchart.errors.extend(errors)
+                return errors
+            self.flowchart.direction = (header.group(2) or 'TD').upper()
+            position = header.end()
+
+        keyword = KEYWORD_PATTERN.match(line, position)
+        if keyword:
+            # Styling, subgraphs and the like are kept as written
+            self.flowchart.statements.append(line[position:].strip().rstrip(';'))
+            return errors
+
+        while True:
+            position = skip(line, position, ' \t;')
+            if position >= len(line):
+                break
+            try:
+                position = self._parse_chain(line, position)
+            except SyntaxPosition as e:
+                errors.append(MermaidError(number, e.position + 1, e.message))
+                break
+        self.flowchart.errors.extend(errors)
+        return errors
+
+    def finish(self) -> Flowchart:
+        """
+        Get the parsed flowchart once every line has been fed.
+        """
+        if self.flowchart.direction is None and not self.stopped:
+            self.flowchart.errors.append(MermaidError(1, 1, "expected a flowchart or graph header"))
+        return self.flowchart
+
+    def _parse_chain(self, line: str, position: int) -> int:
+        # Nodes followed by any number of links to other nodes, A & B --> C links both to C
+        sources, text, position = self._parse_nodes(line, position)
+        parts = [text]
+        while True:
+            link_start = skip(line, position, ' \t')
+            if link_start >= len(line) or line[link_start] == ';':
+                break
+            link, label, link_end = self._parse_link(line, link_start)
+            if link is None:
+                if ID_PATTERN.match(line, link_start) and link_start > position:
+                    # Whitespace before the next node ends the statement
+                    position = link_start
+                    break
+                raise SyntaxPosition(link_start, f"unexpected '{line[link_start:].strip()}'")
+            targets, text, position = self._parse_nodes(line, skip(line, link_end, ' \t'))
+            self.flowchart.edges.extend(Edge(source, target, link, label)
+                                        for source in sources for target in targets)
+            parts.append(f"{link}|{quote_label(label)}| {text}" if label else f"{link} {text}")
+            sources = targets
+        self.flowchart.statements.append(" ".join(parts))
+        return position
+
+    def _parse_nodes(self, line: str, position: int) -> Tuple[List[str], str, int]:
+        # Nodes joined with '&'
+        node_id, text, position = self._parse_node(line, position)
+        node_ids, texts = [node_id], [text]
+        while True:
+            ampersand = skip(line, position, ' \t')
+            if ampersand >= len(line) or line[ampersand] != '&':
+                return node_ids, " & ".join(texts), position
+            node_id, text, position = self._parse_node(line, skip(line, ampersand + 1, ' \t'))
+            node_ids.append(node_id)
+            texts.append(text)
+
+    def _parse_node(self, line: str, position: int) -> Tuple[str, str, int]:
+        match = ID_PATTERN.match(line, position)
+        if not match:
+            raise SyntaxPosition(position, "expected a node id")
+        node_id = match.group(0)
+        if node_id in RESERVED_IDS:
+            raise SyntaxPosition(position, f"'{node_id}' is a keyword and cannot be a node id")
+        position = match.end()
+        text = node_id
+        slanted = SLANTED_PATTERN.match(line, position)
+        if slanted:
+            # Quoting the label would turn the slanted sides into a rectangle
+            shape = SLANTED_SHAPES[slanted.group('open'), slanted.group('close')]
+            self.flowchart.nodes[node_id] = Node(node_id, unquote(slanted.group('label').strip()), shape)
+            text += slanted.group(0)
+            position = slanted.end()
+        else:
+            for opening, closing, shape in SHAPES:
+                if line.startswith(opening, position):
+                    label, position = self._parse_label(line, position + len(opening), closing)
+                    self.flowchart.nodes[node_id] = Node(node_id, label, shape)
+                    text += f"{opening}{quote_label(label)}{closing}"
+                    break
+            else:
+                if node_id not in self.flowchart.nodes:
+                    self.flowchart.nodes[node_id] = Node(node_id, node_id, 'rect')
+        suffix = CLASS_PATTERN.match(line, position)
+        if suffix:
+            text += suffix.group(0)
+            position = suffix.end()
+        return node_id, text, position
+
+    @staticmethod
+    def _parse_label(line: str, position: int, closing: str) -> Tuple[str, int]:
+        start = skip(line, position, ' \t')
+        if start < len(line) and line[start] == '"':
+            quoted = QUOTED_PATTERN.match(line, start)
+            if not quoted:
+                raise SyntaxPosition(start, "unterminated quoted label")
+            after = skip(line, quoted.end(), ' \t')
+            if not line.startswith(closing, after):
+                raise SyntaxPosition(after, f"expected '{closing}' after the label")
+            return unquote(quoted.group(0)), after + len(closing)
+
+        # Unquoted labels may hold balanced brackets, they are quoted when normalized
+        depth = 0
+        index = position
+        while index < len(line):
+            if depth == 0 and line.startswith(closing, index):
+                label = line[position:index].strip()
+                if not label:
+                    raise SyntaxPosition(index, "empty label")
+                return label, index + len(closing)
+            character = line[index]
+            if character in OPENING_BRACKETS:
+                depth += 1
+            elif character in CLOSING_BRACKETS:
+                depth = max(depth - 1, 0)
+            index += 1
+        raise SyntaxPosition(position, f"missing '{closing}' to close the label")
+
+    @staticmethod
+    def _parse_link(line: str, position: int) -> Tuple[Optional[str], str, int]:
+        text_link = TEXT_LINK_PATTERN.match(line, position)
+        if text_link:
+            close = text_link.group('close')
+            head = close[-1] if close[-1] in '>ox' else ''
+            if text_link.group('open') == '-.':
+                link = '-.->' if head == '>' else '-.-'
+            elif text_link.group('open') == '==':
+                link = '==' + head if head else '==='
+            else:
+                link = '--' + head if head else '---'
+            return link, unquote(text_link.group('text').strip()), text_link.end()
+        link = LINK_PATTERN.match(line, position)
+        if not link:
+            return None, "", position
+        position = link.end()
+        label = EDGE_LABEL_PATTERN.match(line, position)
+        if label:
+            return link.group(0), unquote(label.group('quoted') or label.group('label') or '').strip(), label.end()
+        return link.group(0), "", position
+
+
+class SyntaxPosition(Exception):
+    def __init__(self, position: int, message: str):
+        super().__init__(message)
+        self.position = position
+        self.message = message
+
+
+class IncrementalMermaidValidator:
+    """
+    Validate flowchart code while it is streamed, parsing each line once it is complete.
+    """
+
+    def __init__(self):
+        self.parser = FlowchartParser()
+        self.buffer = ""
+        self.lines = 0
+
+    def feed(self, chunk: str) -> List[MermaidError]:
+        """
+        Add a chunk of code and get the errors of the lines it completes.
+        """
+        self.buffer += chunk
+        *complete, self.buffer = self.buffer.split("\n")
+        errors: List[MermaidError] = []
+        for line in complete:
+            self.lines += 1
+            errors.extend(self.parser.parse_line(line, self.lines))
+        return errors
+
+    def close(self) -> Flowchart:
+        """
+        Parse the last line and get the flowchart.
+        """
+        if self.buffer:
+            self.lines += 1
+            self.parser.parse_line(self.buffer, self.lines)
+            self.buffer = ""
+        return self.parser.finish()
+
+
+def skip(line: str, position: int, characters: str) -> int:
+    while position < len(line) and line[position] in characters:
+        position += 1
+    return position
+
+
+def unquote(label: str) -> str:
+    """
+    Get the text of a label, without its quotes and with its escaped quotes resolved.
+    """
+    if len(label) >= 2 and label[0] == label[-1] == '"':
+        return re.sub(r'\\(.)', r'\1', label[1:-1])
+    return label
+
+
+def quote_label(label: str) -> str:
+    """
+    Quote a label so that Mermaid reads any character in it as text.
+    """
+    label = re.sub(r'\s+', ' ', label).strip()
+    return '"' + label.replace('"', "'").replace('|', '/') + '"'
+
+
+def is_flowchart(diagram_code: str) -> bool:
+    """
+    Check whether Mermaid code is a flowchart, the subset the parser handles.
+    """
+    for line in diagram_code.splitlines():
+        line = line.strip()
+        if line and not line.startswith('%%'):
+            return HEADER_PATTERN.match(line) is not None
+    return False
+
+
+def parse_mermaid(diagram_code: str) -> Flowchart:
+    """
+    Parse flowchart code, collecting every error instead of stopping at the first one.
+    """
+    if "\n" not in diagram_code and "\\n" in diagram_code:
+        # Code passed on a single line with escaped line breaks
+        diagram_code = diagram_code.replace("\\n", "\n")
+    parser = FlowchartParser()
+    for number, line in enumerate(diagram_code.splitlines(), start=1):
+        parser.parse_line(line, number)
+    return parser.finish()
+
+
+def normalize_mermaid(diagram_code: str) -> str:
+    """
+    Validate flowchart code and get its normalized form.
+
+    Raises a MermaidSyntaxError listing every error found.
+    """
+    flowchart = parse_mermaid(diagram_code)
+    if flowchart.errors:
+        raise MermaidSyntaxError(flowchart.errors)
+    return flowchart.to_code()
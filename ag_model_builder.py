@@ -1,4 +1,8 @@
 import os
+import asyncio
+import logging
+import time
+from typing import Dict, List, Optional, Tuple
 from autogen_ext.models.azure import AzureAIChatCompletionClient
 from azure.core.credentials import AzureKeyCredential
 from azure.ai.inference import EmbeddingsClient
@@ -39,4 +43,178 @@ def create_embeddings_client(
         model=model_name,
         endpoint=os.getenv("AZURE_OPENAI_ENDPOINT"),
         credential=AzureKeyCredential(os.getenv("GITHUB_TOKEN"))
-)
\ No newline at end of file
+)
+
+
+# Seconds a pooled model client stays open after its last session released it.
+MODEL_CLIENT_IDLE_TIMEOUT = float(os.getenv("MODEL_CLIENT_IDLE_TIMEOUT", 600))
+
+# Key of a pooled client: the model name and its capabilities.
+ModelClientKey = Tuple[str, bool, bool, bool, bool, str]
+
+
+class ModelClientPool:
+    """
+    Process-wide pool of model clients keyed by model name and capabilities.
+
+    Agents of every session share the same clients and their HTTP connection
+    pools. Clients are reference counted; idle clients stay warm for
+    `idle_timeout` seconds, then the background reaper closes them.
+    """
+
+    def __init__(self, idle_timeout: float = MODEL_CLIENT_IDLE_TIMEOUT):
+        self.idle_timeout = idle_timeout
+        self.clients: Dict[ModelClientKey, AzureAIChatCompletionClient] = {}
+        self.refcounts: Dict[ModelClientKey, int] = {}
+        # When each client without references was released last
+        self.idle_since: Dict[ModelClientKey, float] = {}
+        self.created = 0
+        self.closed = 0
+        self._task: Optional[asyncio.Task] = None
+
+    def acquire(self,
+                model_name: str,
+                json_output: bool = False,
+                function_calling: bool = False,
+                structured_output: bool = False,
+                vision: bool = False,
+                model_family: str = "text"
+                ) -> AzureAIChatCompletionClient:
+        """
+        Get a shared client for the model, creating it on first use.
+        """
+        key = (model_name, json_output, function_calling, structured_output, vision, model_family)
+        client = self.clients.get(key)
+        if client is None:
+            client = create_model_client(*key)
+            self.clients[key] = client
+            self.refcounts[key] = 0
+            self.created += 1
+        self.refcounts[key] += 1
+        self.idle_since.pop(key, None)
+        return client
+
+    def release(self, client: AzureAIChatCompletionClient) -> None:
+        """
+        Give back a client obtained from `acquire`.
+        """
+        for key, pooled in self.clients.items():
+            if pooled is client:
+                if self.refcounts[key] > 0:
+                    self.refcounts[key] -= 1
+                    if self.refcounts[key] == 0:
+                        self.idle_since[key] = time.monotonic()
+                return
+        logging.warning("Released a model client that is not in the pool")
+
+    def lease(self) -> "ModelClientLease":
+        """
+        Start a lease that tracks the clients acquired for one chat session.
+        """
+        return ModelClientLease(self)
+
+    def live_count(self) -> int:
+        """
+        Get the number of open clients.
+        """
+        return len(self.clients)
+
+    def stats(self) -> Dict[str, int]:
+        """
+        Get the pool counters.
+        """
+        return {
+            "live": len(self.clients),
+            "in_use": sum(1 for count in self.refcounts.values() if count > 0),
+            "references": sum(self.refcounts.values()),
+            "created": self.created,
+            "closed": self.closed,
+        }
+
+    async def close_idle(self, max_idle: float = 0.0) -> int:
+        """
+        Close the clients no one held for `max_idle` seconds and return how
+        many were closed.
+        """
+        now = time.monotonic()
+        idle = [key for key, count in self.refcounts.items()
+                if count == 0 and now - self.idle_since.get(key, now) >= max_idle]
+        await self._close(idle)
+        return len(idle)
+
+    async def close_all(self) -> None:
+        """
+        Close every client, e.g. on shutdown.
+        """
+        await self._close(list(self.clients))
+
+    def start(self) -> None:
+        """
+        Start the background reaper of the idle clients.
+        """
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """
+        Stop the background reaper.
+        """
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self) -> None:
+        # Checking twice per timeout closes a client at most 1.5 timeouts after its release.
+        while True:
+            await asyncio.sleep(max(self.idle_timeout / 2, 1.0))
+            try:
+                closed = await self.close_idle(self.idle_timeout)
+                if closed:
+                    logging.info(f"Closed {closed} idle model clients")
+            except Exception as e:
+                logging.error(f"Closing idle model clients failed: {str(e)}")
+
+    async def _close(self, keys: List[ModelClientKey]) -> None:
+        clients = [self.clients.pop(key) for key in keys]
+        for key in keys:
+            del self.refcounts[key]
+            self.idle_since.pop(key, None)
+        self.closed += len(clients)
+        results = await asyncio.gather(*(client.close() for client in clients), return_exceptions=True)
+        for result in results:
+            if isinstance(result, Exception):
+                logging.warning(f"Error closing model client: {str(result)}")
+
+
+class ModelClientLease:
+    """
+    The pooled clients acquired for one chat session, released together.
+    """
+
+    def __init__(self, pool: ModelClientPool):
+        self.pool = pool
+        self.clients: List[AzureAIChatCompletionClient] = []
+
+    def acquire(self, model_name: str, **capabilities) -> AzureAIChatCompletionClient:
+        """
+        Get a shared client for the model and remember it for release.
+        """
+        client = self.pool.acquire(model_name, **capabilities)
+        self.clients.append(client)
+        return client
+
+    def release(self) -> None:
+        """
+        Give back every client acquired by the lease.
+        """
+        for client in self.clients:
+            self.pool.release(client)
+        self.clients = []
+
+
+# Pool shared by all sessions of the process.
+model_client_pool = ModelClientPool()
@@ -1,14 +1,25 @@
-from typing import List, cast, Optional, Dict
-import re
+from typing import AsyncGenerator, List, cast, Optional, Dict
+import asyncio
 import os
+import re
 import chainlit as cl
-from autogen_agentchat.base import TaskResult
-from autogen_agentchat.conditions import TextMentionTermination, MaxMessageTermination, TimeoutTermination
-from autogen_agentchat.messages import ModelClientStreamingChunkEvent, TextMessage
+from autogen_agentchat.base import TaskResult, Team
+from autogen_agentchat.conditions import ExternalTermination, TextMentionTermination, MaxMessageTermination, TimeoutTermination
+from autogen_agentchat.messages import BaseChatMessage, ModelClientStreamingChunkEvent, SelectSpeakerEvent, TextMessage
 from autogen_agentchat.teams import RoundRobinGroupChat, SelectorGroupChat
 from autogen_core import CancellationToken
-from ag_agents_builder import get_participants
-from ag_model_builder import create_model_client
+from ag_agent_graph import AgentGraphTeam
+from ag_agents_builder import create_diagram_speculator, get_graph_nodes, get_participants, user_action_func
+from ag_diagram_speculation import SPECULATIVE_DIAGRAMS_ENABLED, DiagramSpeculator
+from ag_history import create_model_context
+from ag_model_builder import ModelClientLease, model_client_pool
+from ag_kroki_client import close_kroki_client
+from ag_semantic_cache import ArchitectureSession, CachedArchitecture, get_semantic_cache
+from ag_telemetry import TELEMETRY_ENABLED, TurnTracker, get_telemetry
+from ag_tools_builder import files_manager, files_store
+from ag_watchdog import get_loop_watchdog
+from session_store import get_session_store, session_key
+from vectordb_retriever import GUIDANCE_RETRIEVAL_ENABLED, warm_up_guidance
 
 
 # OAuth callback for authentication
@@ -29,30 +40,15 @@ async def oauth_callback(
     default_user.metadata["office_location"] = raw_user_data["officeLocation"]
     return default_user
 
-# Function to handle chat start event
-# This function is called when a new chat session starts.
-@cl.on_chat_start  # type: ignore
-async def start_chat() -> None:
-    # Termination condition.
-    text_mention_termination = TextMentionTermination("TERMINATE")
-    max_messages_termination = MaxMessageTermination(max_messages=25)
-    timeout_termination = TimeoutTermination(
-        timeout_seconds=60 * 5)  # 5 minutes timeout
-    termination = text_mention_termination | max_messages_termination | timeout_termination
 
-    # Chain the assistant, critic and user agents using RoundRobinGroupChat.
-    group_chat = RoundRobinGroupChat(
-        participants=get_participants(),
-        max_turns=6,
-        termination_condition=termination)
+# Team strategy used for new sessions: "round_robin", "selector" or "graph".
+TEAM_STRATEGY = os.getenv("TEAM_STRATEGY", "round_robin")
+
+# Token budget of the history in the selector prompt, when history compaction is enabled.
+SELECTOR_HISTORY_BUDGET = int(os.getenv("SELECTOR_HISTORY_BUDGET", 2000))
 
-    selector_group_chat = SelectorGroupChat(
-        participants=get_participants(),
-        model_client=create_model_client("gpt-4o-mini"),
-        termination_condition=termination,
-        allow_repeated_speaker=True,
-        max_selector_attempts=3,
-        selector_prompt="""
+# Prompt used by the selector team to pick the next speaker.
+SELECTOR_PROMPT = """
         You are in a role play game. The final goal is to create a high-level architecture 
         using the best practices from the Azure Architecture Center and the Cloud Adoption Framework.
         Initially the user provides a message with the architecture requirements.
@@ -77,12 +73,150 @@ async def start_chat() -> None:
         Read the above conversation, then select an agent from {participants} to perform the next task.
         When the task is complete, let the user approve or disapprove the task.
         """
-    )
 
-    # Set the assistant agent in the user session.
+
+def create_team(lease: ModelClientLease,
+                external_termination: ExternalTermination,
+                speculator: Optional[DiagramSpeculator] = None) -> Team:
+    """Create the team of the session using the configured strategy."""
+    # Termination condition.
+    text_mention_termination = TextMentionTermination("TERMINATE")
+    max_messages_termination = MaxMessageTermination(max_messages=25)
+    timeout_termination = TimeoutTermination(
+        timeout_seconds=60 * 5)  # 5 minutes timeout
+    termination = (text_mention_termination | max_messages_termination | timeout_termination
+                   | external_termination)
+
+    if TEAM_STRATEGY == "selector":
+        return SelectorGroupChat(
+            participants=get_participants(lease, speculator),
+            model_client=lease.acquire("gpt-4o-mini"),
+            termination_condition=termination,
+            allow_repeated_speaker=True,
+            max_selector_attempts=3,
+            selector_prompt=SELECTOR_PROMPT,
+            # The speaker is picked from the recent turns, not the full transcript
+            model_context=create_model_context(SELECTOR_HISTORY_BUDGET),
+            # The speaker selections are recorded by the telemetry
+            emit_team_events=TELEMETRY_ENABLED,
+        )
+
+    if TEAM_STRATEGY == "graph":
+        # Run the reviews and the diagram concurrently once the architect has answered.
+        return AgentGraphTeam(
+            nodes=get_graph_nodes(lease, speculator),
+            termination_condition=termination)
+
+    if TEAM_STRATEGY != "round_robin":
+        raise ValueError(f"Unknown team strategy: {TEAM_STRATEGY}")
+
+    # Chain the assistant, critic and user agents using RoundRobinGroupChat.
+    # A run is one round, the number of agents depends on the diagram mode.
+    participants = get_participants(lease, speculator)
+    return RoundRobinGroupChat(
+        participants=participants,
+        max_turns=len(participants),
+        termination_condition=termination)
+
+
+async def get_team() -> Team:
+    """Get the team of the session, creating it on first use.
+
+    A session started on another worker, or before a restart, resumes from
+    the state saved in the session store.
+    """
+    team = cl.user_session.get("team")  # type: ignore
+    if team is None:
+        # Model clients of the session, shared with other sessions through the pool.
+        lease = model_client_pool.lease()
+        # Lets the chat handler stop the team between two turns.
+        external_termination = ExternalTermination()
+        # Drafts the diagram while the architect is streaming.
+        speculator = create_diagram_speculator(lease) if SPECULATIVE_DIAGRAMS_ENABLED else None
+        team = create_team(lease, external_termination, speculator)
+        state = await get_session_store().load(session_key())
+        if state is not None:
+            await team.load_state(state["team"])
+            cl.user_session.set("prompt_history", state["prompt_history"])  # type: ignore
+        cl.user_session.set("diagram_speculator", speculator)  # type: ignore
+        cl.user_session.set("model_client_lease", lease)  # type: ignore
+        cl.user_session.set("external_termination", external_termination)  # type: ignore
+        cl.user_session.set("team", team)  # type: ignore
+    return cast(Team, team)
+
+
+async def save_session(team: Team) -> None:
+    """Save the state of the session, for any worker to resume it."""
+    await get_session_store().save(session_key(), {
+        "team": await team.save_state(),
+        "prompt_history": cl.user_session.get("prompt_history", ""),  # type: ignore
+    })
+
+
+# Function to handle chat start event
+# This function is called when a new chat session starts.
+@cl.on_chat_start  # type: ignore
+async def start_chat() -> None:
+    # The team is created on the first message, sessions that never send
+    # a message cost nothing.
     cl.user_session.set("prompt_history", "")  # type: ignore
-    cl.user_session.set("team", group_chat)  # type: ignore
-    # cl.user_session.set("team", selector_group_chat)  # type: ignore
+
+
+# Function to handle chat end event
+# This function is called when a chat session ends.
+@cl.on_chat_end  # type: ignore
+async def end_chat() -> None:
+    # Release the generated files of the session for the sweeper.
+    files_manager.release_session(cl.context.session.id)
+
+    # Cancel the diagram draft in progress.
+    speculator = cl.user_session.get("diagram_speculator")  # type: ignore
+    if speculator:
+        speculator.reset()
+
+    # Give the model clients of the session back to the pool.
+    lease = cl.user_session.get("model_client_lease")  # type: ignore
+    if lease:
+        lease.release()
+
+
+# Function to handle app startup event
+# This function is called when the Chainlit server starts.
+@cl.on_app_startup
+async def startup() -> None:
+    # Compact the .files directory and start the background sweeper.
+    files_manager.start()
+    # Close the model clients no session used for a while.
+    model_client_pool.start()
+    # Export the spans and serve the metrics, when telemetry is enabled.
+    get_telemetry().start()
+    # Report the code blocking the event loop, when the watchdog is enabled.
+    watchdog = get_loop_watchdog()
+    if watchdog is not None:
+        watchdog.start()
+    # Load the guidance index in the background, the first retrieval stays within its budget.
+    if GUIDANCE_RETRIEVAL_ENABLED:
+        asyncio.get_running_loop().run_in_executor(None, warm_up_guidance)
+
+
+# Function to handle app shutdown event
+# This function is called when the Chainlit server stops.
+@cl.on_app_shutdown
+async def shutdown() -> None:
+    # Stop the background sweeper.
+    await files_manager.stop()
+    # Close the shared HTTP connection pools.
+    await close_kroki_client()
+    await model_client_pool.stop()
+    await model_client_pool.close_all()
+    await get_session_store().close()
+    # Export the last spans.
+    get_telemetry().stop()
+    # Write the report of the event loop stalls.
+    watchdog = get_loop_watchdog()
+    if watchdog is not None:
+        watchdog.stop()
+        watchdog.write_report()
 
 
 # Function to suggest starters
@@ -108,41 +242,137 @@ async def set_starts() -> List[cl.Starter]:
 # This function is called when a new message is sent in the chat.
 @cl.on_message  # type: ignore
 async def chat(message: cl.Message) -> None:
-    # Get the assistant agent from the user session.
-    agent = cast(RoundRobinGroupChat,
-                 cl.user_session.get("team"))  # type: ignore
-    # Construct the response message.
-    response = cl.Message(content="")
-    current_source = None
-
-    async for msg in agent.run_stream(
-        task=[TextMessage(content=message.content, source="user")],
+    # Get the team from the user session, or resume it from the session store.
+    agent = await get_team()
+    # Track the requirements and outputs of the turn for the semantic cache.
+    session = ArchitectureSession(message.content)
+    task: Optional[List[TextMessage]] = [TextMessage(content=message.content, source="user")]
+
+    while True:
+        cached = await run_team(agent, task, session)
+        if cached is None:
+            break
+        # Show the cached architecture and let the user approve it.
+        if await present_cached_architecture(cached):
+            await agent.reset()
+            break
+        # The cached answer was rejected, continue the team with the architect.
+        task = None
+
+    # Let any worker resume the session from here.
+    await save_session(agent)
+
+
+async def run_team(agent: Team,
+                   task: Optional[List[TextMessage]],
+                   session: ArchitectureSession) -> Optional[CachedArchitecture]:
+    """Stream a run of the team to the UI.
+
+    Returns the cached architecture when the run was stopped after the user
+    answered the questions because the semantic cache had a match.
+    """
+    semantic_cache = await asyncio.to_thread(get_semantic_cache)
+    speculator = cl.user_session.get("diagram_speculator")  # type: ignore
+    cached = None
+    # Streamed message of each source, the graph team streams several sources at once.
+    responses: Dict[str, cl.Message] = {}
+
+    stream = agent.run_stream(
+        task=task,
         cancellation_token=CancellationToken(),
-    ):
+    )
+    if TELEMETRY_ENABLED:
+        stream = track_run(stream, TurnTracker(get_telemetry(), cl.context.session.id, TEAM_STRATEGY))
+
+    async for msg in stream:
         if isinstance(msg, ModelClientStreamingChunkEvent):
-            # If source has changed, update the message with a header showing the source
-            if current_source != msg.source:
-                current_source = msg.source
-                if response.content:
-                    # Send the current response before starting a new one from different source
-                    await response.send()
-                    # Process the response content for images
-                    await process_response_content(response)
-                    # Create a new response message with source header
-                    response = cl.Message(
-                        content=f"**[{current_source}]**\n\n")
-                else:
-                    # First response, just add the source header
-                    response.content = f"**[{current_source}]**\n\n"
+            response = responses.get(msg.source)
+            if response is None:
+                # Start a new message with a header showing the source
+                response = cl.Message(content=f"**[{msg.source}]**\n\n")
+                responses[msg.source] = response
 
             # Stream the model client response to the user.
             await response.stream_token(msg.content)
+            # Start drafting the diagram as soon as the components are known.
+            if speculator and msg.source == "architect_agent":
+                speculator.feed(msg.content, msg.full_message_id)
+        elif isinstance(msg, BaseChatMessage):
+            # The source is done streaming, send its message.
+            response = responses.pop(msg.source, None)
+            if response is not None:
+                await response.send()
+                # Process the response content for images
+                await process_response_content(response)
+
+            if not isinstance(msg, TextMessage):
+                continue
+            if msg.source == "user_input_agent":
+                session.add_answer(msg.content)
+                # Stop before the architect if an approved architecture matches.
+                if semantic_cache and cached is None:
+                    cached = await semantic_cache.lookup_async(session.requirements_text())
+                    if cached:
+                        cl.user_session.get("external_termination").set()  # type: ignore
+            elif msg.source == "user_approval_agent":
+                # Only architectures the user approved are cached.
+                if semantic_cache and msg.content == "APPROVE.":
+                    await semantic_cache.store_async(session)
+            else:
+                session.add_output(msg.source, msg.content)
         elif isinstance(msg, TaskResult):
-            # Done streaming the model client response. Send the message.
-            await response.send()
+            # Done streaming the model client responses. Send the messages.
+            for response in responses.values():
+                await response.send()
+                # Process the response content for images
+                await process_response_content(response)
+            responses.clear()
+
+    return cached
+
+
+async def track_run(stream: AsyncGenerator, tracker: TurnTracker) -> AsyncGenerator:
+    """Pass the events of a team run through, timing its agent turns."""
+    error = None
+    try:
+        async for msg in stream:
+            if isinstance(msg, ModelClientStreamingChunkEvent):
+                tracker.chunk(msg.source)
+            elif isinstance(msg, SelectSpeakerEvent):
+                tracker.selection(msg.content)
+            elif isinstance(msg, BaseChatMessage):
+                usage = msg.models_usage
+                tracker.message(msg.source,
+                                usage.prompt_tokens if usage else 0,
+                                usage.completion_tokens if usage else 0)
+            yield msg
+    except BaseException as e:
+        error = f"{type(e).__name__}: {str(e)}"
+        raise
+    finally:
+        tracker.close(error)
+
+
+async def present_cached_architecture(cached: CachedArchitecture) -> bool:
+    """Show a cached architecture and its diagram, and ask the user to approve it."""
+    content = f"**[architect_agent]** (cached)\n\n{cached.architecture}"
+    if cached.diagram_filename and files_store.contains(cached.diagram_filename):
+        content += f"\n\n{cached.diagram_filename}"
+    response = cl.Message(content=content)
+    await response.send()
+    await process_response_content(response)
+
+    answer = await user_action_func("")
+    if answer == "APPROVE.":
+        return True
 
-            # Process the response content for images
-            await process_response_content(response)
+    # Do not offer a rejected architecture again. Without an answer, e.g. on
+    # timeout, keep it: it was approved before.
+    if answer == "REJECT.":
+        semantic_cache = get_semantic_cache()
+        if semantic_cache:
+            await semantic_cache.invalidate_async(cached.id)
+    return False
 
 
 async def process_response_content(response: cl.Message) -> None:
@@ -168,12 +398,13 @@ async def process_response_content(response: cl.Message) -> None:
             for match in matches:
                 filename = match[0]  # Get the full filename
 
-                # Build the path to the image
-                src_dir = os.path.dirname(os.path.abspath(__file__))
-                image_path = os.path.join(src_dir, '.files', filename)
+                # Look up the image in the index of the .files directory
+                image_path = files_store.path_for(filename)
 
                 # Check if the file exists
-                if os.path.exists(image_path):
+                if image_path:
+                    # Keep the file while the session displays it
+                    await files_manager.claim(cl.context.session.id, filename)
                     # Display the image
                     image_element = cl.Image(
                         path=image_path,
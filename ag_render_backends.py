@@ -0,0 +1,409 @@
+import asyncio
+import logging
+import os
+import time
+from abc import ABC, abstractmethod
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+from xml.sax.saxutils import escape
+import httpx
+from ag_files_store import iterate_chunks
+from ag_kroki_client import get_kroki_client
+from ag_mermaid import MermaidSyntaxError, is_flowchart, parse_mermaid
+
+
+class RenderBackend(ABC):
+    """
+    Interface of the engines that turn diagram code into an image.
+    """
+
+    name: str = "backend"
+
+    @abstractmethod
+    def supports(self, diagram_type: str, output_format: str, diagram_code: str = '') -> bool:
+        """
+        Check whether the backend can render the diagram type to the format,
+        and the diagram code itself when it is given.
+        """
+
+    @abstractmethod
+    async def render(self,
+                     diagram_code: str,
+                     diagram_type: str = 'mermaid',
+                     output_format: str = 'png') -> Tuple[bytes, str]:
+        """
+        Render the diagram code and return the image data and its format.
+        """
+
+    async def render_stream(self,
+                            diagram_code: str,
+                            diagram_type: str = 'mermaid',
+                            output_format: str = 'png') -> Tuple[AsyncIterator[bytes], str]:
+        """
+        Render the diagram code and return an iterator over the image data
+        chunks and its format.
+        """
+        image_data, rendered_format = await self.render(
+            diagram_code, diagram_type, output_format)
+        return iterate_chunks(image_data), rendered_format
+
+
+class KrokiRenderBackend(RenderBackend):
+    """
+    Render diagrams with the Kroki API (kroki.io or a self-hosted instance).
+    """
+
+    name = "kroki"
+
+    def supports(self, diagram_type: str, output_format: str, diagram_code: str = '') -> bool:
+        return True
+
+    async def render(self,
+                     diagram_code: str,
+                     diagram_type: str = 'mermaid',
+                     output_format: str = 'png') -> Tuple[bytes, str]:
+        # Resolve the client on every call so it can be swapped at runtime
+        image_data = await get_kroki_client().render(
+            diagram_code, diagram_type, output_format)
+        return image_data, output_format
+
+    async def render_stream(self,
+                            diagram_code: str,
+                            diagram_type: str = 'mermaid',
+                            output_format: str = 'png') -> Tuple[AsyncIterator[bytes], str]:
+        chunks = await get_kroki_client().stream(
+            diagram_code, diagram_type, output_format)
+        return chunks, output_format
+
+
+class LocalMermaidRenderBackend(RenderBackend):
+    """
+    Render simple Mermaid flowcharts to SVG in-process, without the network.
+
+    Draws nodes with rectangle, rounded, circle and rhombus shapes, other
+    shapes as rectangles, and labeled edges, which is the subset the diagram
+    agent is asked to produce. Code the flowchart parser rejects raises a
+    ValueError.
+    """
+
+    name = "local"
+
+    NODE_WIDTH = 150
+    NODE_HEIGHT = 44
+    CHAR_WIDTH = 7
+    LAYER_GAP = 70
+    NODE_GAP = 40
+    MARGIN = 20
+
+    def supports(self, diagram_type: str, output_format: str, diagram_code: str = '') -> bool:
+        # Sequence, class and other Mermaid diagrams are left to the primary
+        return (diagram_type == 'mermaid' and output_format in ('svg', 'png')
+                and (not diagram_code or is_flowchart(diagram_code)))
+
+    async def render(self,
+                     diagram_code: str,
+                     diagram_type: str = 'mermaid',
+                     output_format: str = 'png') -> Tuple[bytes, str]:
+        if diagram_type != 'mermaid':
+            raise ValueError(f"The local renderer does not support {diagram_type} diagrams")
+        direction, nodes, edges = parse_flowchart(diagram_code)
+        # Rasterizing needs a browser, so the local renderer always returns SVG.
+        return self.to_svg(direction, nodes, edges).encode('utf-8'), 'svg'
+
+    def to_svg(self,
+               direction: str,
+               nodes: Dict[str, Tuple[str, str]],
+               edges: List[Tuple[str, str, str, str]]) -> str:
+        """
+        Lay out the graph in layers and draw it as SVG.
+        """
+        horizontal = direction in ('LR', 'RL')
+        ranks = rank_nodes(list(nodes), [(source, target) for source, target, _, _ in edges])
+        if direction in ('BT', 'RL'):
+            deepest = max(ranks.values(), default=0)
+            ranks = {node: deepest - rank for node, rank in ranks.items()}
+
+        # Group the nodes into layers, keeping their declaration order
+        layers: Dict[int, List[str]] = {}
+        for node in nodes:
+            layers.setdefault(ranks[node], []).append(node)
+
+        sizes = {node: (max(self.NODE_WIDTH, len(label) * self.CHAR_WIDTH + 24), self.NODE_HEIGHT)
+                 for node, (label, _) in nodes.items()}
+
+        # Measure every layer along the axis the nodes are spread on
+        def span(node: str) -> int:
+            return sizes[node][1] if horizontal else sizes[node][0]
+
+        def depth(node: str) -> int:
+            return sizes[node][0] if horizontal else sizes[node][1]
+
+        layer_spans = {rank: sum(span(n) for n in layer) + self.NODE_GAP * (len(layer) - 1)
+                       for rank, layer in layers.items()}
+        layer_depths = {rank: max(depth(n) for n in layer) for rank, layer in layers.items()}
+        widest = max(layer_spans.values(), default=0)
+
+        centers: Dict[str, Tuple[float, float]] = {}
+        offset = self.MARGIN
+        for rank in sorted(layers):
+            cursor = self.MARGIN + (widest - layer_spans[rank]) / 2
+            middle = offset + layer_depths[rank] / 2
+            for node in layers[rank]:
+                along = cursor + span(node) / 2
+                centers[node] = (middle, along) if horizontal else (along, middle)
+                cursor += span(node) + self.NODE_GAP
+            offset += layer_depths[rank] + self.LAYER_GAP
+        length = offset - self.LAYER_GAP + self.MARGIN
+        breadth = widest + 2 * self.MARGIN
+        width, height = (length, breadth) if horizontal else (breadth, length)
+
+        parts = [
+            f'<svg xmlns="http://www.w3.org/2000/svg" width="{width:.0f}" height="{height:.0f}" '
+            f'viewBox="0 0 {width:.0f} {height:.0f}" font-family="Segoe UI, Arial, sans-serif" font-size="13">',
+            '<defs><marker id="arrow" viewBox="0 0 10 10" refX="9" refY="5" markerWidth="8" '
+            'markerHeight="8" orient="auto-start-reverse"><path d="M 0 0 L 10 5 L 0 10 z" fill="#333"/>'
+            '</marker></defs>',
+            f'<rect width="{width:.0f}" height="{height:.0f}" fill="#ffffff"/>',
+        ]
+        for source, target, link, label in edges:
+            if link.startswith('~'):
+                # Invisible links only take part in the layout
+                continue
+            parts.append(self.draw_edge(centers[source], sizes[source],
+                                        centers[target], sizes[target], link, label))
+        for node, (label, shape) in nodes.items():
+            parts.append(self.draw_node(centers[node], sizes[node], label, shape))
+        parts.append('</svg>')
+        return "\n".join(parts)
+
+    def draw_node(self,
+                  center: Tuple[float, float],
+                  size: Tuple[int, int],
+                  label: str,
+                  shape: str) -> str:
+        x, y = center
+        w, h = size
+        style = 'fill="#ECECFF" stroke="#9370DB" stroke-width="1.5"'
+        if shape == 'circle':
+            outline = f'<ellipse cx="{x:.1f}" cy="{y:.1f}" rx="{w / 2:.1f}" ry="{h / 2:.1f}" {style}/>'
+        elif shape == 'rhombus':
+            points = f"{x:.1f},{y - h / 2:.1f} {x + w / 2:.1f},{y:.1f} {x:.1f},{y + h / 2:.1f} {x - w / 2:.1f},{y:.1f}"
+            outline = f'<polygon points="{points}" {style}/>'
+        else:
+            radius = h / 2 if shape == 'round' else 4
+            outline = (f'<rect x="{x - w / 2:.1f}" y="{y - h / 2:.1f}" width="{w}" height="{h}" '
+                       f'rx="{radius:.1f}" {style}/>')
+        text = (f'<text x="{x:.1f}" y="{y:.1f}" text-anchor="middle" dominant-baseline="central" '
+                f'fill="#333">{escape(label)}</text>')
+        return outline + text
+
+    def draw_edge(self,
+                  source: Tuple[float, float],
+                  source_size: Tuple[int, int],
+                  target: Tuple[float, float],
+                  target_size: Tuple[int, int],
+                  link: str,
+                  label: str) -> str:
+        (x1, y1), (x2, y2) = clip(source, source_size, target), clip(target, target_size, source)
+        dash = ' stroke-dasharray="5,4"' if '.' in link else ''
+        stroke = 3 if link.startswith('=') else 1.5
+        marker = ' marker-end="url(#arrow)"' if link.endswith('>') else ''
+        parts = [f'<line x1="{x1:.1f}" y1="{y1:.1f}" x2="{x2:.1f}" y2="{y2:.1f}" stroke="#333" '
+                 f'stroke-width="{stroke}"{dash}{marker}/>']
+        if label:
+            mx, my = (x1 + x2) / 2, (y1 + y2) / 2
+            w = len(label) * self.CHAR_WIDTH + 8
+            parts.append(f'<rect x="{mx - w / 2:.1f}" y="{my - 9:.1f}" width="{w}" height="18" '
+                         f'fill="#ffffff" opacity="0.9"/>')
+            parts.append(f'<text x="{mx:.1f}" y="{my:.1f}" text-anchor="middle" '
+                         f'dominant-baseline="central" fill="#333">{escape(label)}</text>')
+        return "".join(parts)
+
+
+class FallbackRenderBackend(RenderBackend):
+    """
+    Render with a primary backend and fall back to a secondary one when the
+    primary is slow or unavailable.
+
+    Only timeouts, transport errors and 5xx or 429 responses count as the
+    primary being unavailable. After one the primary is skipped for
+    `cooldown` seconds, so a slow remote renderer does not cost every user
+    the full timeout. Other errors, such as a 400 for invalid diagram code,
+    are raised as they are.
+    """
+
+    name = "auto"
+
+    def __init__(self,
+                 primary: RenderBackend,
+                 fallback: RenderBackend,
+                 timeout: float = 10.0,
+                 cooldown: float = 60.0):
+        self.primary = primary
+        self.fallback = fallback
+        self.timeout = timeout
+        self.cooldown = cooldown
+        self.primary_down_until = 0.0
+        self.fallbacks = 0
+
+    def supports(self, diagram_type: str, output_format: str, diagram_code: str = '') -> bool:
+        return (self.primary.supports(diagram_type, output_format, diagram_code)
+                or self.fallback.supports(diagram_type, output_format, diagram_code))
+
+    async def render(self,
+                     diagram_code: str,
+                     diagram_type: str = 'mermaid',
+                     output_format: str = 'png') -> Tuple[bytes, str]:
+        return await self._render("render", diagram_code, diagram_type, output_format)
+
+    async def render_stream(self,
+                            diagram_code: str,
+                            diagram_type: str = 'mermaid',
+                            output_format: str = 'png') -> Tuple[AsyncIterator[bytes], str]:
+        # Only the time to the first byte counts towards the timeout.
+        return await self._render("render_stream", diagram_code, diagram_type, output_format)
+
+    async def _render(self, method: str, diagram_code: str, diagram_type: str, output_format: str):
+        can_fall_back = self.fallback.supports(diagram_type, output_format, diagram_code)
+        if not can_fall_back:
+            return await getattr(self.primary, method)(diagram_code, diagram_type, output_format)
+
+        if time.monotonic() >= self.primary_down_until:
+            try:
+                return await asyncio.wait_for(
+                    getattr(self.primary, method)(diagram_code, diagram_type, output_format),
+                    timeout=self.timeout)
+            except (asyncio.TimeoutError, httpx.TransportError, httpx.HTTPStatusError) as e:
+                if isinstance(e, httpx.HTTPStatusError) and not is_unavailable(e.response.status_code):
+                    raise
+                self.primary_down_until = time.monotonic() + self.cooldown
+                logging.warning(
+                    f"{self.primary.name} renderer failed ({type(e).__name__}: {str(e)}), "
+                    f"falling back to {self.fallback.name} for {self.cooldown:.0f}s")
+
+        self.fallbacks += 1
+        return await getattr(self.fallback, method)(diagram_code, diagram_type, output_format)
+
+
+def is_unavailable(status_code: int) -> bool:
+    """
+    Check whether a response status means the renderer is down or overloaded,
+    rather than the request being wrong.
+    """
+    return status_code >= 500 or status_code == 429
+
+
+def parse_flowchart(
+        diagram_code: str
+) -> Tuple[str, Dict[str, Tuple[str, str]], List[Tuple[str, str, str, str]]]:
+    """
+    Parse the flowchart subset of Mermaid.
+
+    Returns the direction, the nodes as {id: (label, shape)} in declaration
+    order and the edges as (source, target, link, label) tuples.
+    """
+    flowchart = parse_mermaid(diagram_code)
+    if flowchart.errors:
+        raise MermaidSyntaxError(flowchart.errors)
+    direction = {'TB': 'TD'}.get(flowchart.direction, flowchart.direction)
+    nodes = {node.id: (node.label, node.shape) for node in flowchart.nodes.values()}
+    return direction, nodes, [tuple(edge) for edge in flowchart.edges]
+
+
+def rank_nodes(nodes: List[str], edges: List[Tuple[str, str]]) -> Dict[str, int]:
+    """
+    Assign every node to a layer using the longest path from the sources,
+    ignoring the edges that close a cycle.
+    """
+    successors: Dict[str, List[str]] = {node: [] for node in nodes}
+    for source, target in edges:
+        successors[source].append(target)
+
+    # Find the back edges with an iterative depth-first search
+    back_edges = set()
+    state: Dict[str, int] = {}
+    for root in nodes:
+        if root in state:
+            continue
+        stack = [(root, iter(successors[root]))]
+        state[root] = 1
+        while stack:
+            node, children = stack[-1]
+            child = next(children, None)
+            if child is None:
+                state[node] = 2
+                stack.pop()
+            elif state.get(child) == 1:
+                back_edges.add((node, child))
+            elif child not in state:
+                state[child] = 1
+                stack.append((child, iter(successors[child])))
+
+    # Longest path over the remaining acyclic graph, in topological order
+    indegree = {node: 0 for node in nodes}
+    for source, target in edges:
+        if (source, target) not in back_edges:
+            indegree[target] += 1
+    ranks = {node: 0 for node in nodes}
+    ready = [node for node in nodes if indegree[node] == 0]
+    while ready:
+        node = ready.pop(0)
+        for child in successors[node]:
+            if (node, child) in back_edges:
+                continue
+            ranks[child] = max(ranks[child], ranks[node] + 1)
+            indegree[child] -= 1
+            if indegree[child] == 0:
+                ready.append(child)
+    return ranks
+
+
+def clip(center: Tuple[float, float],
+         size: Tuple[int, int],
+         towards: Tuple[float, float]) -> Tuple[float, float]:
+    """
+    Get the point where the line from the center towards another point leaves the node box.
+    """
+    (x, y), (w, h) = center, size
+    dx, dy = towards[0] - x, towards[1] - y
+    if dx == 0 and dy == 0:
+        return x, y
+    scale = min((w / 2) / abs(dx) if dx else float('inf'),
+                (h / 2) / abs(dy) if dy else float('inf'))
+    return x + dx * scale, y + dy * scale
+
+
+_render_backend: Optional[RenderBackend] = None
+
+
+def get_render_backend() -> RenderBackend:
+    """
+    Get the render backend selected by the DIAGRAM_RENDER_BACKEND setting.
+
+    "kroki" always renders remotely, "local" always renders in-process and
+    "auto" (the default) renders with Kroki and falls back to the local
+    renderer when Kroki is slow or unavailable.
+    """
+    global _render_backend
+    if _render_backend is None:
+        backend = os.getenv("DIAGRAM_RENDER_BACKEND", "auto").lower()
+        if backend == "kroki":
+            _render_backend = KrokiRenderBackend()
+        elif backend == "local":
+            _render_backend = LocalMermaidRenderBackend()
+        elif backend == "auto":
+            _render_backend = FallbackRenderBackend(
+                KrokiRenderBackend(),
+                LocalMermaidRenderBackend(),
+                timeout=float(os.getenv("DIAGRAM_RENDER_TIMEOUT", 10.0)),
+                cooldown=float(os.getenv("DIAGRAM_RENDER_COOLDOWN", 60.0)))
+        else:
+            raise ValueError(f"Unknown diagram render backend: {backend}")
+    return _render_backend
+
+
+def set_render_backend(backend: Optional[RenderBackend]) -> None:
+    """
+    Replace the process-wide render backend.
+    """
+    global _render_backend
+    _render_backend = backend
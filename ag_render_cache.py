@@ -0,0 +1,163 @@
+import asyncio
+import hashlib
+import threading
+import uuid
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional
+from ag_files_store import FilesStore
+
+
+def render_key(diagram_code: str, diagram_type: str, output_format: str) -> str:
+    """
+    Compute the content hash of a render request.
+    """
+    digest = hashlib.sha256()
+    for part in (diagram_type, output_format, diagram_code):
+        digest.update(part.encode('utf-8'))
+        digest.update(b'\0')
+    return digest.hexdigest()
+
+
+class RenderCache:
+    """
+    Content-addressed cache of rendered diagrams stored in a FilesStore.
+
+    Entries are keyed by a hash of (diagram code, diagram type, output format)
+    and evicted in least-recently-used order once the total size of the cached
+    files exceeds `max_bytes`, skipping the files `in_use` reports, such as
+    the ones a chat session displays. A file rendered to another format than
+    requested is also found under the filename of the request.
+    """
+
+    def __init__(self,
+                 store: FilesStore,
+                 max_bytes: int = 100 * 1024 * 1024,
+                 in_use: Optional[Callable[[str], bool]] = None):
+        self.store = store
+        self.max_bytes = max_bytes
+        self.in_use = in_use
+        self.entries: "OrderedDict[str, int]" = OrderedDict()
+        # Filenames of requests answered with a file of another format
+        self.aliases: Dict[str, str] = {}
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.evicted_bytes = 0
+        self._lock = threading.Lock()
+        self._loaded = False
+
+    def filename_for(self,
+                     diagram_code: str,
+                     diagram_type: str = 'mermaid',
+                     output_format: str = 'png') -> str:
+        """
+        Get the deterministic filename of a render request.
+
+        The filename is the content hash in UUID format, so the chat UI keeps
+        recognising it as a diagram.
+        """
+        key = render_key(diagram_code, diagram_type, output_format)
+        return f"{uuid.UUID(hex=key[:32])}.{output_format}"
+
+    def lookup(self, filename: str) -> Optional[str]:
+        """
+        Get the cached file of a render request, or None, counting a hit or a miss.
+        """
+        with self._lock:
+            self._load()
+            cached = self.aliases.get(filename, filename)
+            size = self.entries.get(cached)
+            if size is not None and self.store.contains(cached):
+                self.entries.move_to_end(cached)
+                self.hits += 1
+                return cached
+            if size is not None:
+                # The file was removed from the store behind our back.
+                self._forget(cached)
+            self.aliases.pop(filename, None)
+            self.misses += 1
+            return None
+
+    async def add(self, filename: str, size: int, requested: Optional[str] = None) -> None:
+        """
+        Register a freshly rendered file and evict old entries if over budget.
+
+        `requested` is the filename of the request when the file was rendered
+        to another format.
+        """
+        with self._lock:
+            self._load()
+            self._forget(filename)
+            self.entries[filename] = size
+            self.total_bytes += size
+            if requested is not None and requested != filename:
+                self.aliases[requested] = filename
+            evicted = self._evict()
+        if evicted:
+            await asyncio.to_thread(lambda: [self.store.remove(name) for name in evicted])
+
+    def discard(self, filename: str) -> None:
+        """
+        Drop a file from the cache without deleting it.
+        """
+        with self._lock:
+            self._forget(filename)
+
+    def stats(self) -> Dict[str, int]:
+        """
+        Get the cache counters.
+        """
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "evicted_bytes": self.evicted_bytes,
+                "entries": len(self.entries),
+                "bytes": self.total_bytes,
+                "max_bytes": self.max_bytes,
+            }
+
+    def _load(self) -> None:
+        """
+        Adopt the files already in the store, oldest first. The next add
+        evicts them if they are over budget.
+        """
+        if self._loaded:
+            return
+        self._loaded = True
+        for name, stored in list(self.store.load().items()):
+            self.entries[name] = stored.size
+            self.total_bytes += stored.size
+
+    def _forget(self, filename: str) -> Optional[int]:
+        size = self.entries.pop(filename, None)
+        if size is not None:
+            self.total_bytes -= size
+            self._drop_aliases(filename)
+        return size
+
+    def _drop_aliases(self, filename: str) -> None:
+        if self.aliases:
+            for requested in [requested for requested, cached in self.aliases.items() if cached == filename]:
+                del self.aliases[requested]
+
+    def _evict(self) -> List[str]:
+        # Returns the files to delete. Always keep the most recent entry, even
+        # if it alone exceeds the budget, and the files in use.
+        evicted: List[str] = []
+        if self.total_bytes <= self.max_bytes:
+            return evicted
+        for filename in list(self.entries)[:-1]:
+            if self.total_bytes <= self.max_bytes:
+                break
+            if self.in_use is not None and self.in_use(filename):
+                continue
+            size = self.entries.pop(filename)
+            self.total_bytes -= size
+            self.evictions += 1
+            self.evicted_bytes += size
+            self._drop_aliases(filename)
+            evicted.append(filename)
+        return evicted
@@ -0,0 +1,136 @@
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Mapping, Optional, Sequence, Tuple, Union
+from autogen_core import CacheStore
+from autogen_core.models import ChatCompletionClient, CreateResult, LLMMessage
+from autogen_core.tools import Tool, ToolSchema
+from autogen_ext.models.cache import CHAT_CACHE_VALUE_TYPE, ChatCompletionCache
+from pydantic import BaseModel
+
+
+# Opt-in switch of the response cache.
+RESPONSE_CACHE_ENABLED = os.getenv("RESPONSE_CACHE_ENABLED", "false").lower() in ("1", "true", "yes")
+
+
+class TTLCacheStore(CacheStore[CHAT_CACHE_VALUE_TYPE]):
+    """
+    In-memory cache store with a time to live and least-recently-used
+    eviction once it holds `max_entries` entries.
+    """
+
+    def __init__(self, ttl: float = 3600.0, max_entries: int = 1000):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.entries: "OrderedDict[str, Tuple[float, CHAT_CACHE_VALUE_TYPE]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+
+    def get(self, key: str, default: Optional[CHAT_CACHE_VALUE_TYPE] = None) -> Optional[CHAT_CACHE_VALUE_TYPE]:
+        with self._lock:
+            entry = self.entries.get(key)
+            if entry is not None and entry[0] > time.monotonic():
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            if entry is not None:
+                del self.entries[key]
+            self.misses += 1
+            return default
+
+    def set(self, key: str, value: CHAT_CACHE_VALUE_TYPE) -> None:
+        with self._lock:
+            self.entries.pop(key, None)
+            self.entries[key] = (time.monotonic() + self.ttl, value)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self) -> None:
+        """
+        Drop every cached response.
+        """
+        with self._lock:
+            self.entries.clear()
+
+    def stats(self) -> Dict[str, int]:
+        """
+        Get the cache counters.
+        """
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "entries": len(self.entries),
+            }
+
+
+def normalize_messages(messages: Sequence[LLMMessage]) -> List[LLMMessage]:
+    """
+    Collapse the whitespace of text messages, so that prompts differing only
+    in indentation or line breaks share a cache entry.
+    """
+    normalized: List[LLMMessage] = []
+    for message in messages:
+        content = getattr(message, "content", None)
+        if isinstance(content, str):
+            message = message.model_copy(update={"content": re.sub(r'\s+', ' ', content).strip()})
+        normalized.append(message)
+    return normalized
+
+
+class ResponseCacheClient(ChatCompletionCache):
+    """
+    Model client that replays cached completions of an underlying client.
+
+    The cache key covers the model, the system message and the normalized
+    message history. Cached streams are replayed chunk by chunk, so the chat
+    UI renders them like a live response. The underlying client is shared
+    by the sessions and only closed by its pool.
+    """
+
+    def __init__(self,
+                 client: ChatCompletionClient,
+                 model_name: str,
+                 store: CacheStore[CHAT_CACHE_VALUE_TYPE]):
+        super().__init__(client, store)
+        self.model_name = model_name
+
+    def _check_cache(
+        self,
+        messages: Sequence[LLMMessage],
+        tools: Sequence[Tool | ToolSchema],
+        json_output: Optional[bool | type[BaseModel]],
+        extra_create_args: Mapping[str, Any],
+    ) -> Tuple[Optional[Union[CreateResult, List[Union[str, CreateResult]]]], str]:
+        # The model only takes part in the key, it is not sent to the client.
+        return super()._check_cache(
+            normalize_messages(messages),
+            tools,
+            json_output,
+            {**extra_create_args, "cache_model": self.model_name},
+        )
+
+    async def close(self) -> None:
+        # The pooled client stays open for the other sessions.
+        pass
+
+
+# Store shared by the cached clients of all sessions.
+response_cache_store = TTLCacheStore(
+    ttl=float(os.getenv("RESPONSE_CACHE_TTL", 3600)),
+    max_entries=int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", 1000)))
+
+
+def create_cached_client(client: ChatCompletionClient, model_name: str) -> ChatCompletionClient:
+    """
+    Put the response cache in front of a model client, if the cache is enabled.
+    """
+    if not RESPONSE_CACHE_ENABLED:
+        return client
+    return ResponseCacheClient(client, model_name, response_cache_store)
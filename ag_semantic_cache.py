@@ -0,0 +1,209 @@
+import asyncio
+import hashlib
+import logging
+import os
+import re
+import time
+from typing import Dict, List, NamedTuple, Optional
+from ag_telemetry import traced
+from vectordb_provider import PersistentChromaDBClient
+
+
+# Opt-in switch of the semantic cache.
+SEMANTIC_CACHE_ENABLED = os.getenv("SEMANTIC_CACHE_ENABLED", "false").lower() in ("1", "true", "yes")
+
+# Diagram filenames mentioned in the agents' messages.
+DIAGRAM_FILENAME_PATTERN = re.compile(
+    r'[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}\.(?:png|jpg|jpeg|svg|pdf|gif)')
+
+
+class CachedArchitecture(NamedTuple):
+    id: str
+    requirements: str
+    architecture: str
+    diagram_filename: Optional[str]
+    similarity: float
+    generation_seconds: float
+
+
+class ArchitectureSession:
+    """
+    What one chat turn has produced so far: the requirements gathered from
+    the user, the architect's answer and the diagram.
+    """
+
+    def __init__(self, request: str):
+        self.requirements: List[str] = [request]
+        self.architecture: Optional[str] = None
+        self.diagram_filename: Optional[str] = None
+        self.requirements_collected_at: Optional[float] = None
+
+    def add_answer(self, answer: str) -> None:
+        """
+        Record the user's answers to the questioner.
+        """
+        self.requirements.append(answer)
+        self.requirements_collected_at = time.monotonic()
+
+    def add_output(self, source: str, content: str) -> None:
+        """
+        Record the output of an agent.
+        """
+        if source == "architect_agent":
+            self.architecture = content
+        filenames = DIAGRAM_FILENAME_PATTERN.findall(content)
+        if filenames:
+            self.diagram_filename = filenames[-1]
+
+    def requirements_text(self) -> str:
+        """
+        Get the gathered requirements as a single text.
+        """
+        return "\n".join(self.requirements)
+
+    def generation_seconds(self) -> float:
+        """
+        Get the time spent generating the architecture after the requirements were collected.
+        """
+        if self.requirements_collected_at is None:
+            return 0.0
+        return time.monotonic() - self.requirements_collected_at
+
+
+class SemanticArchitectureCache:
+    """
+    Cache of approved architectures, looked up by the similarity of the requirements.
+
+    Requirements are embedded in a ChromaDB collection with the default
+    embedding function, whose vectors are normalized, so the cosine
+    similarity is 1 - d / 2 for the squared L2 distance d that Chroma returns.
+    Only architectures the user approved are stored.
+    """
+
+    def __init__(self,
+                 db: PersistentChromaDBClient,
+                 collection_name: str = "architecture_cache",
+                 threshold: float = 0.92,
+                 ttl: float = 30 * 24 * 3600):
+        self.db = db
+        self.collection_name = collection_name
+        self.threshold = threshold
+        self.ttl = ttl
+        self.lookups = 0
+        self.hits = 0
+        self.latency_saved = 0.0
+        self.db.create_collection(collection_name, "Approved architectures by requirements")
+
+    @traced("chroma.semantic_cache_lookup")
+    def lookup(self, requirements: str) -> Optional[CachedArchitecture]:
+        """
+        Get the approved architecture for the most similar requirements, if
+        it clears the similarity threshold and has not expired.
+        """
+        self.lookups += 1
+        result = self.db.query_documents(self.collection_name, [requirements], n_results=1)
+        if not result["ids"] or not result["ids"][0]:
+            return None
+        entry_id = result["ids"][0][0]
+        metadata = result["metadatas"][0][0]
+        similarity = 1 - result["distances"][0][0] / 2
+        if time.time() - metadata["created"] > self.ttl:
+            self.invalidate(entry_id)
+            return None
+        if similarity < self.threshold:
+            return None
+
+        self.hits += 1
+        self.latency_saved += metadata.get("generation_seconds", 0.0)
+        return CachedArchitecture(
+            id=entry_id,
+            requirements=result["documents"][0][0],
+            architecture=metadata["architecture"],
+            diagram_filename=metadata.get("diagram_filename") or None,
+            similarity=similarity,
+            generation_seconds=metadata.get("generation_seconds", 0.0),
+        )
+
+    @traced("chroma.semantic_cache_store")
+    def store(self, session: ArchitectureSession) -> Optional[str]:
+        """
+        Store an approved architecture and return its id.
+        """
+        if not session.architecture:
+            return None
+        requirements = session.requirements_text()
+        entry_id = hashlib.sha256(requirements.encode('utf-8')).hexdigest()
+        self.db.upsert_documents(
+            self.collection_name,
+            ids=[entry_id],
+            documents=[requirements],
+            metadatas=[{
+                "architecture": session.architecture,
+                "diagram_filename": session.diagram_filename or "",
+                "generation_seconds": session.generation_seconds(),
+                "created": time.time(),
+            }])
+        return entry_id
+
+    def invalidate(self, entry_id: Optional[str] = None) -> None:
+        """
+        Remove one cached architecture, or all of them.
+        """
+        if entry_id is None:
+            self.db.delete_collection(self.collection_name)
+            self.db.create_collection(self.collection_name, "Approved architectures by requirements")
+        else:
+            self.db.delete_documents(self.collection_name, ids=[entry_id])
+
+    def stats(self) -> Dict[str, float]:
+        """
+        Get the hit rate and the generation time saved by cache hits.
+        """
+        return {
+            "lookups": self.lookups,
+            "hits": self.hits,
+            "hit_rate": self.hits / self.lookups if self.lookups else 0.0,
+            "latency_saved_seconds": self.latency_saved,
+        }
+
+    async def lookup_async(self, requirements: str) -> Optional[CachedArchitecture]:
+        """
+        Look up requirements without blocking the event loop.
+        """
+        try:
+            return await asyncio.to_thread(self.lookup, requirements)
+        except Exception as e:
+            logging.error(f"Semantic cache lookup failed: {str(e)}")
+            return None
+
+    async def store_async(self, session: ArchitectureSession) -> Optional[str]:
+        """
+        Store an approved architecture without blocking the event loop.
+        """
+        try:
+            return await asyncio.to_thread(self.store, session)
+        except Exception as e:
+            logging.error(f"Semantic cache store failed: {str(e)}")
+            return None
+
+    async def invalidate_async(self, entry_id: Optional[str] = None) -> None:
+        """
+        Invalidate cached architectures without blocking the event loop.
+        """
+        await asyncio.to_thread(self.invalidate, entry_id)
+
+
+_semantic_cache: Optional[SemanticArchitectureCache] = None
+
+
+def get_semantic_cache() -> Optional[SemanticArchitectureCache]:
+    """
+    Get the process-wide semantic cache, or None when it is disabled.
+    """
+    global _semantic_cache
+    if SEMANTIC_CACHE_ENABLED and _semantic_cache is None:
+        _semantic_cache = SemanticArchitectureCache(
+            PersistentChromaDBClient(),
+            threshold=float(os.getenv("SEMANTIC_CACHE_THRESHOLD", 0.92)),
+            ttl=float(os.getenv("SEMANTIC_CACHE_TTL_DAYS", 30)) * 24 * 3600)
+    return _semantic_cache
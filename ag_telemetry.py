@@ -0,0 +1,475 @@
+import asyncio
+import bisect
+import functools
+import hashlib
+import json
+import logging
+import os
+import secrets
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+
+# Opt-in switch of the metrics and spans.
+TELEMETRY_ENABLED = os.getenv("TELEMETRY_ENABLED", "false").lower() in ("1", "true", "yes")
+
+# Address of the Prometheus metrics endpoint, port 0 disables it.
+TELEMETRY_HOST = os.getenv("TELEMETRY_HOST", "127.0.0.1")
+TELEMETRY_PORT = int(os.getenv("TELEMETRY_PORT", 9464))
+
+# Ports tried from TELEMETRY_PORT on, so that each worker of the host serves its own metrics.
+TELEMETRY_PORT_RANGE = int(os.getenv("TELEMETRY_PORT_RANGE", 16))
+
+# File the spans are appended to in the OTLP JSON format, empty disables it.
+TELEMETRY_SPANS_FILE = os.getenv("TELEMETRY_SPANS_FILE", os.path.join("telemetry", "spans.jsonl"))
+
+SERVICE_NAME = "multi-agent-cloud-architect"
+METRIC_PREFIX = "architect_"
+
+# Buckets of the duration histograms, in seconds.
+SECONDS_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+# Spans waiting for export beyond this number are dropped.
+MAX_PENDING_SPANS = 10000
+
+# Span of the code running in the current task, parent of the spans it starts.
+_current_span: ContextVar[Optional["Span"]] = ContextVar("current_span", default=None)
+
+LabelSet = Tuple[Tuple[str, str], ...]
+
+
+class Span:
+    """
+    A timed operation, exported as an OpenTelemetry span.
+    """
+
+    __slots__ = ("name", "trace_id", "span_id", "parent_id", "start_ns", "end_ns", "attributes", "error")
+
+    def __init__(self,
+                 name: str,
+                 parent: Optional["Span"] = None,
+                 trace_id: Optional[str] = None,
+                 attributes: Optional[Dict[str, Any]] = None):
+        self.name = name
+        self.trace_id = parent.trace_id if parent else trace_id or secrets.token_hex(16)
+        self.span_id = secrets.token_hex(8)
+        self.parent_id = parent.span_id if parent else ""
+        self.start_ns = time.time_ns()
+        self.end_ns = 0
+        self.attributes = attributes or {}
+        self.error: Optional[str] = None
+
+    @property
+    def duration(self) -> float:
+        """
+        Duration in seconds, up to now while the span is open.
+        """
+        return ((self.end_ns or time.time_ns()) - self.start_ns) / 1e9
+
+    def to_otlp(self) -> Dict[str, Any]:
+        return {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "parentSpanId": self.parent_id,
+            "name": self.name,
+            "kind": 1,
+            "startTimeUnixNano": str(self.start_ns),
+            "endTimeUnixNano": str(self.end_ns),
+            "attributes": [{"key": key, "value": otlp_value(value)} for key, value in self.attributes.items()],
+            "status": {"code": 2, "message": self.error} if self.error else {"code": 1},
+        }
+
+
+def otlp_value(value: Any) -> Dict[str, Any]:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+class Histogram:
+    __slots__ = ("buckets", "counts", "sum", "count")
+
+    def __init__(self, buckets: Tuple[float, ...]):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class Telemetry:
+    """
+    Process-wide metrics and spans.
+
+    Counters and histograms are kept in memory and served in the Prometheus
+    text format, labelled with `worker` when given. Each worker of a host
+    serves its own metrics on the first free port of its range. Ended spans
+    are buffered and appended to `spans_path` by a background thread, one
+    OTLP JSON export request per line, so recording stays off the event
+    loop.
+    """
+
+    def __init__(self,
+                 enabled: bool = True,
+                 spans_path: Optional[str] = None,
+                 flush_interval: float = 1.0,
+                 worker: Optional[str] = None):
+        self.enabled = enabled
+        self.spans_path = spans_path
+        self.flush_interval = flush_interval
+        self.worker = worker
+        # Port of the metrics endpoint once it listens
+        self.port: Optional[int] = None
+        self._lock = threading.Lock()
+        self._counters: Dict[Tuple[str, LabelSet], float] = {}
+        self._histograms: Dict[Tuple[str, LabelSet], Histogram] = {}
+        self._pending: List[Span] = []
+        self._stopped = threading.Event()
+        self._exporter: Optional[threading.Thread] = None
+        self._server: Optional[ThreadingHTTPServer] = None
+        self.exported = 0
+        self.dropped = 0
+
+    def increment(self, name: str, value: float = 1.0, **labels: str) -> None:
+        """
+        Add to a counter.
+        """
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0.0) + value
+
+    def observe(self, name: str, value: float, **labels: str) -> None:
+        """
+        Record a duration, in seconds, in a histogram.
+        """
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram(SECONDS_BUCKETS)
+            histogram.observe(value)
+
+    def start_span(self,
+                   name: str,
+                   parent: Optional[Span] = None,
+                   trace_id: Optional[str] = None,
+                   **attributes: Any) -> Span:
+        """
+        Start a span, child of `parent` or of the current span.
+        """
+        return Span(name, parent or _current_span.get(), trace_id, attributes)
+
+    def end_span(self, span: Span, error: Optional[str] = None) -> None:
+        """
+        End a span, recording its duration and queuing it for export.
+        """
+        span.end_ns = time.time_ns()
+        span.error = error
+        self.observe("span_duration_seconds", span.duration, span=span.name)
+        if error:
+            self.increment("span_errors_total", span=span.name)
+        if self.spans_path:
+            with self._lock:
+                if len(self._pending) < MAX_PENDING_SPANS:
+                    self._pending.append(span)
+                else:
+                    self.dropped += 1
+
+    @contextmanager
+    def span(self, name: str, **attributes: Any) -> Iterator[Optional[Span]]:
+        """
+        Time the block in a span that is the parent of the spans started in it.
+
+        Yields None without recording anything when telemetry is disabled.
+        """
+        if not self.enabled:
+            yield None
+            return
+        span = self.start_span(name, **attributes)
+        token = _current_span.set(span)
+        error = None
+        try:
+            yield span
+        except BaseException as e:
+            error = f"{type(e).__name__}: {str(e)}"
+            raise
+        finally:
+            _current_span.reset(token)
+            self.end_span(span, error)
+
+    def flush(self) -> None:
+        """
+        Append the ended spans to the span file.
+        """
+        with self._lock:
+            spans, self._pending = self._pending, []
+        if not spans or not self.spans_path:
+            return
+        resource = [{"key": "service.name", "value": otlp_value(SERVICE_NAME)}]
+        if self.worker:
+            resource.append({"key": "service.instance.id", "value": otlp_value(self.worker)})
+        request = {"resourceSpans": [{
+            "resource": {"attributes": resource},
+            "scopeSpans": [{"scope": {"name": __name__}, "spans": [span.to_otlp() for span in spans]}],
+        }]}
+        try:
+            directory = os.path.dirname(self.spans_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            with open(self.spans_path, "a", encoding="utf-8") as file:
+                file.write(json.dumps(request) + "\n")
+            self.exported += len(spans)
+        except OSError as e:
+            self.dropped += len(spans)
+            logging.error(f"Spans could not be exported: {str(e)}")
+
+    def render_prometheus(self) -> str:
+        """
+        Get the metrics in the Prometheus text exposition format.
+        """
+        with self._lock:
+            counters = sorted(self._counters.items())
+            histograms = sorted(self._histograms.items(), key=lambda item: item[0])
+            histograms = [(key, list(histogram.counts), histogram.sum, histogram.count)
+                          for key, histogram in histograms]
+        worker: LabelSet = (("worker", self.worker),) if self.worker else ()
+        lines: List[str] = []
+        typed = set()
+        for (name, labels), value in counters:
+            name = METRIC_PREFIX + name
+            if name not in typed:
+                typed.add(name)
+                lines.append(f"# TYPE {name} counter")
+            lines.append(f"{name}{format_labels(labels + worker)} {value:g}")
+        for (name, labels), counts, total, count in histograms:
+            name = METRIC_PREFIX + name
+            if name not in typed:
+                typed.add(name)
+                lines.append(f"# TYPE {name} histogram")
+            labels += worker
+            cumulative = 0
+            for bucket, bucket_count in zip((*SECONDS_BUCKETS, "+Inf"), counts):
+                cumulative += bucket_count
+                lines.append(f"{name}_bucket{format_labels(labels + (('le', str(bucket)),))} {cumulative}")
+            lines.append(f"{name}_sum{format_labels(labels)} {total:g}")
+            lines.append(f"{name}_count{format_labels(labels)} {count}")
+        return "\n".join(lines) + "\n"
+
+    def start(self,
+              host: str = TELEMETRY_HOST,
+              port: int = TELEMETRY_PORT,
+              port_range: int = TELEMETRY_PORT_RANGE) -> None:
+        """
+        Start the span exporter and, unless the port is 0, the metrics endpoint
+        on the first free port from `port` on.
+        """
+        if not self.enabled or self._exporter is not None:
+            return
+        self._stopped.clear()
+        self._exporter = threading.Thread(target=self._export, name="telemetry-exporter", daemon=True)
+        self._exporter.start()
+        if not port:
+            return
+        for candidate in range(port, port + max(port_range, 1)):
+            try:
+                self._server = ThreadingHTTPServer((host, candidate), metrics_handler(self))
+            except OSError:
+                # Another worker of the host serves its metrics there
+                continue
+            self.port = candidate
+            logging.info(f"Metrics of worker {self.worker} served on {host}:{candidate}")
+            threading.Thread(target=self._server.serve_forever, name="telemetry-metrics", daemon=True).start()
+            return
+        logging.warning(f"Metrics endpoint could not listen on {host}:{port}-{port + max(port_range, 1) - 1}")
+
+    def stop(self) -> None:
+        """
+        Stop the metrics endpoint and export the remaining spans.
+        """
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+            self.port = None
+        if self._exporter is not None:
+            self._stopped.set()
+            self._exporter.join()
+            self._exporter = None
+        self.flush()
+
+    def stats(self) -> Dict[str, int]:
+        """
+        Get the number of spans exported, dropped and waiting for export.
+        """
+        with self._lock:
+            return {"exported": self.exported, "dropped": self.dropped, "pending": len(self._pending)}
+
+    def _export(self) -> None:
+        while not self._stopped.wait(self.flush_interval):
+            self.flush()
+
+
+def format_labels(labels: LabelSet) -> str:
+    if not labels:
+        return ""
+    escaped = (key + '="' + str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') + '"'
+               for key, value in labels)
+    return "{" + ",".join(escaped) + "}"
+
+
+def metrics_handler(telemetry: Telemetry) -> type:
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = telemetry.render_prometheus().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            # Scrapes are not worth a log line
+            pass
+
+    return MetricsHandler
+
+
+class TurnTracker:
+    """
+    Time the agent turns of one run of a team from the events it streams.
+
+    A turn starts when the previous message or speaker selection of the run
+    ended, its first streamed chunk gives the time to first token and its
+    message ends it with the model usage. Messages that were never streamed
+    and carry no usage, like the user's answers, only move the start of the
+    next turn. All the runs of a session share one trace.
+    """
+
+    def __init__(self, telemetry: Telemetry, session_id: str, strategy: str):
+        self.telemetry = telemetry
+        self.run = telemetry.start_span(
+            "team.run",
+            trace_id=hashlib.md5(session_id.encode("utf-8")).hexdigest(),
+            **{"session.id": session_id, "team.strategy": strategy})
+        self.turns: Dict[str, Span] = {}
+        self.last_event_ns = self.run.start_ns
+        self.speaker: Optional[str] = None
+
+    def chunk(self, source: str) -> None:
+        """
+        Record a streamed chunk of an agent.
+        """
+        if source in self.turns:
+            return
+        turn = self.turns[source] = self._start_turn(source)
+        ttft = (time.time_ns() - turn.start_ns) / 1e9
+        turn.attributes["agent.time_to_first_token_ms"] = round(ttft * 1000, 1)
+        self.telemetry.observe("agent_time_to_first_token_seconds", ttft, agent=source)
+
+    def message(self, source: str, prompt_tokens: int = 0, completion_tokens: int = 0) -> None:
+        """
+        Record the message ending the turn of an agent, with the tokens of its model calls.
+        """
+        turn = self.turns.pop(source, None)
+        if turn is None and not (prompt_tokens or completion_tokens):
+            self.last_event_ns = time.time_ns()
+            return
+        turn = turn or self._start_turn(source)
+        turn.attributes["gen_ai.usage.input_tokens"] = prompt_tokens
+        turn.attributes["gen_ai.usage.output_tokens"] = completion_tokens
+        self.telemetry.end_span(turn)
+        self.last_event_ns = turn.end_ns
+        self.telemetry.observe("agent_generation_seconds", turn.duration, agent=source)
+        self.telemetry.increment("agent_turns_total", agent=source)
+        if prompt_tokens:
+            self.telemetry.increment("agent_prompt_tokens_total", prompt_tokens, agent=source)
+        if completion_tokens:
+            self.telemetry.increment("agent_completion_tokens_total", completion_tokens, agent=source)
+
+    def selection(self, speakers: List[str]) -> None:
+        """
+        Record a decision of the selector, timed from the previous message.
+        """
+        decision = self.telemetry.start_span(
+            "selector.decision", parent=self.run,
+            **{"selector.previous": self.speaker or "", "selector.selected": ",".join(speakers)})
+        decision.start_ns = self.last_event_ns
+        self.telemetry.end_span(decision)
+        self.last_event_ns = decision.end_ns
+        self.telemetry.observe("selector_decision_seconds", decision.duration)
+        for speaker in speakers:
+            self.telemetry.increment("selector_decisions_total", previous=self.speaker or "", selected=speaker)
+            self.speaker = speaker
+
+    def close(self, error: Optional[str] = None) -> None:
+        """
+        End the run and the turns it left open.
+        """
+        for turn in self.turns.values():
+            self.telemetry.end_span(turn, error or "The run ended before the turn")
+        self.turns.clear()
+        self.telemetry.end_span(self.run, error)
+        self.telemetry.observe("team_run_seconds", self.run.duration)
+
+    def _start_turn(self, source: str) -> Span:
+        turn = self.telemetry.start_span("agent.turn", parent=self.run, **{"gen_ai.agent.name": source})
+        turn.start_ns = self.last_event_ns
+        return turn
+
+
+def traced(name: str):
+    """
+    Decorator timing each call of a function, sync or async, in a span.
+    """
+    def decorator(function):
+        if asyncio.iscoroutinefunction(function):
+            @functools.wraps(function)
+            async def async_wrapper(*args, **kwargs):
+                with get_telemetry().span(name):
+                    return await function(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            with get_telemetry().span(name):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+_telemetry: Optional[Telemetry] = None
+
+
+def get_telemetry() -> Telemetry:
+    """
+    Get the process-wide telemetry, created on first use from the environment.
+    """
+    global _telemetry
+    if _telemetry is None:
+        _telemetry = Telemetry(enabled=TELEMETRY_ENABLED,
+                               spans_path=TELEMETRY_SPANS_FILE or None,
+                               worker=str(os.getpid()))
+    return _telemetry
+
+
+def set_telemetry(telemetry: Optional[Telemetry]) -> None:
+    """
+    Replace the process-wide telemetry, e.g. with one writing to a temporary file.
+    """
+    global _telemetry
+    _telemetry = telemetry
@@ -1,13 +1,38 @@
-import requests
-from requests.models import Response
 import base64
 import logging
 import uuid
 import os
-import base64
 import zlib
 import chainlit as cl
-from typing import Dict, Any
+from typing import Dict, Any, Optional
+from ag_files_manager import FilesLifecycleManager
+from ag_files_store import FilesStore
+from ag_kroki_client import get_kroki_client
+from ag_mermaid import MermaidSyntaxError, is_flowchart, normalize_mermaid
+from ag_render_backends import get_render_backend
+from ag_render_cache import RenderCache
+from ag_telemetry import get_telemetry, traced
+from vectordb_retriever import search_guidance
+
+# Directory where rendered diagrams are stored and served from.
+FILES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.files')
+
+# Index of the files in the .files directory.
+files_store = FilesStore(FILES_DIR)
+
+# Size and age quotas of the .files directory, enforced by a background sweeper.
+files_manager = FilesLifecycleManager(
+    files_store,
+    max_bytes=int(os.getenv("FILES_MAX_BYTES", 500 * 1024 * 1024)),
+    max_age=float(os.getenv("FILES_MAX_AGE_HOURS", 7 * 24)) * 3600,
+    session_max_bytes=int(os.getenv("FILES_SESSION_MAX_BYTES", 50 * 1024 * 1024)),
+    sweep_interval=float(os.getenv("FILES_SWEEP_INTERVAL", 300)))
+
+# Cache of rendered diagrams, bounded by the total size of the files, keeping the ones sessions display.
+render_cache = RenderCache(
+    files_store,
+    max_bytes=int(os.getenv("RENDER_CACHE_MAX_BYTES", 100 * 1024 * 1024)),
+    in_use=files_manager.is_owned)
 
 
 @cl.step(type="tool")
@@ -16,7 +41,7 @@ async def generate_mermaid_diagram(
         diagram_type: str = 'mermaid',
         output_format: str = 'png') -> Dict[str, Any]:
     """
-    Generate a diagram using the Kroki API.
+    Generate a diagram using the configured render backend (Kroki by default).
 
     Args:
         diagram_code (str): The diagram code (mermaid, graphviz, etc.)
@@ -26,23 +51,45 @@ async def generate_mermaid_diagram(
     Returns:
         Dict[str, Any]: A dictionary containing the filename and status information
     """
-    try:
-        
-        # Sanitize the diagram code
-        diagram_code = sanitize_mermaid_code(diagram_code)
-        
-
-        # Set the Kroki API URL based on the diagram type and output format
-        url = f"https://kroki.io/{diagram_type}/{output_format}"
+    return await render_diagram(diagram_code, diagram_type, output_format)
 
-        # Send the diagram code directly in the request body
-        response = requests.post(url, data=diagram_code)
 
-        # Raise exception for bad responses
-        response.raise_for_status()
-
-        # Save the image to a file
-        filename = save_image(response, output_format)
+@traced("tool.render_diagram")
+async def render_diagram(
+        diagram_code: str,
+        diagram_type: str = 'mermaid',
+        output_format: str = 'png') -> Dict[str, Any]:
+    """
+    Render a diagram to the .files directory, outside of a UI step.
+    """
+    try:
+        # Validate and normalize flowcharts locally, invalid code never reaches the renderer
+        if diagram_type == 'mermaid' and is_flowchart(diagram_code):
+            diagram_code = normalize_mermaid(diagram_code)
+
+        # Return the existing file if the same diagram was rendered before
+        requested = render_cache.filename_for(
+            diagram_code, diagram_type, output_format)
+        cached = render_cache.lookup(requested)
+        if cached:
+            return {
+                "filename": cached,
+                "valid": True
+            }
+
+        # Render the diagram with the configured backend
+        chunks, rendered_format = await get_render_backend().render_stream(
+            diagram_code, diagram_type, output_format)
+
+        # The fallback renderer may produce another format than requested
+        filename = requested
+        if rendered_format != output_format:
+            filename = render_cache.filename_for(
+                diagram_code, diagram_type, rendered_format)
+
+        # Stream the image to a file and register it in the cache, under the requested format too
+        size = await files_store.write_stream(filename, chunks)
+        await render_cache.add(filename, size, requested)
 
         # Return a JSON-compatible dictionary with the result
         return {
@@ -50,8 +97,17 @@ async def generate_mermaid_diagram(
             "valid": True
         }
 
+    except MermaidSyntaxError as e:
+        # Return every syntax error so the agent can fix the code in one go
+        return {
+            "message": "The diagram code is invalid, fix these errors and try again.",
+            "error": str(e),
+            "errors": [str(error) for error in e.errors],
+            "valid": False
+        }
+
     except Exception as e:
-        error_message = f"Error generating diagram with Kroki API: {str(e)}"
+        error_message = f"Error generating diagram: {str(e)}"
         logging.error(error_message)
         # Return error information as JSON
         return {
@@ -61,8 +117,24 @@ async def generate_mermaid_diagram(
         }
 
 
+@cl.step(type="tool")
+async def search_azure_guidance(query: str) -> str:
+    """
+    Search the Azure Architecture Center, Well-Architected Framework and Cloud
+    Adoption Framework guidance for the excerpts most relevant to a query.
+
+    Args:
+        query (str): The architecture topic or requirement to look up
+
+    Returns:
+        str: The most relevant guidance excerpts with their sources
+    """
+    with get_telemetry().span("chroma.guidance_search"):
+        return await search_guidance(query)
+
+
 # @cl.step(type="tool")
-def generate_mermaid_diagram_encoded(
+async def generate_mermaid_diagram_encoded(
         mermaid_code: str,
         output_format: str = 'png') -> str:
     """
@@ -77,15 +149,13 @@ def generate_mermaid_diagram_encoded(
     encoded_mermaid_code = encode_base64(mermaid_code)
     print(f"Encoded Mermaid code: {encoded_mermaid_code}")
 
-    api_url = f"https://kroki.io/mermaid/png"
-
     try:
-        response = requests.get(api_url)
-        # Raise exception for bad responses
-        response.raise_for_status()
+        # Send the encoded diagram in the URL using the shared client
+        image_data = await get_kroki_client().request(
+            "GET", f"/mermaid/{output_format}/{encoded_mermaid_code}")
 
         # Save the image to a file
-        filename = save_image(response, output_format)
+        filename = await save_image(image_data, output_format)
         # filename = f"{uuid.uuid4()}.{output_format}"
 
         # Return the result as JSON
@@ -103,39 +173,17 @@ def generate_mermaid_diagram_encoded(
         }
 
 
-def sanitize_mermaid_code(mermaid_code: str) -> str:
-    """
-        Sanitize the Mermaid code by removing unnecessary whitespace and comments.
-    """
-    # Remove parentheses and comments
-    if(mermaid_code.count("\n") == 0):
-        mermaid_code = mermaid_code.replace("     ", "\n     ")    
-    mermaid_code = mermaid_code.replace("(", "").replace(
-        ")", "").replace("//", "").replace("#", "")    
-    return mermaid_code
-
-
-def save_image(response: Response, output_format: str = 'png') -> str:
+async def save_image(image_data: bytes,
+                     output_format: str = 'png',
+                     filename: Optional[str] = None) -> str:
     """
         Save the image data to a file and return the filename.
     """
-    # Get the image data
-    image_data = response.content
-
-    # Generate a unique filename using UUID
-    filename = f"{uuid.uuid4()}.{output_format}"
-
-    # Get the path to the src directory and create .files folder if it doesn't exist
-    src_dir = os.path.dirname(os.path.abspath(__file__))
-    files_dir = os.path.join(src_dir, '.files')
-    os.makedirs(files_dir, exist_ok=True)
-
-    # Set the file path inside the .files directory
-    file_path = os.path.join(files_dir, filename)
+    # Generate a unique filename using UUID unless one is given
+    filename = filename or f"{uuid.uuid4()}.{output_format}"
 
-    # Write the image data to the file
-    with open(file_path, 'wb') as f:
-        f.write(image_data)
+    # Write the image data to the .files directory off the event loop
+    await files_store.write(filename, image_data)
 
     return filename
 
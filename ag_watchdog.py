@@ -0,0 +1,221 @@
+import asyncio
+import itertools
+import json
+import os
+import sys
+import threading
+import time
+import traceback
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+from ag_telemetry import get_telemetry
+
+
+# Opt-in switch of the event loop watchdog.
+LOOP_WATCHDOG_ENABLED = os.getenv("LOOP_WATCHDOG_ENABLED", "false").lower() in ("1", "true", "yes")
+
+# Lag of the event loop reported as a stall, and interval of the heartbeat.
+LOOP_WATCHDOG_THRESHOLD_MS = float(os.getenv("LOOP_WATCHDOG_THRESHOLD_MS", 100))
+LOOP_WATCHDOG_INTERVAL_MS = float(os.getenv("LOOP_WATCHDOG_INTERVAL_MS", 20))
+
+# File the report of the stalls is written to on shutdown.
+LOOP_WATCHDOG_REPORT = os.getenv("LOOP_WATCHDOG_REPORT", os.path.join("telemetry", "loop_stalls.json"))
+
+# Frames of these files are the application's own code.
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Frames kept in the stack of each offender.
+STACK_LIMIT = 30
+
+
+class StallSite(NamedTuple):
+    # Innermost frame of the application's code, where the blocking call was made
+    app_frame: str
+    # Innermost frame of the stack, the call that was blocking
+    blocking_frame: str
+
+
+class StallStats:
+    __slots__ = ("stalls", "total", "max", "stack")
+
+    def __init__(self):
+        self.stalls = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.stack: List[str] = []
+
+
+class LoopWatchdog:
+    """
+    Detect the stalls of an event loop and find the code blocking it.
+
+    A heartbeat scheduled every `interval` seconds measures the lag of the
+    loop. A thread samples the stack of the loop's thread each time the
+    heartbeat is overdue by a multiple of `threshold`, so a stall is caught
+    while it is happening. When the loop wakes up, the lag of the stall is
+    shared among its samples and aggregated by call site: the innermost
+    frame of the application's code and the innermost frame of the stack.
+    """
+
+    def __init__(self,
+                 threshold: float = LOOP_WATCHDOG_THRESHOLD_MS / 1000,
+                 interval: float = LOOP_WATCHDOG_INTERVAL_MS / 1000,
+                 app_dir: str = APP_DIR):
+        self.threshold = threshold
+        self.interval = interval
+        self.app_dir = app_dir
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._handle: Optional[asyncio.TimerHandle] = None
+        self._loop_thread_id = 0
+        self._expected = 0.0
+        self._samples: List[traceback.StackSummary] = []
+        self._sites: Dict[StallSite, StallStats] = {}
+        self._paths: Dict[str, str] = {}
+        self.stalls = 0
+        self.total_lag = 0.0
+        self.max_lag = 0.0
+
+    def start(self) -> None:
+        """
+        Watch the running loop.
+        """
+        if self._thread is not None:
+            return
+        self.loop = asyncio.get_running_loop()
+        self._loop_thread_id = threading.get_ident()
+        self._stopped.clear()
+        self._expected = time.monotonic() + self.interval
+        self._handle = self.loop.call_later(self.interval, self._beat)
+        self._thread = threading.Thread(target=self._watch, name="loop-watchdog", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        if self._handle is not None:
+            self._handle.cancel()
+            self._handle = None
+        if self._thread is not None:
+            self._stopped.set()
+            self._thread.join()
+            self._thread = None
+
+    def _beat(self) -> None:
+        now = time.monotonic()
+        lag = now - self._expected
+        with self._lock:
+            samples, self._samples = self._samples, []
+            self._expected = now + self.interval
+        if lag >= self.threshold:
+            self._record(lag, samples)
+        self._handle = self.loop.call_later(self.interval, self._beat)
+
+    def _watch(self) -> None:
+        # Checked often enough to catch a stall soon after it passes the threshold
+        check_interval = min(self.interval, self.threshold / 4)
+        while not self._stopped.wait(check_interval):
+            with self._lock:
+                overdue = time.monotonic() - self._expected
+                if overdue < self.threshold * (len(self._samples) + 1):
+                    continue
+                frame = sys._current_frames().get(self._loop_thread_id)
+                if frame is None:
+                    continue
+                # Source lines are read when the report is built, not while the loop is stalled
+                self._samples.append(traceback.StackSummary.extract(
+                    traceback.walk_stack(frame), limit=STACK_LIMIT, lookup_lines=False))
+                del frame
+
+    def _record(self, lag: float, samples: List[traceback.StackSummary]) -> None:
+        telemetry = get_telemetry()
+        if telemetry.enabled:
+            telemetry.observe("event_loop_stall_seconds", lag)
+        sites = [self._site(stack) for stack in samples] or [(StallSite("unknown", "unknown"), [])]
+        with self._lock:
+            self.stalls += 1
+            self.total_lag += lag
+            self.max_lag = max(self.max_lag, lag)
+            # A long stall may span several call sites, each gets its share
+            share = lag / len(sites)
+            for site, stack in sites:
+                stats = self._sites.get(site)
+                if stats is None:
+                    stats = self._sites[site] = StallStats()
+                stats.stalls += 1
+                stats.total += share
+                stats.max = max(stats.max, share)
+                stats.stack = stack
+
+    def _site(self, stack: traceback.StackSummary) -> Tuple[StallSite, List[str]]:
+        # The stack was walked from the innermost frame outwards, the frames
+        # beyond the loop's iteration are not part of the blocking callback
+        stack = list(itertools.takewhile(lambda frame: frame.name != "_run_once", stack))
+        frames = [f"{frame.filename}:{frame.lineno} in {frame.name}" for frame in stack]
+        app_frame = next((frames[index] for index, frame in enumerate(stack)
+                          if self._is_app_file(frame.filename)), "outside the application")
+        blocking_frame = frames[0] if frames else "unknown"
+        return StallSite(app_frame, blocking_frame), frames
+
+    def _is_app_file(self, filename: str) -> bool:
+        path = self._paths.get(filename)
+        if path is None:
+            # Modules may be imported through a relative entry of sys.path
+            path = self._paths[filename] = "" if filename.startswith("<") else os.path.abspath(filename)
+        return path.startswith(self.app_dir) and path != os.path.abspath(__file__) \
+            and os.sep + "site-packages" + os.sep not in path
+
+    def report(self, limit: int = 20) -> Dict[str, Any]:
+        """
+        Get the stalls and the call sites that blocked the loop the longest.
+        """
+        with self._lock:
+            sites = sorted(self._sites.items(), key=lambda item: -item[1].total)[:limit]
+            return {
+                "stalls": self.stalls,
+                "total_lag_ms": round(self.total_lag * 1000, 1),
+                "max_lag_ms": round(self.max_lag * 1000, 1),
+                "threshold_ms": self.threshold * 1000,
+                "offenders": [{
+                    "app_frame": site.app_frame,
+                    "blocking_frame": site.blocking_frame,
+                    "stalls": stats.stalls,
+                    "total_ms": round(stats.total * 1000, 1),
+                    "max_ms": round(stats.max * 1000, 1),
+                    "stack": stats.stack,
+                } for site, stats in sites],
+            }
+
+    def format_report(self, limit: int = 10) -> str:
+        """
+        Get the report as text, one offender per line.
+        """
+        report = self.report(limit)
+        lines = [f"{report['stalls']} event loop stalls over {report['threshold_ms']:g} ms, "
+                 f"{report['total_lag_ms']:g} ms in total, {report['max_lag_ms']:g} ms at most"]
+        for offender in report["offenders"]:
+            lines.append(f"{offender['total_ms']:>10g} ms {offender['stalls']:>6} stalls  "
+                         f"{offender['app_frame']}  <-  {offender['blocking_frame']}")
+        return "\n".join(lines)
+
+    def write_report(self, path: str = LOOP_WATCHDOG_REPORT) -> None:
+        """
+        Write the report as JSON.
+        """
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(path, "w", encoding="utf-8") as file:
+            json.dump(self.report(), file, indent=2)
+
+
+_loop_watchdog: Optional[LoopWatchdog] = None
+
+
+def get_loop_watchdog() -> Optional[LoopWatchdog]:
+    """
+    Get the process-wide watchdog, or None when it is disabled.
+    """
+    global _loop_watchdog
+    if LOOP_WATCHDOG_ENABLED and _loop_watchdog is None:
+        _loop_watchdog = LoopWatchdog()
+    return _loop_watchdog
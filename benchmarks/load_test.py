@@ -0,0 +1,209 @@
+"""
+Load test of the multi-agent flows with simulated concurrent users.
+
+Each step of the ramp runs a number of virtual users for a fixed duration,
+every user starting a new session through the real Chainlit handlers of
+`ag_multi_agent` or `sk_multi_agent` as soon as its previous one ended,
+against the replay server standing in for the model and Kroki. The number
+of users grows at each step until the worker saturates: the throughput
+stops growing, the latency collapses or sessions fail. The throughput and
+latency of every step make the curve, printed and optionally written as CSV.
+
+    python benchmarks/load_test.py --app ag sk --max-users 256
+    python benchmarks/load_test.py --speed 0 --duration 20 --output curve.csv
+"""
+import argparse
+import asyncio
+import csv
+import math
+import os
+import sys
+import time
+from typing import Any, Dict, List, Optional
+
+from run_benchmark import (DEFAULT_FIXTURE, ROOT_DIR, App, LoopLagMonitor, configure_environment,
+                           install_scripted_user, load_app, percentile, run_session)
+from replay_server import Fixture, ReplayServer
+
+# Columns of the curve, after the app.
+CURVE_COLUMNS = ("users", "sessions", "errors", "throughput_per_s", "p50_s", "p95_s", "p99_s",
+                 "loop_blocked_ms", "max_loop_lag_ms")
+
+
+async def run_user(app: App,
+                   fixture: Fixture,
+                   start: float,
+                   deadline: float,
+                   latencies: List[float],
+                   errors: List[str]) -> None:
+    """
+    Run sessions one after the other from `start` until `deadline`.
+    """
+    await asyncio.sleep(max(0.0, start - time.perf_counter()))
+    loop = asyncio.get_running_loop()
+    release = asyncio.Event()
+    release.set()
+    while time.perf_counter() < deadline:
+        chatted = loop.create_future()
+        await run_session(app, fixture, chatted, release)
+        try:
+            latencies.append(chatted.result())
+        except Exception as e:
+            errors.append(f"{type(e).__name__}: {e}")
+
+
+async def run_step(app: App, fixture: Fixture, users: int, duration: float, ramp_up: float) -> Dict[str, Any]:
+    """
+    Run `users` virtual users for `duration` seconds and get their metrics.
+
+    The users start evenly over `ramp_up` seconds, and the sessions running
+    at the deadline are completed and counted in the throughput.
+    """
+    latencies: List[float] = []
+    errors: List[str] = []
+    monitor = LoopLagMonitor()
+    monitor.start()
+    started = time.perf_counter()
+    try:
+        await asyncio.gather(*(run_user(app, fixture, started + index * ramp_up / users, started + duration,
+                                        latencies, errors)
+                               for index in range(users)))
+    finally:
+        await monitor.stop()
+    elapsed = time.perf_counter() - started
+    return {
+        "users": users,
+        "sessions": len(latencies) + len(errors),
+        "errors": len(errors),
+        "throughput_per_s": round(len(latencies) / elapsed, 3),
+        "p50_s": round(percentile(latencies, 50), 3) if latencies else math.nan,
+        "p95_s": round(percentile(latencies, 95), 3) if latencies else math.nan,
+        "p99_s": round(percentile(latencies, 99), 3) if latencies else math.nan,
+        "loop_blocked_ms": round(monitor.blocked * 1000, 1),
+        "max_loop_lag_ms": round(monitor.max_lag * 1000, 1),
+        "first_error": errors[0] if errors else "",
+    }
+
+
+def ramp(start: int, factor: float, max_users: int) -> List[int]:
+    """
+    Get the numbers of users of the steps, growing geometrically.
+    """
+    steps = []
+    users = start
+    while users <= max_users:
+        steps.append(users)
+        users = max(users + 1, round(users * factor))
+    return steps
+
+
+def saturation(curve: List[Dict[str, Any]],
+               min_gain: float,
+               max_slowdown: float,
+               max_error_rate: float) -> Optional[str]:
+    """
+    Get why the last step of the curve is past the saturation point, or
+    None while the worker still scales.
+    """
+    last = curve[-1]
+    if last["sessions"] and last["errors"] / last["sessions"] > max_error_rate:
+        return f"{last['errors']} of {last['sessions']} sessions failed, first with {last['first_error']}"
+    if len(curve) < 2:
+        return None
+    first = curve[0]
+    if last["p95_s"] > max_slowdown * first["p95_s"]:
+        return (f"p95 latency of {last['p95_s']:g} s is over {max_slowdown:g} times "
+                f"the {first['p95_s']:g} s of {first['users']} users")
+    best = max(curve[:-1], key=lambda step: step["throughput_per_s"])
+    if last["throughput_per_s"] < best["throughput_per_s"] * (1 + min_gain):
+        return (f"throughput of {last['throughput_per_s']:g}/s is not {min_gain:.0%} over "
+                f"the {best['throughput_per_s']:g}/s of {best['users']} users")
+    return None
+
+
+def print_curve(name: str, curve: List[Dict[str, Any]]) -> None:
+    print(f"{'app':<4}" + "".join(f"{column:>18}" for column in CURVE_COLUMNS))
+    for step in curve:
+        print(f"{name:<4}" + "".join(f"{step[column]:>18g}" for column in CURVE_COLUMNS))
+
+
+def write_curves(path: str, curves: Dict[str, List[Dict[str, Any]]]) -> None:
+    with open(path, "w", encoding="utf-8", newline="") as file:
+        writer = csv.writer(file)
+        writer.writerow(("app",) + CURVE_COLUMNS)
+        for name, curve in curves.items():
+            for step in curve:
+                writer.writerow([name] + [step[column] for column in CURVE_COLUMNS])
+
+
+async def load_test(args: argparse.Namespace) -> int:
+    fixture = Fixture.load(args.fixture)
+    server = ReplayServer(fixture, speed=args.speed)
+    configure_environment(await server.start())
+    os.chdir(ROOT_DIR)
+    install_scripted_user()
+    curves: Dict[str, List[Dict[str, Any]]] = {}
+    try:
+        for name in args.app:
+            app = load_app(name)
+            # Warm the imports, connection pools and render cache up
+            await run_step(app, fixture, 1, 0, 0)
+            curves[name] = []
+            reason = None
+            for users in ramp(args.start_users, args.factor, args.max_users):
+                curves[name].append(await run_step(app, fixture, users, args.duration, args.ramp_up))
+                print_curve(name, curves[name][-1:])
+                reason = saturation(curves[name], args.min_gain, args.max_slowdown, args.max_error_rate)
+                if reason:
+                    break
+            print()
+            print_curve(name, curves[name])
+            if reason is None:
+                print(f"{name} did not saturate up to {curves[name][-1]['users']} users.")
+            elif len(curves[name]) > 1:
+                knee = curves[name][-2]
+                print(f"{name} saturates after {knee['users']} users, at {knee['throughput_per_s']:g} sessions/s "
+                      f"with a p95 latency of {knee['p95_s']:g} s: {reason}.")
+            else:
+                print(f"{name} is saturated with {curves[name][0]['users']} users: {reason}.")
+            print()
+    finally:
+        await server.close()
+
+    print(f"Replayed {server.requests} requests.")
+    if server.unmatched:
+        print(f"Requests without a recorded response: {sorted(set(server.unmatched))}")
+    if args.output:
+        write_curves(args.output, curves)
+        print(f"Curves written to {args.output}")
+    return 0
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--app", nargs="+", choices=("ag", "sk"), default=["ag"],
+                        help="apps to load")
+    parser.add_argument("--fixture", default=DEFAULT_FIXTURE, help="recorded session to replay")
+    parser.add_argument("--start-users", type=int, default=1, help="virtual users of the first step")
+    parser.add_argument("--factor", type=float, default=2.0, help="growth of the users between steps")
+    parser.add_argument("--max-users", type=int, default=512, help="virtual users of the last step")
+    parser.add_argument("--duration", type=float, default=30.0, help="seconds new sessions start in each step")
+    parser.add_argument("--ramp-up", type=float, default=5.0, help="seconds the users of a step start over")
+    parser.add_argument("--speed", type=float, default=1.0,
+                        help="replay speed of the recorded delays, 0 replays without delays")
+    parser.add_argument("--min-gain", type=float, default=0.05,
+                        help="throughput gain below which the worker is saturated")
+    parser.add_argument("--max-slowdown", type=float, default=3.0,
+                        help="p95 latency, relative to the first step, above which the worker is saturated")
+    parser.add_argument("--max-error-rate", type=float, default=0.01,
+                        help="share of failed sessions above which the worker is saturated")
+    parser.add_argument("--output", help="CSV file the curves are written to")
+    args = parser.parse_args()
+    args.fixture = os.path.abspath(args.fixture)
+    if args.output:
+        args.output = os.path.abspath(args.output)
+    return asyncio.run(load_test(args))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
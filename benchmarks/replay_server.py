@@ -0,0 +1,351 @@
+import asyncio
+import base64
+import json
+import logging
+import time
+from typing import Any, Dict, List, Optional, Set, Tuple
+import httpx
+
+
+class Fixture:
+    """
+    A recorded architecture session: the user's inputs, the model streams and the Kroki renders.
+
+    Each model response is matched to a request by a text of its system
+    message, whether the request offers tools and whether it follows a tool
+    result. Its chunks are OpenAI stream deltas, each with the delay in
+    milliseconds since the previous one, the first delay being the time to
+    first token.
+    """
+
+    def __init__(self, data: Dict[str, Any], path: Optional[str] = None):
+        self.path = path
+        self.name: str = data.get("name", "session")
+        self.prompt: str = data.get("prompt", "")
+        self.user_inputs: List[str] = data.get("user_inputs", [])
+        self.user_actions: List[str] = data.get("user_actions", [])
+        self.responses: List[Dict[str, Any]] = data.get("responses", [])
+        self.kroki: Dict[str, Dict[str, Any]] = data.get("kroki", {})
+
+    @classmethod
+    def load(cls, path: str) -> "Fixture":
+        with open(path, encoding="utf-8") as file:
+            return cls(json.load(file), path)
+
+    def save(self, path: Optional[str] = None) -> None:
+        data = {
+            "name": self.name,
+            "prompt": self.prompt,
+            "user_inputs": self.user_inputs,
+            "user_actions": self.user_actions,
+            "responses": self.responses,
+            "kroki": self.kroki,
+        }
+        with open(path or self.path, "w", encoding="utf-8") as file:
+            json.dump(data, file, indent=2, ensure_ascii=False)
+
+    def match(self, body: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """
+        Get the recorded response of a chat completion request.
+        """
+        system, has_tools, after_tool = request_key(body)
+        for response in self.responses:
+            if (response["system"] in system
+                    and response.get("tools", has_tools) == has_tools
+                    and response.get("after_tool", False) == after_tool):
+                return response
+        return None
+
+
+def content_text(content: Any) -> str:
+    if isinstance(content, list):
+        return "\n".join(part.get("text", "") for part in content if isinstance(part, dict))
+    return content or ""
+
+
+def request_key(body: Dict[str, Any]) -> Tuple[str, bool, bool]:
+    """
+    Get the system message of a request, whether it offers tools and whether it follows a tool result.
+    """
+    messages = body.get("messages") or []
+    system = "\n".join(content_text(message.get("content")) for message in messages
+                       if message.get("role") in ("system", "developer"))
+    after_tool = bool(messages) and messages[-1].get("role") == "tool"
+    return system, bool(body.get("tools")), after_tool
+
+
+class ReplayServer:
+    """
+    Local server replaying a fixture as an OpenAI-compatible chat completions endpoint and as Kroki.
+
+    Streams are replayed with their recorded chunk delays, scaled by
+    `speed`. With `upstream_model_url` and `upstream_kroki_url` the server
+    records instead: requests are forwarded upstream, the answers relayed as
+    they arrive and added to the fixture.
+    """
+
+    def __init__(self,
+                 fixture: Fixture,
+                 host: str = "127.0.0.1",
+                 port: int = 0,
+                 speed: float = 1.0,
+                 upstream_model_url: Optional[str] = None,
+                 upstream_kroki_url: Optional[str] = None):
+        self.fixture = fixture
+        self.host = host
+        self.port = port
+        self.speed = speed
+        self.upstream_model_url = upstream_model_url
+        self.upstream_kroki_url = upstream_kroki_url
+        self.server: Optional[asyncio.AbstractServer] = None
+        self.upstream: Optional[httpx.AsyncClient] = None
+        self.connections: Set[asyncio.StreamWriter] = set()
+        self.requests = 0
+        self.unmatched: List[str] = []
+
+    @property
+    def url(self) -> str:
+        return f"http://{self.host}:{self.port}"
+
+    async def start(self) -> str:
+        """
+        Start listening and get the base URL of the server.
+        """
+        self.server = await asyncio.start_server(self._serve, self.host, self.port, limit=2 ** 20)
+        self.port = self.server.sockets[0].getsockname()[1]
+        if self.upstream_model_url or self.upstream_kroki_url:
+            self.upstream = httpx.AsyncClient(timeout=120)
+        return self.url
+
+    async def close(self) -> None:
+        if self.server is not None:
+            self.server.close()
+            # Kept-alive connections would keep their handlers waiting
+            for writer in list(self.connections):
+                writer.close()
+            await self.server.wait_closed()
+            self.server = None
+        if self.upstream is not None:
+            await self.upstream.aclose()
+            self.upstream = None
+
+    def stats(self) -> Dict[str, int]:
+        return {"requests": self.requests, "unmatched": len(self.unmatched)}
+
+    async def _serve(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        self.connections.add(writer)
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line.strip():
+                    break
+                method, target, _ = request_line.decode("latin-1").split(" ", 2)
+                headers: Dict[str, str] = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                body = await read_body(reader, headers)
+                self.requests += 1
+                await self._route(method, target.split("?", 1)[0], headers, body, writer)
+                if headers.get("connection", "").lower() == "close":
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, asyncio.CancelledError):
+            # Clients going away, or the server closing
+            pass
+        finally:
+            self.connections.discard(writer)
+            writer.close()
+
+    async def _route(self,
+                     method: str,
+                     path: str,
+                     headers: Dict[str, str],
+                     body: bytes,
+                     writer: asyncio.StreamWriter) -> None:
+        if method == "POST" and path.endswith("/chat/completions"):
+            request = json.loads(body or b"{}")
+            if self.upstream_model_url:
+                # The clients' own credentials are forwarded upstream
+                credentials = {name: headers[name] for name in ("authorization", "api-key") if name in headers}
+                await self._record_completion(request, credentials, writer)
+            else:
+                await self._replay_completion(request, writer)
+            return
+        parts = path.strip("/").split("/")
+        if method == "POST" and len(parts) == 2:
+            await self._kroki(path.strip("/"), body, writer)
+            return
+        await send_response(writer, 404, b'{"error": "not found"}')
+
+    async def _replay_completion(self, request: Dict[str, Any], writer: asyncio.StreamWriter) -> None:
+        response = self.fixture.match(request)
+        if response is None:
+            system, has_tools, after_tool = request_key(request)
+            self.unmatched.append(system.strip().split("\n", 1)[0][:80])
+            logging.warning(f"No recorded response for request (tools={has_tools}, after_tool={after_tool})")
+            await send_response(writer, 400, b'{"error": {"message": "No recorded response"}}')
+            return
+
+        model = request.get("model", "replay")
+        finish_reason = "tool_calls" if any("tool_calls" in delta for _, delta in response["chunks"]) else "stop"
+        if not request.get("stream"):
+            await self._sleep(sum(delay for delay, _ in response["chunks"]))
+            await send_response(writer, 200, json.dumps(completion(model, response, finish_reason)).encode())
+            return
+
+        await start_stream(writer)
+        for delay, delta in response["chunks"]:
+            await self._sleep(delay)
+            await write_event(writer, chunk(model, delta))
+        last = chunk(model, {}, finish_reason)
+        if response.get("usage"):
+            last["usage"] = response["usage"]
+        await write_event(writer, last)
+        await write_event(writer, "[DONE]")
+        await end_stream(writer)
+
+    async def _record_completion(self,
+                                 request: Dict[str, Any],
+                                 credentials: Dict[str, str],
+                                 writer: asyncio.StreamWriter) -> None:
+        system, has_tools, after_tool = request_key(request)
+        first_line = next((line.strip() for line in system.splitlines() if line.strip()), "")
+        chunks: List[Tuple[float, Dict[str, Any]]] = []
+        usage = None
+        url = self.upstream_model_url.rstrip("/") + "/chat/completions"
+        last = time.perf_counter()
+        async with self.upstream.stream("POST", url, json=request, headers=credentials) as upstream:
+            if not request.get("stream") or upstream.status_code != 200:
+                body = await upstream.aread()
+                await send_response(writer, upstream.status_code, body)
+                if upstream.status_code == 200:
+                    message = json.loads(body)["choices"][0]["message"]
+                    delta = {key: value for key, value in message.items() if value is not None}
+                    chunks.append((round((time.perf_counter() - last) * 1000, 1), delta))
+                    usage = json.loads(body).get("usage")
+            else:
+                await start_stream(writer)
+                async for line in upstream.aiter_lines():
+                    if not line.startswith("data:"):
+                        continue
+                    data = line[5:].strip()
+                    await write_event(writer, data)
+                    if data == "[DONE]":
+                        continue
+                    event = json.loads(data)
+                    usage = event.get("usage") or usage
+                    for choice in event.get("choices") or []:
+                        delta = {key: value for key, value in (choice.get("delta") or {}).items()
+                                 if value is not None}
+                        if delta:
+                            now = time.perf_counter()
+                            chunks.append((round((now - last) * 1000, 1), delta))
+                            last = now
+                await end_stream(writer)
+        if chunks and self.fixture.match(request) is None:
+            response: Dict[str, Any] = {"system": first_line, "tools": has_tools, "after_tool": after_tool,
+                                        "chunks": chunks}
+            if usage:
+                response["usage"] = usage
+            self.fixture.responses.append(response)
+
+    async def _kroki(self, key: str, body: bytes, writer: asyncio.StreamWriter) -> None:
+        if self.upstream_kroki_url:
+            started = time.perf_counter()
+            upstream = await self.upstream.post(f"{self.upstream_kroki_url.rstrip('/')}/{key}", content=body)
+            if upstream.status_code == 200 and key not in self.fixture.kroki:
+                self.fixture.kroki[key] = {"delay_ms": round((time.perf_counter() - started) * 1000, 1),
+                                           "body": base64.b64encode(upstream.content).decode("ascii")}
+            await send_response(writer, upstream.status_code, upstream.content, "image/png")
+            return
+        render = self.fixture.kroki.get(key)
+        if render is None:
+            self.unmatched.append(key)
+            await send_response(writer, 400, b"No recorded render")
+            return
+        await self._sleep(render.get("delay_ms", 0))
+        await send_response(writer, 200, base64.b64decode(render["body"]), "image/png")
+
+    async def _sleep(self, delay_ms: float) -> None:
+        if self.speed > 0 and delay_ms > 0:
+            await asyncio.sleep(delay_ms / 1000 / self.speed)
+
+
+def chunk(model: str, delta: Dict[str, Any], finish_reason: Optional[str] = None) -> Dict[str, Any]:
+    return {
+        "id": "chatcmpl-replay",
+        "object": "chat.completion.chunk",
+        "created": int(time.time()),
+        "model": model,
+        "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+    }
+
+
+def completion(model: str, response: Dict[str, Any], finish_reason: str) -> Dict[str, Any]:
+    """
+    Assemble the chunks of a recorded stream into a non-streamed completion.
+    """
+    content = "".join(delta.get("content") or "" for _, delta in response["chunks"])
+    tool_calls: Dict[int, Dict[str, Any]] = {}
+    for _, delta in response["chunks"]:
+        for call in delta.get("tool_calls") or []:
+            merged = tool_calls.setdefault(call.get("index", 0), {
+                "id": call.get("id"), "type": "function", "function": {"name": "", "arguments": ""}})
+            merged["id"] = call.get("id") or merged["id"]
+            merged["function"]["name"] += (call.get("function") or {}).get("name") or ""
+            merged["function"]["arguments"] += (call.get("function") or {}).get("arguments") or ""
+    message: Dict[str, Any] = {"role": "assistant", "content": content or None}
+    if tool_calls:
+        message["tool_calls"] = [tool_calls[index] for index in sorted(tool_calls)]
+    return {
+        "id": "chatcmpl-replay",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": model,
+        "choices": [{"index": 0, "message": message, "finish_reason": finish_reason}],
+        "usage": response.get("usage") or {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0},
+    }
+
+
+async def read_body(reader: asyncio.StreamReader, headers: Dict[str, str]) -> bytes:
+    if "content-length" in headers:
+        return await reader.readexactly(int(headers["content-length"]))
+    if headers.get("transfer-encoding", "").lower() == "chunked":
+        body = b""
+        while True:
+            size = int((await reader.readline()).split(b";")[0], 16)
+            if size == 0:
+                await reader.readline()
+                return body
+            body += await reader.readexactly(size)
+            await reader.readline()
+    return b""
+
+
+async def send_response(writer: asyncio.StreamWriter,
+                        status: int,
+                        body: bytes,
+                        content_type: str = "application/json") -> None:
+    writer.write(f"HTTP/1.1 {status} {'OK' if status == 200 else 'Error'}\r\n"
+                 f"Content-Type: {content_type}\r\n"
+                 f"Content-Length: {len(body)}\r\n\r\n".encode("latin-1") + body)
+    await writer.drain()
+
+
+async def start_stream(writer: asyncio.StreamWriter) -> None:
+    writer.write(b"HTTP/1.1 200 OK\r\nContent-Type: text/event-stream\r\nTransfer-Encoding: chunked\r\n\r\n")
+    await writer.drain()
+
+
+async def write_event(writer: asyncio.StreamWriter, data: Any) -> None:
+    payload = f"data: {data if isinstance(data, str) else json.dumps(data)}\n\n".encode("utf-8")
+    writer.write(f"{len(payload):x}\r\n".encode("latin-1") + payload + b"\r\n")
+    await writer.drain()
+
+
+async def end_stream(writer: asyncio.StreamWriter) -> None:
+    writer.write(b"0\r\n\r\n")
+    await writer.drain()
@@ -0,0 +1,419 @@
+"""
+Offline benchmark of the multi-agent flows.
+
+Recorded model streams and Kroki renders are replayed by a local server
+while the real Chainlit handlers of `ag_multi_agent` and `sk_multi_agent`
+run the sessions, with the user's answers scripted. Each level of
+concurrency reports the end-to-end latency percentiles, the time the event
+loop was blocked, the memory held per session and the throughput, compared
+with the stored baseline.
+
+    python benchmarks/run_benchmark.py --app ag sk --users 1 4 16
+    python benchmarks/run_benchmark.py --update-baseline
+    python benchmarks/run_benchmark.py --users 16 --watchdog
+    python benchmarks/run_benchmark.py --record new_session.json --prompt "..." --input "..." --action approve
+"""
+import argparse
+import asyncio
+import gc
+import json
+import math
+import os
+import sys
+import time
+import tracemalloc
+from contextvars import ContextVar
+from typing import Any, Awaitable, Callable, Dict, List, NamedTuple, Optional, Tuple
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.dirname(BENCHMARKS_DIR)
+sys.path.insert(0, ROOT_DIR)
+
+from ag_watchdog import LoopWatchdog
+from replay_server import Fixture, ReplayServer
+
+DEFAULT_FIXTURE = os.path.join(BENCHMARKS_DIR, "fixtures", "ai_assistant.json")
+DEFAULT_BASELINE = os.path.join(BENCHMARKS_DIR, "baseline.json")
+
+# Metrics compared with the baseline: whether higher is better, and the
+# smallest absolute change worth reporting, below which runs are noise.
+COMPARED_METRICS = {
+    "p50_s": (False, 0.05),
+    "p95_s": (False, 0.05),
+    "throughput_per_s": (True, 0.0),
+    "loop_blocked_ms": (False, 20.0),
+    "memory_per_session_kb": (False, 64.0),
+}
+
+# OAuth settings the apps need to register their callback, never used offline.
+OAUTH_PLACEHOLDERS = ("OAUTH_AZURE_AD_CLIENT_ID", "OAUTH_AZURE_AD_CLIENT_SECRET", "OAUTH_AZURE_AD_TENANT_ID")
+
+
+class ScriptedUser:
+    """
+    The answers and actions a simulated user gives when the agents ask.
+    """
+
+    def __init__(self, inputs: List[str], actions: List[str]):
+        self.inputs = list(inputs)
+        self.actions = list(actions)
+
+    def next_input(self) -> Optional[str]:
+        return self.inputs.pop(0) if self.inputs else None
+
+    def next_action(self) -> Optional[str]:
+        return self.actions.pop(0) if self.actions else None
+
+
+# User of the session running in the current task.
+_scripted_user: ContextVar[ScriptedUser] = ContextVar("scripted_user")
+
+
+class ScriptedAskUserMessage:
+    """
+    Stand-in for `cl.AskUserMessage` answering with the scripted user's next input.
+    """
+
+    def __init__(self, content: str = "", timeout: int = 60, **kwargs):
+        self.content = content
+
+    async def send(self) -> Optional[Dict[str, str]]:
+        answer = _scripted_user.get().next_input()
+        return {"output": answer} if answer is not None else None
+
+
+class ScriptedAskActionMessage:
+    """
+    Stand-in for `cl.AskActionMessage` picking the scripted user's next action.
+    """
+
+    def __init__(self, content: str = "", actions: Any = (), timeout: int = 60, **kwargs):
+        self.content = content
+
+    async def send(self) -> Optional[Dict[str, Any]]:
+        value = _scripted_user.get().next_action()
+        return {"name": value, "payload": {"value": value}} if value else None
+
+
+class App(NamedTuple):
+    name: str
+    start: Callable[[], Awaitable[None]]
+    chat: Callable[[Any], Awaitable[None]]
+    end: Optional[Callable[[], Awaitable[None]]]
+    # Whether the user's answers are sent as messages rather than asked for by an agent
+    inputs_as_messages: bool
+
+
+def configure_environment(server_url: str, recording: bool = False) -> None:
+    """
+    Point the model clients and Kroki at the replay server, before the apps are imported.
+    """
+    os.environ["AZURE_OPENAI_ENDPOINT"] = server_url
+    os.environ["KROKI_URL"] = server_url
+    os.environ["DIAGRAM_RENDER_BACKEND"] = "kroki"
+    if not recording:
+        os.environ["GITHUB_TOKEN"] = "benchmark"
+    for name in OAUTH_PLACEHOLDERS:
+        os.environ.setdefault(name, "benchmark")
+
+
+def install_scripted_user() -> None:
+    """
+    Replace the Chainlit prompts with the scripted user's answers.
+    """
+    import chainlit as cl
+    cl.AskUserMessage = ScriptedAskUserMessage  # type: ignore
+    cl.AskActionMessage = ScriptedAskActionMessage  # type: ignore
+
+
+def load_app(name: str) -> App:
+    """
+    Get the chat handlers of an app.
+    """
+    if name == "ag":
+        import ag_multi_agent
+        return App(name, ag_multi_agent.start_chat, ag_multi_agent.chat, ag_multi_agent.end_chat, False)
+    if name == "sk":
+        import sk_multi_agent
+        return App(name, sk_multi_agent.on_chat_start, sk_multi_agent.chat, None, True)
+    raise ValueError(f"Unknown app: {name}")
+
+
+async def run_session(app: App,
+                      fixture: Fixture,
+                      chatted: "asyncio.Future[float]",
+                      release: asyncio.Event) -> None:
+    """
+    Run one simulated session in its own Chainlit context.
+
+    The chat latency is set on `chatted` once the session has been
+    answered; the session is ended when `release` is set, so that the state
+    of every session is held while the memory is measured.
+    """
+    import chainlit as cl
+    from chainlit.context import init_http_context
+    try:
+        init_http_context()
+        _scripted_user.set(ScriptedUser(fixture.user_inputs, fixture.user_actions))
+        started = time.perf_counter()
+        await app.start()
+        await app.chat(cl.Message(content=fixture.prompt))
+        if app.inputs_as_messages:
+            for answer in fixture.user_inputs:
+                await app.chat(cl.Message(content=answer))
+        chatted.set_result(time.perf_counter() - started)
+    except Exception as e:
+        if not chatted.done():
+            chatted.set_exception(e)
+        return
+    await release.wait()
+    if app.end is not None:
+        await app.end()
+
+
+class LoopLagMonitor:
+    """
+    Measure how long the event loop was blocked, from the lateness of a periodic wake-up.
+    """
+
+    def __init__(self, interval: float = 0.01, threshold: float = 0.002):
+        self.interval = interval
+        self.threshold = threshold
+        self.blocked = 0.0
+        self.max_lag = 0.0
+        self.task: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        self.task = asyncio.ensure_future(self._run())
+
+    async def stop(self) -> None:
+        if self.task is not None:
+            self.task.cancel()
+            await asyncio.gather(self.task, return_exceptions=True)
+            self.task = None
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            expected = loop.time() + self.interval
+            await asyncio.sleep(self.interval)
+            lag = loop.time() - expected
+            if lag > self.threshold:
+                self.blocked += lag
+                self.max_lag = max(self.max_lag, lag)
+
+
+def percentile(values: List[float], q: float) -> float:
+    """
+    Get the nearest-rank percentile of values.
+    """
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(q / 100 * len(ordered)) - 1)]
+
+
+async def run_wave(app: App, fixture: Fixture, users: int, measure_memory: bool = False) -> Tuple[List[float], float]:
+    """
+    Run `users` concurrent sessions and get their latencies, with the wall
+    time of the wave or, when `measure_memory` is set, the memory held per
+    session while they are all open.
+    """
+    loop = asyncio.get_running_loop()
+    if measure_memory:
+        gc.collect()
+        tracemalloc.start()
+    release = asyncio.Event()
+    chatted = [loop.create_future() for _ in range(users)]
+    started = time.perf_counter()
+    sessions = [asyncio.ensure_future(run_session(app, fixture, future, release)) for future in chatted]
+    try:
+        latencies = await asyncio.gather(*chatted)
+        measure = time.perf_counter() - started
+        if measure_memory:
+            gc.collect()
+            measure = tracemalloc.get_traced_memory()[0] / users
+    finally:
+        if measure_memory:
+            tracemalloc.stop()
+        release.set()
+        await asyncio.gather(*sessions, return_exceptions=True)
+    return list(latencies), measure
+
+
+async def run_level(app: App, fixture: Fixture, users: int, rounds: int,
+                    watchdog: Optional[LoopWatchdog] = None) -> Dict[str, float]:
+    """
+    Run `rounds` waves of `users` concurrent sessions and get their metrics.
+
+    Memory is traced in one more wave, tracing slows the event loop down
+    too much to time the others. The stalls are reported to `watchdog`
+    during the timed waves only.
+    """
+    latencies: List[float] = []
+    chat_time = 0.0
+    monitor = LoopLagMonitor()
+    monitor.start()
+    if watchdog is not None:
+        watchdog.start()
+    try:
+        for _ in range(rounds):
+            wave_latencies, elapsed = await run_wave(app, fixture, users)
+            latencies.extend(wave_latencies)
+            chat_time += elapsed
+    finally:
+        await monitor.stop()
+        if watchdog is not None:
+            watchdog.stop()
+    _, memory = await run_wave(app, fixture, users, measure_memory=True)
+    return {
+        "sessions": len(latencies),
+        "p50_s": round(percentile(latencies, 50), 3),
+        "p95_s": round(percentile(latencies, 95), 3),
+        "p99_s": round(percentile(latencies, 99), 3),
+        "mean_s": round(sum(latencies) / len(latencies), 3),
+        "throughput_per_s": round(len(latencies) / chat_time, 3),
+        "loop_blocked_ms": round(monitor.blocked * 1000, 1),
+        "max_loop_lag_ms": round(monitor.max_lag * 1000, 1),
+        "memory_per_session_kb": round(memory / 1024, 1),
+    }
+
+
+def compare(results: Dict[str, Dict[str, Dict[str, float]]],
+            baseline: Dict[str, Any],
+            tolerance: float) -> List[str]:
+    """
+    Get the metrics that regressed by more than `tolerance` against the baseline.
+    """
+    regressions = []
+    for app, levels in results.items():
+        for users, metrics in levels.items():
+            reference = baseline.get(app, {}).get(users)
+            if not reference:
+                continue
+            for metric, (higher_is_better, noise) in COMPARED_METRICS.items():
+                old, new = reference.get(metric), metrics.get(metric)
+                if old is None or new is None or abs(new - old) <= noise:
+                    continue
+                change = (new - old) / old if old else math.inf
+                if (change < -tolerance) if higher_is_better else (change > tolerance):
+                    regressions.append(f"{app} at {users} users: {metric} {old:g} -> {new:g} ({change:+.0%})")
+    return regressions
+
+
+def print_results(results: Dict[str, Dict[str, Dict[str, float]]]) -> None:
+    columns = ("sessions", "p50_s", "p95_s", "p99_s", "throughput_per_s", "loop_blocked_ms",
+               "max_loop_lag_ms", "memory_per_session_kb")
+    print(f"{'app':<4}{'users':>6}" + "".join(f"{column:>22}" for column in columns))
+    for app, levels in results.items():
+        for users, metrics in levels.items():
+            print(f"{app:<4}{users:>6}" + "".join(f"{metrics[column]:>22g}" for column in columns))
+
+
+async def benchmark(args: argparse.Namespace) -> int:
+    fixture = Fixture.load(args.fixture)
+    server = ReplayServer(fixture, speed=args.speed)
+    configure_environment(await server.start())
+    os.chdir(ROOT_DIR)
+    install_scripted_user()
+    results: Dict[str, Dict[str, Dict[str, float]]] = {}
+    watchdog = LoopWatchdog(threshold=args.watchdog_threshold / 1000) if args.watchdog else None
+    try:
+        for name in args.app:
+            app = load_app(name)
+            # Warm the imports, connection pools and render cache up
+            for _ in range(args.warmup):
+                await run_wave(app, fixture, 1)
+            results[name] = {}
+            for users in args.users:
+                results[name][str(users)] = await run_level(app, fixture, users, args.rounds, watchdog)
+    finally:
+        await server.close()
+
+    print_results(results)
+    if watchdog is not None:
+        print(watchdog.format_report())
+    print(f"Replayed {server.requests} requests.")
+    if server.unmatched:
+        print(f"Requests without a recorded response: {sorted(set(server.unmatched))}")
+    if args.update_baseline:
+        with open(args.baseline, "w", encoding="utf-8") as file:
+            json.dump({"fixture": fixture.name, **results}, file, indent=2)
+        print(f"Baseline written to {args.baseline}")
+        return 0
+    if not os.path.exists(args.baseline):
+        print("No baseline to compare with, run with --update-baseline to store one.")
+        return 0
+    with open(args.baseline, encoding="utf-8") as file:
+        baseline = json.load(file)
+    if baseline.get("fixture") != fixture.name:
+        print(f"The baseline was recorded with the {baseline.get('fixture')} fixture, not compared.")
+        return 0
+    regressions = compare(results, baseline, args.tolerance)
+    for regression in regressions:
+        print(f"REGRESSION {regression}")
+    if not regressions:
+        print(f"No regression beyond {args.tolerance:.0%} against the baseline.")
+    return 1 if regressions else 0
+
+
+async def record(args: argparse.Namespace) -> int:
+    from dotenv import load_dotenv
+    load_dotenv(os.path.join(ROOT_DIR, ".env"))
+    fixture = Fixture({"name": os.path.splitext(os.path.basename(args.record))[0],
+                       "prompt": args.prompt, "user_inputs": args.input, "user_actions": args.action},
+                      args.record)
+    server = ReplayServer(fixture,
+                          upstream_model_url=os.environ["AZURE_OPENAI_ENDPOINT"],
+                          upstream_kroki_url=os.getenv("KROKI_URL", "https://kroki.io"))
+    configure_environment(await server.start(), recording=True)
+    os.chdir(ROOT_DIR)
+    install_scripted_user()
+    try:
+        for name in args.app:
+            app = load_app(name)
+            loop = asyncio.get_running_loop()
+            chatted = loop.create_future()
+            release = asyncio.Event()
+            release.set()
+            await run_session(app, fixture, chatted, release)
+            await chatted
+    finally:
+        await server.close()
+    fixture.save()
+    print(f"Recorded {len(fixture.responses)} model responses and {len(fixture.kroki)} renders to {args.record}")
+    return 0
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--app", nargs="+", choices=("ag", "sk"), default=["ag"],
+                        help="apps to run, the AutoGen and the Semantic Kernel one")
+    parser.add_argument("--fixture", default=DEFAULT_FIXTURE, help="recorded session to replay")
+    parser.add_argument("--users", nargs="+", type=int, default=[1, 4, 16],
+                        help="numbers of concurrent simulated users")
+    parser.add_argument("--rounds", type=int, default=3, help="waves of sessions per number of users")
+    parser.add_argument("--warmup", type=int, default=1, help="sessions run before measuring")
+    parser.add_argument("--speed", type=float, default=1.0,
+                        help="replay speed of the recorded delays, 0 replays without delays")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE, help="stored results to compare with")
+    parser.add_argument("--update-baseline", action="store_true", help="store the results as the baseline")
+    parser.add_argument("--tolerance", type=float, default=0.15, help="relative change reported as regression")
+    parser.add_argument("--watchdog", action="store_true", help="report the code blocking the event loop")
+    parser.add_argument("--watchdog-threshold", type=float, default=20,
+                        help="event loop lag, in milliseconds, reported as a stall")
+    parser.add_argument("--record", metavar="FIXTURE",
+                        help="record a live session to this fixture file instead of benchmarking")
+    parser.add_argument("--prompt", default="Design an AI assistant with frontend, backend, and database integration.",
+                        help="first message of the recorded session")
+    parser.add_argument("--input", action="append", default=[], help="scripted answer of the recorded session")
+    parser.add_argument("--action", action="append", default=[], help="scripted action of the recorded session")
+    args = parser.parse_args()
+    args.fixture = os.path.abspath(args.fixture)
+    args.baseline = os.path.abspath(args.baseline)
+    if args.record:
+        args.record = os.path.abspath(args.record)
+        return asyncio.run(record(args))
+    return asyncio.run(benchmark(args))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,368 @@
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import ssl
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Any, Dict, List, Mapping, Optional, Tuple, Union
+from urllib.parse import unquote, urlparse
+import chainlit as cl
+
+logger = logging.getLogger(__name__)
+
+# Backend of the session states: "memory", "sqlite" or "redis".
+SESSION_STORE_BACKEND = os.getenv("SESSION_STORE_BACKEND", "memory").lower()
+
+# Database file of the SQLite backend, shared by the workers of a node.
+SESSION_STORE_PATH = os.getenv("SESSION_STORE_PATH", os.path.join(".sessions", "sessions.db"))
+
+# Server of the Redis backend, any server speaking the Redis protocol.
+SESSION_STORE_URL = os.getenv("SESSION_STORE_URL", "redis://localhost:6379/0")
+
+# Seconds an idle session can be resumed for.
+SESSION_STORE_TTL = float(os.getenv("SESSION_STORE_TTL", 24 * 3600))
+
+# Sessions kept by the in-memory backend.
+SESSION_STORE_MAX_ENTRIES = int(os.getenv("SESSION_STORE_MAX_ENTRIES", 1000))
+
+# Prefix of the session keys in a Redis server shared with other applications.
+REDIS_KEY_PREFIX = "architect:session:"
+
+
+class SessionStore(ABC):
+    """
+    Interface of the stores holding the state of the chat sessions, so that
+    any worker can resume any session.
+
+    The states are JSON documents. A failing store is logged and treated as
+    empty, the session then carries on with the state held by its worker.
+    """
+
+    name: str = "store"
+
+    def __init__(self):
+        self.loads = 0
+        self.hits = 0
+        self.saves = 0
+        self.errors = 0
+
+    @abstractmethod
+    async def get(self, session_id: str) -> Optional[str]:
+        """
+        Get the serialized state of a session.
+        """
+
+    @abstractmethod
+    async def set(self, session_id: str, value: str) -> None:
+        """
+        Store the serialized state of a session.
+        """
+
+    @abstractmethod
+    async def delete(self, session_id: str) -> None:
+        """
+        Forget the state of a session.
+        """
+
+    async def close(self) -> None:
+        """
+        Release the connections of the store.
+        """
+
+    async def load(self, session_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Load the state of a session, or None when it has none.
+        """
+        self.loads += 1
+        try:
+            value = await self.get(session_id)
+        except Exception as e:
+            self.errors += 1
+            logger.warning("Could not load session %s from the %s store: %s", session_id, self.name, e)
+            return None
+        if value is None:
+            return None
+        self.hits += 1
+        return json.loads(value)
+
+    async def save(self, session_id: str, state: Mapping[str, Any]) -> None:
+        """
+        Save the state of a session.
+        """
+        try:
+            await self.set(session_id, json.dumps(state))
+            self.saves += 1
+        except Exception as e:
+            self.errors += 1
+            logger.warning("Could not save session %s to the %s store: %s", session_id, self.name, e)
+
+    def stats(self) -> Dict[str, int]:
+        """
+        Get the store counters.
+        """
+        return {
+            "loads": self.loads,
+            "hits": self.hits,
+            "saves": self.saves,
+            "errors": self.errors,
+        }
+
+
+class MemorySessionStore(SessionStore):
+    """
+    Keep the sessions in the worker's memory, with a time to live and
+    least-recently-used eviction once it holds `max_entries` sessions.
+    Only the worker that saved a session can resume it.
+    """
+
+    name = "memory"
+
+    def __init__(self, ttl: float = SESSION_STORE_TTL, max_entries: int = SESSION_STORE_MAX_ENTRIES):
+        super().__init__()
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.entries: "OrderedDict[str, Tuple[float, str]]" = OrderedDict()
+
+    async def get(self, session_id: str) -> Optional[str]:
+        entry = self.entries.get(session_id)
+        if entry is not None and entry[0] > time.monotonic():
+            self.entries.move_to_end(session_id)
+            return entry[1]
+        self.entries.pop(session_id, None)
+        return None
+
+    async def set(self, session_id: str, value: str) -> None:
+        self.entries.pop(session_id, None)
+        self.entries[session_id] = (time.monotonic() + self.ttl, value)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    async def delete(self, session_id: str) -> None:
+        self.entries.pop(session_id, None)
+
+
+class SqliteSessionStore(SessionStore):
+    """
+    Keep the sessions in a SQLite database, shared by the workers of a node.
+    """
+
+    name = "sqlite"
+
+    def __init__(self, path: str = SESSION_STORE_PATH, ttl: float = SESSION_STORE_TTL):
+        super().__init__()
+        self.path = path
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._connection: Optional[sqlite3.Connection] = None
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._connection is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            connection = sqlite3.connect(self.path, timeout=10, check_same_thread=False, isolation_level=None)
+            # Readers of other workers are not blocked by a write
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("CREATE TABLE IF NOT EXISTS sessions "
+                               "(id TEXT PRIMARY KEY, state TEXT NOT NULL, expires REAL NOT NULL)")
+            connection.execute("CREATE INDEX IF NOT EXISTS sessions_expires ON sessions (expires)")
+            self._connection = connection
+        return self._connection
+
+    def _execute(self, sql: str, parameters: Tuple = ()) -> List[Tuple]:
+        with self._lock:
+            return self._connect().execute(sql, parameters).fetchall()
+
+    async def get(self, session_id: str) -> Optional[str]:
+        rows = await asyncio.to_thread(self._execute, "SELECT state FROM sessions WHERE id = ? AND expires > ?",
+                                       (session_id, time.time()))
+        return rows[0][0] if rows else None
+
+    async def set(self, session_id: str, value: str) -> None:
+        await asyncio.to_thread(self._store, session_id, value)
+
+    def _store(self, session_id: str, value: str) -> None:
+        now = time.time()
+        with self._lock:
+            connection = self._connect()
+            connection.execute("INSERT OR REPLACE INTO sessions VALUES (?, ?, ?)", (session_id, value, now + self.ttl))
+            connection.execute("DELETE FROM sessions WHERE expires <= ?", (now,))
+
+    async def delete(self, session_id: str) -> None:
+        await asyncio.to_thread(self._execute, "DELETE FROM sessions WHERE id = ?", (session_id,))
+
+    async def close(self) -> None:
+        with self._lock:
+            if self._connection is not None:
+                self._connection.close()
+                self._connection = None
+
+
+class RedisError(Exception):
+    """
+    Error replied by the Redis server.
+    """
+
+
+class RedisConnection:
+    """
+    Connection speaking the subset of the Redis protocol the store needs.
+    """
+
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.reader = reader
+        self.writer = writer
+
+    @classmethod
+    async def open(cls, url: str) -> "RedisConnection":
+        parsed = urlparse(url)
+        if parsed.scheme not in ("redis", "rediss"):
+            raise ValueError(f"Unsupported session store URL: {url}")
+        reader, writer = await asyncio.open_connection(
+            parsed.hostname or "localhost", parsed.port or 6379,
+            ssl=ssl.create_default_context() if parsed.scheme == "rediss" else None)
+        connection = cls(reader, writer)
+        try:
+            if parsed.password:
+                credentials = [unquote(parsed.username)] if parsed.username else []
+                await connection.execute("AUTH", *credentials, unquote(parsed.password))
+            database = parsed.path.strip("/")
+            if database and database != "0":
+                await connection.execute("SELECT", database)
+        except Exception:
+            connection.close()
+            raise
+        return connection
+
+    async def execute(self, *args: Union[str, bytes, int]) -> Any:
+        """
+        Send a command and get its reply.
+        """
+        parts = [b"*%d\r\n" % len(args)]
+        for arg in args:
+            data = arg if isinstance(arg, bytes) else str(arg).encode("utf-8")
+            parts.append(b"$%d\r\n%s\r\n" % (len(data), data))
+        self.writer.write(b"".join(parts))
+        await self.writer.drain()
+        return await self._read_reply()
+
+    async def _read_reply(self) -> Any:
+        line = await self.reader.readline()
+        if not line.endswith(b"\r\n"):
+            raise ConnectionError("Connection closed by the Redis server")
+        kind, payload = line[:1], line[1:-2]
+        if kind == b"+":
+            return payload.decode("utf-8")
+        if kind == b"-":
+            raise RedisError(payload.decode("utf-8"))
+        if kind == b":":
+            return int(payload)
+        if kind == b"$":
+            length = int(payload)
+            return None if length < 0 else (await self.reader.readexactly(length + 2))[:-2]
+        if kind == b"*":
+            count = int(payload)
+            return None if count < 0 else [await self._read_reply() for _ in range(count)]
+        raise RedisError(f"Unexpected reply: {line!r}")
+
+    def close(self) -> None:
+        self.writer.close()
+
+
+class RedisSessionStore(SessionStore):
+    """
+    Keep the sessions in a Redis server, or any server speaking its protocol,
+    shared by the workers of every node. Expired sessions are dropped by the
+    server.
+    """
+
+    name = "redis"
+
+    def __init__(self, url: str = SESSION_STORE_URL, ttl: float = SESSION_STORE_TTL, max_idle: int = 8):
+        super().__init__()
+        self.url = url
+        self.ttl = ttl
+        self.max_idle = max_idle
+        self._idle: List[RedisConnection] = []
+
+    async def _execute(self, *args: Union[str, bytes, int]) -> Any:
+        connection = self._idle.pop() if self._idle else await RedisConnection.open(self.url)
+        try:
+            reply = await connection.execute(*args)
+        except RedisError:
+            self._release(connection)
+            raise
+        except BaseException:
+            # The reply may still be on its way, the connection cannot be reused
+            connection.close()
+            raise
+        self._release(connection)
+        return reply
+
+    def _release(self, connection: RedisConnection) -> None:
+        if len(self._idle) < self.max_idle:
+            self._idle.append(connection)
+        else:
+            connection.close()
+
+    async def get(self, session_id: str) -> Optional[str]:
+        value = await self._execute("GET", REDIS_KEY_PREFIX + session_id)
+        return value.decode("utf-8") if value is not None else None
+
+    async def set(self, session_id: str, value: str) -> None:
+        await self._execute("SET", REDIS_KEY_PREFIX + session_id, value, "PX", int(self.ttl * 1000))
+
+    async def delete(self, session_id: str) -> None:
+        await self._execute("DEL", REDIS_KEY_PREFIX + session_id)
+
+    async def close(self) -> None:
+        while self._idle:
+            self._idle.pop().close()
+
+
+def session_key() -> str:
+    """
+    Get the key of the current Chainlit session in the store.
+
+    The client sends its session id again whenever its socket reconnects,
+    to the same worker or to another one, while the thread id is only sent
+    back when a thread is resumed through a data layer. The user is part of
+    the key, a session id alone does not give access to another user's state.
+    """
+    session = cl.context.session
+    return f"{session.user.identifier}:{session.id}" if session.user else session.id
+
+
+_session_store: Optional[SessionStore] = None
+
+
+def get_session_store() -> SessionStore:
+    """
+    Get the session store selected by the SESSION_STORE_BACKEND setting.
+
+    "memory" (the default) keeps the sessions in the worker, "sqlite" shares
+    them between the workers of a node and "redis" between every worker.
+    """
+    global _session_store
+    if _session_store is None:
+        if SESSION_STORE_BACKEND == "memory":
+            _session_store = MemorySessionStore()
+        elif SESSION_STORE_BACKEND == "sqlite":
+            _session_store = SqliteSessionStore()
+        elif SESSION_STORE_BACKEND == "redis":
+            _session_store = RedisSessionStore()
+        else:
+            raise ValueError(f"Unknown session store backend: {SESSION_STORE_BACKEND}")
+    return _session_store
+
+
+def set_session_store(store: Optional[SessionStore]) -> None:
+    """
+    Replace the process-wide session store.
+    """
+    global _session_store
+    _session_store = store
@@ -1,6 +1,10 @@
 from typing import List
 from semantic_kernel.kernel import Kernel
 from semantic_kernel.agents import ChatCompletionAgent
+from semantic_kernel.connectors.ai import FunctionChoiceBehavior
+from semantic_kernel.connectors.ai.open_ai import OpenAIChatPromptExecutionSettings
+from semantic_kernel.functions import KernelArguments
+from vectordb_retriever import GUIDANCE_RETRIEVAL_ENABLED
 
 
 def create_agents(kernel: Kernel) -> List[ChatCompletionAgent]:
@@ -28,9 +32,16 @@ def create_agents(kernel: Kernel) -> List[ChatCompletionAgent]:
             """
     )
 
+    # Let the architect call the guidance retrieval tool, when the index is built.
+    architect_arguments = KernelArguments(settings=OpenAIChatPromptExecutionSettings(
+        function_choice_behavior=FunctionChoiceBehavior.Auto(
+            filters={"included_plugins": ["Guidance"]})
+    )) if GUIDANCE_RETRIEVAL_ENABLED else None
+
     agent_architect = ChatCompletionAgent(
         kernel=kernel,
         name="agent_architect",
+        arguments=architect_arguments,
         instructions="""
             You are a professional Azure Solutions Architect with expertise in cloud design principles. When users present requirements for an Azure solution, please:
             
@@ -48,6 +59,9 @@ def create_agents(kernel: Kernel) -> List[ChatCompletionAgent]:
             
             3. Provide links to relevant Azure documentation and resources for further guidance.
             
+            If a guidance search tool is available, search it once with the key requirements and base
+            your recommendation on the returned excerpts, citing their sources, instead of generic content.
+            
             Keep responses clear, concise, and actionable while following Azure architectural best practices.        
             """
     )
@@ -4,6 +4,17 @@ from openai import AsyncOpenAI
 from semantic_kernel.connectors.ai import FunctionChoiceBehavior
 from semantic_kernel.kernel import Kernel
 from semantic_kernel.connectors.ai.open_ai import OpenAIChatCompletion, OpenAIChatPromptExecutionSettings
+from semantic_kernel.functions import kernel_function
+from vectordb_retriever import GUIDANCE_RETRIEVAL_ENABLED, search_guidance
+
+
+class GuidancePlugin:
+    @kernel_function(name="search_azure_guidance",
+                     description="Searches the Azure Architecture Center, Well-Architected Framework "
+                                 "and Cloud Adoption Framework guidance for the most relevant excerpts")
+    async def search_azure_guidance(self, query: str) -> str:
+        """Retrieves the guidance excerpts most relevant to a query."""
+        return await search_guidance(query)
 
 
 # Create a kernel with Azure OpenAI service
@@ -30,4 +41,8 @@ def create_kernel() -> Kernel:
         )
     )
 
+    # Retrieval tool of the architect agent, when the guidance index is built.
+    if GUIDANCE_RETRIEVAL_ENABLED:
+        kernel.add_plugin(GuidancePlugin(), plugin_name="Guidance")
+
     return kernel
@@ -8,6 +8,7 @@ from semantic_kernel.contents import AuthorRole, ChatMessageContent, ChatHistory
 
 from sk_kernel_builder import create_kernel
 from sk_agents_builder import create_agents
+from session_store import get_session_store, session_key
 
 
 # OAuth callback for authentication
@@ -52,9 +53,16 @@ async def on_chat_start():
         ),
     )
 
+    # Resume the session started on another worker, or before a restart
+    chat_history = ChatHistory()
+    state = await get_session_store().load(session_key())
+    if state is not None:
+        await group_chat.add_chat_messages(ChatHistory.restore_chat_history(state["group_chat"]).messages)
+        chat_history = ChatHistory.restore_chat_history(state["chat_history"])
+
     # Get the group chat
     cl.user_session.set("group_chat", group_chat)  # type: ignore
-    cl.user_session.set("chat_history", ChatHistory())
+    cl.user_session.set("chat_history", chat_history)
 
 # Function to handle chat message event
 # This function is called when a new message is sent in the chat.
@@ -103,6 +111,12 @@ async def chat(message: cl.Message) -> None:
     # Send the final message
     await answer.send()
 
+    # Let any worker resume the session from here
+    await get_session_store().save(session_key(), {
+        "group_chat": group_chat.history.serialize(),
+        "chat_history": chat_history.serialize(),
+    })
+
 # Function to suggest starters
 # This function is called to suggest starter messages for the user.
 @cl.set_starters  # type: ignore
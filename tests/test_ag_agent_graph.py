@@ -0,0 +1,150 @@
+import sys
+sys.path.append('../')
+import asyncio
+import json
+import unittest
+from typing import Sequence
+from autogen_agentchat.agents import BaseChatAgent
+from autogen_agentchat.base import Response, TaskResult, Team
+from autogen_agentchat.conditions import ExternalTermination
+from autogen_agentchat.messages import BaseChatMessage, TextMessage
+from autogen_core import CancellationToken
+from ag_agent_graph import AgentGraphTeam, AgentNode
+
+
+class DelayedAgent(BaseChatAgent):
+    """Answers with its name after a delay, recording what it was given."""
+
+    def __init__(self, name: str, delay: float, log: list):
+        super().__init__(name, f"Agent {name}")
+        self.delay = delay
+        self.log = log
+        self.received = []
+
+    @property
+    def produced_message_types(self):
+        return (TextMessage,)
+
+    async def on_messages(self, messages: Sequence[BaseChatMessage],
+                          cancellation_token: CancellationToken) -> Response:
+        self.received = [message.source for message in messages]
+        self.log.append(("start", self.name))
+        await asyncio.sleep(self.delay)
+        self.log.append(("end", self.name))
+        return Response(chat_message=TextMessage(content=f"answer of {self.name}", source=self.name))
+
+    async def on_reset(self, cancellation_token: CancellationToken) -> None:
+        self.received = []
+
+    async def on_pause(self, cancellation_token: CancellationToken) -> None:
+        self.log.append(("pause", self.name))
+
+    async def on_resume(self, cancellation_token: CancellationToken) -> None:
+        self.log.append(("resume", self.name))
+
+
+class TestAgentGraphTeam(unittest.TestCase):
+
+    def setUp(self):
+        self.log = []
+        self.architect = DelayedAgent("architect", 0.0, self.log)
+        self.cost = DelayedAgent("cost", 0.2, self.log)
+        self.security = DelayedAgent("security", 0.1, self.log)
+        self.approval = DelayedAgent("approval", 0.0, self.log)
+        self.nodes = [
+            AgentNode(self.architect),
+            AgentNode(self.cost, ("architect",)),
+            AgentNode(self.security, ("architect",)),
+            AgentNode(self.approval, ("cost", "security")),
+        ]
+
+    def run_stream(self, team, task):
+        async def run():
+            return [message async for message in team.run_stream(task=task)]
+        return asyncio.run(run())
+
+    def test_independent_agents_overlap(self):
+        self.run_stream(AgentGraphTeam(self.nodes), "Design an AI assistant.")
+
+        self.assertLess(self.log.index(("start", "security")), self.log.index(("end", "cost")))
+        self.assertEqual(self.log[-2:], [("start", "approval"), ("end", "approval")])
+
+    def test_history_is_in_declaration_order(self):
+        messages = self.run_stream(AgentGraphTeam(self.nodes), "Design an AI assistant.")
+
+        result = messages[-1]
+        self.assertIsInstance(result, TaskResult)
+        self.assertEqual([message.source for message in result.messages],
+                         ["user", "architect", "cost", "security", "approval"])
+        # Security finishes first but is given only its ancestors' answers
+        self.assertEqual(self.security.received, ["user", "architect"])
+        self.assertEqual(self.approval.received, ["user", "architect", "cost", "security"])
+
+    def test_stopped_run_resumes_without_task(self):
+        termination = ExternalTermination()
+        team = AgentGraphTeam(self.nodes, termination_condition=termination)
+        termination.set()
+
+        first = self.run_stream(team, "Design an AI assistant.")
+        second = self.run_stream(team, None)
+
+        self.assertEqual([message.source for message in first[-1].messages], ["user", "architect"])
+        self.assertEqual([message.source for message in second[-1].messages],
+                         ["cost", "security", "approval"])
+        self.assertEqual(self.log.count(("start", "architect")), 1)
+
+    def test_stopped_run_resumes_from_saved_state(self):
+        termination = ExternalTermination()
+        team = AgentGraphTeam(self.nodes, termination_condition=termination)
+        termination.set()
+        self.run_stream(team, "Design an AI assistant.")
+        state = json.loads(json.dumps(asyncio.run(team.save_state())))
+
+        # Another worker builds the team again and resumes the run
+        resumed = AgentGraphTeam([AgentNode(DelayedAgent(node.agent.name, 0.0, self.log), node.depends_on)
+                                  for node in self.nodes])
+        asyncio.run(resumed.load_state(state))
+        second = self.run_stream(resumed, None)
+
+        self.assertEqual([message.source for message in second[-1].messages],
+                         ["cost", "security", "approval"])
+        self.assertEqual(resumed.nodes["cost"].agent.received, ["user", "architect"])
+        self.assertEqual(self.log.count(("start", "architect")), 1)
+
+    def test_is_a_team(self):
+        team = AgentGraphTeam(self.nodes, name="reviews")
+
+        self.assertIsInstance(team, Team)
+        self.assertEqual(team.name, "reviews")
+        asyncio.run(team.pause())
+        asyncio.run(team.resume())
+        self.assertEqual(self.log[:4], [("pause", name) for name in team.order])
+        self.assertEqual(self.log[4:], [("resume", name) for name in team.order])
+
+    def test_run_without_task_messages(self):
+        result = asyncio.run(AgentGraphTeam(self.nodes).run(task="Design an AI assistant.",
+                                                            output_task_messages=False))
+
+        self.assertEqual([message.source for message in result.messages],
+                         ["architect", "cost", "security", "approval"])
+        self.assertEqual(self.architect.received, ["user"])
+
+    def test_cancelled_run_stops_the_agents(self):
+        team = AgentGraphTeam(self.nodes)
+
+        async def run():
+            token = CancellationToken()
+            asyncio.get_running_loop().call_later(0.05, token.cancel)
+            await team.run(task="Design an AI assistant.", cancellation_token=token)
+
+        with self.assertRaises(asyncio.CancelledError):
+            asyncio.run(run())
+        self.assertNotIn(("end", "cost"), self.log)
+
+    def test_dependencies_must_be_declared_first(self):
+        with self.assertRaises(ValueError):
+            AgentGraphTeam([AgentNode(self.cost, ("architect",)), AgentNode(self.architect)])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,66 @@
+import sys
+sys.path.append('../')
+import unittest
+from ag_diagram_compiler import (ArchitectureModel, Component, Connection, compile_mermaid,
+                                 extract_architecture_model, parse_architecture_model)
+from ag_render_backends import parse_flowchart
+
+
+ANSWER = """### 🏗️ Architecture Overview
+Azure Front Door routes the traffic to the app.
+
+```json
+{"direction": "LR",
+ "components": [{"id": "frontdoor", "name": "Azure Front Door"},
+                {"id": "app", "name": "Azure App Service (Linux)"},
+                "Azure Cosmos DB"],
+ "connections": [{"from": "frontdoor", "to": "app", "label": "HTTPS | 443"},
+                 {"from": "app", "to": "azure cosmos db"},
+                 {"from": "app", "to": "Azure Key Vault", "label": "secrets"}]}
+```
+"""
+
+
+class TestArchitectureModel(unittest.TestCase):
+
+    def test_extract_resolves_ids_and_names(self):
+        model = extract_architecture_model(ANSWER)
+
+        self.assertEqual([component.id for component in model.components],
+                         ["frontdoor", "app", "Azure Cosmos DB", "Azure Key Vault"])
+        self.assertEqual(model.connections[1], Connection("app", "Azure Cosmos DB", ""))
+
+    def test_invalid_blocks_are_skipped(self):
+        self.assertIsNone(extract_architecture_model("```json\n{\"components\": 3}\n```"))
+        self.assertIsNone(extract_architecture_model("```json\n{not json\n```"))
+        self.assertIsNone(extract_architecture_model("No model here."))
+        with self.assertRaises(ValueError):
+            parse_architecture_model({"components": ["A"], "direction": "diagonal"})
+
+
+class TestCompileMermaid(unittest.TestCase):
+
+    def test_compiled_code_is_a_valid_flowchart(self):
+        code = compile_mermaid(extract_architecture_model(ANSWER))
+
+        direction, nodes, edges = parse_flowchart(code)
+        self.assertEqual(direction, "LR")
+        self.assertEqual([label for label, _ in nodes.values()],
+                         ["Azure Front Door", "Azure App Service (Linux)", "Azure Cosmos DB", "Azure Key Vault"])
+        self.assertEqual(edges[0], ("N1", "N2", "-->", "HTTPS / 443"))
+        self.assertEqual(len(edges), 3)
+
+    def test_component_ids_cannot_clash_with_keywords(self):
+        model = ArchitectureModel((Component("end", "End users"), Component("graph", "Graph API")),
+                                  (Connection("end", "graph"),))
+
+        self.assertEqual(compile_mermaid(model),
+                         'flowchart LR\n    N1["End users"]\n    N2["Graph API"]\n    N1 --> N2')
+
+    def test_empty_model_is_rejected(self):
+        with self.assertRaises(ValueError):
+            compile_mermaid(ArchitectureModel((), ()))
+
+
+if __name__ == "__main__":
+    unittest.main()
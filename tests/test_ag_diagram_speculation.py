@@ -0,0 +1,95 @@
+import sys
+sys.path.append('../')
+import asyncio
+import unittest
+from autogen_ext.models.replay import ReplayChatCompletionClient
+from ag_diagram_speculation import DiagramSpeculator, extract_components, extract_mermaid_code
+
+
+ARCHITECTURE = """### 🏗️ Architecture Overview and Key Components
+- **Azure Front Door**: global entry point
+- **Azure App Service**: hosts the web frontend
+- Azure Cosmos DB - stores the conversations
+
+### 🔒 Security and Compliance Considerations
+- Use Managed Identities
+"""
+
+OTHER_ARCHITECTURE = ARCHITECTURE.replace("Azure Cosmos DB", "Azure SQL Database")
+
+
+class TestExtractComponents(unittest.TestCase):
+
+    def test_components_are_complete_at_next_section(self):
+        partial = ARCHITECTURE[:ARCHITECTURE.index("### 🔒")]
+
+        self.assertIsNone(extract_components(partial))
+        self.assertEqual(extract_components(partial, final=True), extract_components(ARCHITECTURE))
+        self.assertEqual(extract_components(ARCHITECTURE),
+                         ("azure app service", "azure cosmos db", "azure front door"))
+
+    def test_extract_mermaid_code(self):
+        self.assertEqual(extract_mermaid_code("Here:\n```mermaid\nflowchart TD\n  A --> B\n```"),
+                         "flowchart TD\n  A --> B")
+        self.assertEqual(extract_mermaid_code("flowchart TD\n  A --> B\n"), "flowchart TD\n  A --> B")
+
+
+class TestDiagramSpeculator(unittest.TestCase):
+
+    def setUp(self):
+        self.client = ReplayChatCompletionClient(["flowchart TD\n  A --> B", "flowchart TD\n  A --> C"])
+        self.rendered = []
+
+    async def render(self, diagram_code: str):
+        self.rendered.append(diagram_code)
+        return {"filename": f"diagram-{len(self.rendered)}.png", "valid": True}
+
+    def stream(self, speculator: DiagramSpeculator, architecture: str, final: str):
+        async def run():
+            for line in architecture.splitlines(keepends=True):
+                speculator.feed(line)
+                await asyncio.sleep(0)
+            return await speculator.result(final)
+        return asyncio.run(run())
+
+    def test_matching_draft_is_used(self):
+        speculator = DiagramSpeculator(self.client, "Draw it.", render=self.render)
+
+        result = self.stream(speculator, ARCHITECTURE, ARCHITECTURE)
+
+        self.assertEqual(result["filename"], "diagram-1.png")
+        self.assertEqual(result["diagram_code"], "flowchart TD\n  A --> B")
+        self.assertEqual(self.rendered, ["flowchart TD\n  A --> B"])
+        self.assertEqual(speculator.stats(), {"hits": 1, "misses": 0})
+
+    def test_draft_is_redone_when_components_change(self):
+        speculator = DiagramSpeculator(self.client, "Draw it.", render=self.render)
+
+        result = self.stream(speculator, ARCHITECTURE, OTHER_ARCHITECTURE)
+
+        # The stale draft may or may not have reached the model before it was cancelled
+        self.assertEqual(self.rendered[-1], result["diagram_code"])
+        self.assertEqual(speculator.stats(), {"hits": 0, "misses": 1})
+
+
+    def test_new_architect_message_replaces_the_previous_one(self):
+        speculator = DiagramSpeculator(self.client, "Draw it.", render=self.render)
+
+        async def run():
+            # A first answer the diagram agent never got, then a new one
+            speculator.feed(ARCHITECTURE, "first")
+            await asyncio.sleep(0)
+            for line in OTHER_ARCHITECTURE.splitlines(keepends=True):
+                speculator.feed(line, "second")
+                await asyncio.sleep(0)
+            self.assertEqual(speculator.text, OTHER_ARCHITECTURE)
+            return await speculator.result(OTHER_ARCHITECTURE)
+        result = asyncio.run(run())
+
+        # The draft of the new answer is used, not the one of the first
+        self.assertEqual(result["diagram_code"], "flowchart TD\n  A --> C")
+        self.assertEqual(speculator.stats(), {"hits": 1, "misses": 0})
+
+
+if __name__ == "__main__":
+    unittest.main()
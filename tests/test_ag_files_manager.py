@@ -0,0 +1,105 @@
+import sys
+sys.path.append('../')
+import asyncio
+import os
+import shutil
+import tempfile
+import time
+import unittest
+from ag_files_manager import FilesLifecycleManager
+from ag_files_store import FilesStore
+
+FILES = [f"0f8fad5b-d9cb-469f-a165-7086772895{i:02d}.png" for i in range(5)]
+
+
+class TestFilesLifecycleManager(unittest.TestCase):
+    def setUp(self):
+        self.files_dir = tempfile.mkdtemp()
+        self.store = FilesStore(self.files_dir)
+        self.manager = FilesLifecycleManager(
+            self.store, max_bytes=100, max_age=3600, session_max_bytes=50)
+
+    def tearDown(self):
+        shutil.rmtree(self.files_dir, ignore_errors=True)
+
+    def write(self, filename: str, size: int, age: float = 0) -> None:
+        asyncio.run(self.store.write(filename, b"x" * size))
+        if age:
+            modified = time.time() - age
+            os.utime(os.path.join(self.files_dir, filename), (modified, modified))
+            self.store.index[filename] = self.store.index[filename]._replace(modified=modified)
+
+    def test_sweep_removes_expired_files(self):
+        self.write(FILES[0], 10, age=7200)
+        self.write(FILES[1], 10)
+
+        report = asyncio.run(self.manager.sweep())
+
+        self.assertEqual(report.files, 1)
+        self.assertEqual(report.bytes, 10)
+        self.assertFalse(self.store.contains(FILES[0]))
+        self.assertTrue(self.store.contains(FILES[1]))
+
+    def test_sweep_prefers_unowned_files(self):
+        self.write(FILES[0], 40, age=30)
+        self.write(FILES[1], 40, age=20)
+        self.write(FILES[2], 40, age=10)
+        asyncio.run(self.manager.claim("session", FILES[0]))
+
+        report = asyncio.run(self.manager.sweep())
+
+        # The oldest unowned file goes first, the owned one is kept
+        self.assertEqual(report.files, 1)
+        self.assertTrue(self.store.contains(FILES[0]))
+        self.assertFalse(self.store.contains(FILES[1]))
+        self.assertEqual(self.manager.stats()["reclaimed_bytes"], 40)
+
+    def test_session_quota(self):
+        self.write(FILES[0], 20)
+        asyncio.run(self.manager.claim("other", FILES[0]))
+        for filename in FILES[:4]:
+            self.write(filename, 20)
+            asyncio.run(self.manager.claim("session", filename))
+
+        self.assertEqual(self.manager.owned_files("session"), FILES[2:4])
+        # The files given up are deleted, unless another session displays them
+        self.assertTrue(self.store.contains(FILES[0]))
+        self.assertFalse(self.store.contains(FILES[1]))
+        self.assertFalse(os.path.exists(os.path.join(self.files_dir, FILES[1])))
+        self.assertEqual(self.manager.stats()["reclaimed_bytes"], 20)
+
+        self.manager.release_session("session")
+        self.manager.release_session("other")
+        self.assertEqual(self.manager.stats()["owned_files"], 0)
+
+    def test_sweep_sees_the_files_of_other_workers(self):
+        self.write(FILES[0], 10)
+        self.store.load()
+        other_worker = FilesStore(self.files_dir)
+        asyncio.run(other_worker.write(FILES[1], b"x" * 60))
+        asyncio.run(other_worker.write(FILES[2], b"x" * 60))
+        other_worker.remove(FILES[0])
+
+        report = asyncio.run(self.manager.sweep())
+
+        self.assertEqual(report.files, 1)
+        self.assertFalse(self.store.contains(FILES[0]))
+        self.assertEqual(self.manager.stats()["bytes"], 60)
+
+    def test_compaction_removes_interrupted_writes(self):
+        self.write(FILES[0], 10)
+        temp_path = os.path.join(self.files_dir, f".{FILES[1]}.abc.tmp")
+        with open(temp_path, 'wb') as f:
+            f.write(b"partial")
+        os.utime(temp_path, (time.time() - 3600, time.time() - 3600))
+
+        report = asyncio.run(self.manager.compact())
+
+        self.assertEqual(report.files, 1)
+        self.assertEqual(report.bytes, 7)
+        self.assertFalse(os.path.exists(temp_path))
+        self.assertTrue(self.store.contains(FILES[0]))
+
+
+if __name__ == "__main__":
+    unittest.main()
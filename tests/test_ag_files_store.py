@@ -0,0 +1,63 @@
+import sys
+sys.path.append('../')
+import asyncio
+import os
+import shutil
+import tempfile
+import unittest
+from ag_files_store import FilesStore, iterate_chunks
+
+FILENAME = "0f8fad5b-d9cb-469f-a165-70867728950e.png"
+
+
+class TestFilesStore(unittest.TestCase):
+    def setUp(self):
+        self.files_dir = tempfile.mkdtemp()
+        self.store = FilesStore(self.files_dir)
+
+    def tearDown(self):
+        shutil.rmtree(self.files_dir, ignore_errors=True)
+
+    def test_write_stream(self):
+        data = os.urandom(200 * 1024)
+
+        size = asyncio.run(self.store.write_stream(FILENAME, iterate_chunks(data, 1000)))
+
+        self.assertEqual(size, len(data))
+        with open(os.path.join(self.files_dir, FILENAME), 'rb') as f:
+            self.assertEqual(f.read(), data)
+        self.assertEqual(self.store.path_for(FILENAME), os.path.join(self.files_dir, FILENAME))
+        self.assertEqual(self.store.size_of(FILENAME), len(data))
+        # No temporary files are left behind
+        self.assertEqual(os.listdir(self.files_dir), [FILENAME])
+
+    def test_failed_stream_leaves_no_file(self):
+        async def broken_chunks():
+            yield b"partial"
+            raise IOError("connection lost")
+
+        with self.assertRaises(IOError):
+            asyncio.run(self.store.write_stream(FILENAME, broken_chunks()))
+
+        self.assertIsNone(self.store.path_for(FILENAME))
+        self.assertEqual(os.listdir(self.files_dir), [])
+
+    def test_existing_files_are_indexed(self):
+        with open(os.path.join(self.files_dir, FILENAME), 'wb') as f:
+            f.write(b"data")
+        with open(os.path.join(self.files_dir, "notes.txt"), 'wb') as f:
+            f.write(b"data")
+
+        self.assertTrue(self.store.contains(FILENAME))
+        self.assertFalse(self.store.contains("notes.txt"))
+
+    def test_remove(self):
+        asyncio.run(self.store.write(FILENAME, b"data"))
+
+        self.assertEqual(self.store.remove(FILENAME), 4)
+        self.assertIsNone(self.store.path_for(FILENAME))
+        self.assertFalse(os.path.exists(os.path.join(self.files_dir, FILENAME)))
+
+
+if __name__ == "__main__":
+    unittest.main()
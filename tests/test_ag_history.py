@@ -0,0 +1,65 @@
+import sys
+sys.path.append('../')
+import asyncio
+import unittest
+from autogen_core import FunctionCall
+from autogen_core.models import AssistantMessage, FunctionExecutionResult, FunctionExecutionResultMessage, UserMessage
+from ag_history import CompactChatCompletionContext, estimate_tokens
+
+
+def turn(source: str, words: int) -> UserMessage:
+    return UserMessage(content=" ".join(["word"] * words), source=source)
+
+
+class TestEstimateTokens(unittest.TestCase):
+
+    def test_emoji_count_more_than_letters(self):
+        self.assertEqual(estimate_tokens("abcdefgh"), 2)
+        self.assertEqual(estimate_tokens("🏗️🔒"), 3)
+
+
+class TestCompactChatCompletionContext(unittest.TestCase):
+
+    def view(self, context: CompactChatCompletionContext, messages):
+        async def run():
+            for message in messages:
+                await context.add_message(message)
+            return await context.get_messages()
+        return asyncio.run(run())
+
+    def test_short_history_is_sent_whole(self):
+        context = CompactChatCompletionContext(token_budget=1000)
+        messages = [turn("user", 10), turn("questioner_agent", 10)]
+
+        self.assertEqual(self.view(context, messages), messages)
+
+    def test_older_turns_are_summarized(self):
+        context = CompactChatCompletionContext(token_budget=180, summary_budget=30, summary_chars=40)
+        messages = [turn("user", 40), turn("questioner_agent", 40), turn("architect_agent", 80)]
+
+        view = self.view(context, messages)
+
+        self.assertEqual(view[1:], messages[1:])
+        self.assertTrue(view[0].content.startswith("Summary of the earlier conversation:"))
+        self.assertIn("- user: word word", view[0].content)
+        # The full transcript is kept
+        self.assertEqual(len(asyncio.run(context.get_messages())), 3)
+        self.assertEqual(context.compactions, 2)
+        self.assertGreater(context.saved_tokens, 0)
+
+    def test_function_results_stay_with_their_call(self):
+        context = CompactChatCompletionContext(token_budget=200, summary_budget=50)
+        arguments = '{"query": "' + "a" * 80 + '"}'
+        call = AssistantMessage(content=[FunctionCall(id="1", name="search", arguments=arguments)],
+                                source="architect_agent")
+        result = FunctionExecutionResultMessage(
+            content=[FunctionExecutionResult(call_id="1", name="search", content="x " * 250, is_error=False)])
+        messages = [turn("user", 80), call, result, turn("architect_agent", 10)]
+
+        view = self.view(context, messages)
+
+        self.assertEqual(view[1:], messages[1:])
+
+
+if __name__ == "__main__":
+    unittest.main()
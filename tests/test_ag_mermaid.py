@@ -0,0 +1,115 @@
+import sys
+sys.path.append('../')
+import unittest
+from ag_mermaid import (Edge, IncrementalMermaidValidator, MermaidSyntaxError, Node, is_flowchart,
+                        normalize_mermaid, parse_mermaid)
+
+
+class TestParseMermaid(unittest.TestCase):
+
+    def test_parse_shapes_links_and_labels(self):
+        flowchart = parse_mermaid("""
+        %%{init: {'theme':'neutral'}}%%
+        flowchart LR
+            A[User Interface] -->|User Input| B(Azure Functions)
+            B -- Log Data --> C{Azure Monitor}
+            B -.-> D[(Azure Cosmos DB)]; D ==> E((Cache))
+            %% a comment
+            style A fill:#f9f
+        """)
+
+        self.assertTrue(flowchart.valid)
+        self.assertEqual(flowchart.direction, "LR")
+        self.assertEqual(flowchart.nodes["B"], Node("B", "Azure Functions", "round"))
+        self.assertEqual(flowchart.nodes["D"], Node("D", "Azure Cosmos DB", "cylinder"))
+        self.assertEqual(flowchart.nodes["E"].shape, "circle")
+        self.assertEqual(flowchart.edges, [
+            Edge("A", "B", "-->", "User Input"),
+            Edge("B", "C", "-->", "Log Data"),
+            Edge("B", "D", "-.->", ""),
+            Edge("D", "E", "==>", ""),
+        ])
+
+    def test_normalize_quotes_labels_with_special_characters(self):
+        code = normalize_mermaid('graph TD\n  A[App Service (Linux)] -->|C# / "REST"| B[Azure SQL #1]')
+
+        self.assertEqual(code, 'flowchart TD\n'
+                               '    A["App Service (Linux)"] -->|"C# / \'REST\'"| B["Azure SQL #1"]')
+        # Normalized code parses to the same graph
+        self.assertEqual(parse_mermaid(code).nodes["A"].label, "App Service (Linux)")
+
+    def test_statements_on_a_single_line(self):
+        flowchart = parse_mermaid("flowchart TD     A-->B     B-->C")
+
+        self.assertEqual([(edge.source, edge.target) for edge in flowchart.edges], [("A", "B"), ("B", "C")])
+        self.assertEqual(parse_mermaid("graph LR\\n A --> B").edges, [Edge("A", "B", "-->", "")])
+
+    def test_ampersand_links_every_node(self):
+        flowchart = parse_mermaid("graph TD\n A --> B & C\n D & E --> F")
+
+        self.assertTrue(flowchart.valid)
+        self.assertEqual([(edge.source, edge.target) for edge in flowchart.edges],
+                         [("A", "B"), ("A", "C"), ("D", "F"), ("E", "F")])
+        self.assertEqual(flowchart.statements, ["A --> B & C", "D & E --> F"])
+
+    def test_circle_cross_and_invisible_links(self):
+        flowchart = parse_mermaid("graph LR\n A --o B\n B --x C\n C ~~~ D\n D o--o E\n E -- Audit --x F\n F --- orders")
+
+        self.assertTrue(flowchart.valid)
+        self.assertEqual([edge.link for edge in flowchart.edges], ["--o", "--x", "~~~", "o--o", "--x", "---"])
+        self.assertEqual(flowchart.edges[4].label, "Audit")
+        # An 'o' starting the next node id is not a circle arrowhead
+        self.assertEqual(flowchart.edges[5], Edge("F", "orders", "---", ""))
+
+    def test_escaped_quotes_in_quoted_labels(self):
+        flowchart = parse_mermaid('graph LR\n A["The \\"edge\\" tier"] -->|"calls \\"/api\\""| B')
+
+        self.assertTrue(flowchart.valid)
+        self.assertEqual(flowchart.nodes["A"].label, 'The "edge" tier')
+        self.assertEqual(flowchart.edges[0].label, 'calls "/api"')
+
+    def test_slanted_shapes_are_kept_as_written(self):
+        code = "flowchart LR\n    A[/Input/] --> B[\\Output\\]\n    C[/Manual step\\] --> D[\\Queue/]"
+        flowchart = parse_mermaid(code)
+
+        self.assertEqual(flowchart.to_code(), code)
+        self.assertEqual([node.shape for node in flowchart.nodes.values()],
+                         ["lean_right", "lean_left", "trapezoid", "inv_trapezoid"])
+        self.assertEqual(flowchart.nodes["C"].label, "Manual step")
+
+    def test_errors_are_structured_and_all_reported(self):
+        with self.assertRaises(MermaidSyntaxError) as context:
+            normalize_mermaid("flowchart TD\n A[Front Door --> B\n B --> end\n C --> D & --> E")
+
+        errors = context.exception.errors
+        self.assertEqual([(error.line, error.column) for error in errors], [(2, 4), (3, 8), (4, 12)])
+        self.assertIn("missing ']'", errors[0].message)
+        self.assertIn("keyword", errors[1].message)
+        self.assertIn("node id", errors[2].message)
+
+    def test_header_is_required(self):
+        flowchart = parse_mermaid("A --> B")
+
+        self.assertFalse(flowchart.valid)
+        self.assertEqual(flowchart.errors[0].message, "expected a flowchart or graph header")
+        self.assertFalse(is_flowchart("sequenceDiagram\n A->>B: hello"))
+        self.assertTrue(is_flowchart("%%{init: {}}%%\ngraph TD;"))
+
+
+class TestIncrementalMermaidValidator(unittest.TestCase):
+
+    def test_lines_are_validated_once_complete(self):
+        validator = IncrementalMermaidValidator()
+
+        self.assertEqual(validator.feed("flowchart TD\n A[Fro"), [])
+        self.assertEqual(validator.feed("nt Door] --> B\n B -->"), [])
+        errors = validator.feed(" &\n")
+        flowchart = validator.close()
+
+        self.assertEqual(len(errors), 1)
+        self.assertEqual(errors[0].line, 3)
+        self.assertEqual(flowchart.nodes["A"].label, "Front Door")
+
+
+if __name__ == "__main__":
+    unittest.main()
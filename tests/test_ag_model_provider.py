@@ -1,6 +1,8 @@
 from autogen_core.models import UserMessage
 import unittest
 import asyncio
+import time
+from unittest.mock import AsyncMock, MagicMock, patch
 
 
 class TestModelClient(unittest.TestCase):
@@ -46,5 +48,76 @@ class TestModelClient(unittest.TestCase):
                       "Expected 'Copenhagen' in the response")
 
 
+class TestModelClientPool(unittest.TestCase):
+
+    def setUp(self):
+        from ag_model_builder import ModelClientPool
+        # Create fake clients instead of connecting to Azure
+        self.patcher = patch("ag_model_builder.create_model_client",
+                             side_effect=lambda *args: MagicMock(close=AsyncMock()))
+        self.create_model_client = self.patcher.start()
+        self.pool = ModelClientPool()
+
+    def tearDown(self):
+        self.patcher.stop()
+
+    def test_clients_are_shared_by_key(self):
+        first = self.pool.acquire("gpt-4o-mini")
+        second = self.pool.acquire("gpt-4o-mini")
+        tools = self.pool.acquire("gpt-4o-mini", function_calling=True)
+
+        self.assertIs(first, second)
+        self.assertIsNot(first, tools)
+        self.assertEqual(self.create_model_client.call_count, 2)
+        self.assertEqual(self.pool.stats()["references"], 3)
+
+    def test_lease_release_and_close(self):
+        lease = self.pool.lease()
+        client = lease.acquire("gpt-4o-mini")
+        other = self.pool.lease()
+        other.acquire("mistral-small-2503", function_calling=True)
+
+        lease.release()
+        closed = asyncio.run(self.pool.close_idle())
+
+        self.assertEqual(closed, 1)
+        client.close.assert_awaited_once()
+        self.assertEqual(self.pool.live_count(), 1)
+
+        other.release()
+        asyncio.run(self.pool.close_all())
+        self.assertEqual(self.pool.live_count(), 0)
+
+    def test_only_clients_idle_long_enough_are_closed(self):
+        lease = self.pool.lease()
+        client = lease.acquire("gpt-4o-mini")
+        lease.release()
+
+        self.assertEqual(asyncio.run(self.pool.close_idle(60)), 0)
+        # Released a minute ago
+        with patch("ag_model_builder.time.monotonic", return_value=time.monotonic() + 61):
+            self.assertEqual(asyncio.run(self.pool.close_idle(60)), 1)
+        client.close.assert_awaited_once()
+
+    def test_reaper_closes_idle_clients(self):
+        from ag_model_builder import ModelClientPool
+        pool = ModelClientPool(idle_timeout=0.0)
+        lease = pool.lease()
+        client = lease.acquire("gpt-4o-mini")
+
+        async def run():
+            pool.start()
+            await asyncio.sleep(1.2)
+            # Still held by the session
+            self.assertEqual(pool.live_count(), 1)
+            lease.release()
+            await asyncio.sleep(1.2)
+            await pool.stop()
+        asyncio.run(run())
+
+        client.close.assert_awaited_once()
+        self.assertEqual(pool.stats()["closed"], 1)
+
+
 if __name__ == "__main__":
     unittest.main()
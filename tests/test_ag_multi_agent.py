@@ -0,0 +1,104 @@
+import sys
+sys.path.append('../')
+import asyncio
+import os
+import unittest
+from typing import Sequence
+from unittest import mock
+from autogen_agentchat.agents import BaseChatAgent
+from autogen_agentchat.base import Response
+from autogen_agentchat.conditions import ExternalTermination
+from autogen_agentchat.messages import BaseChatMessage, TextMessage
+from autogen_core import CancellationToken
+
+# The app registers its OAuth callback on import
+for name in ("OAUTH_AZURE_AD_CLIENT_ID", "OAUTH_AZURE_AD_CLIENT_SECRET", "OAUTH_AZURE_AD_TENANT_ID"):
+    os.environ.setdefault(name, "test")
+import ag_multi_agent
+from ag_agents_builder import (ARCHITECT_AGENT, COMPILED_DIAGRAM_AGENT, DIAGRAM_AGENT, ILLUSTRATOR_AGENT,
+                               QUESTIONER_AGENT, SPECULATIVE_DIAGRAM_AGENT, USER_APPROVAL_AGENT, USER_INPUT_AGENT)
+from ag_semantic_cache import CachedArchitecture
+
+# The diagram agents of each mode.
+DIAGRAM_MODES = {
+    "illustrated": (DIAGRAM_AGENT, ILLUSTRATOR_AGENT),
+    "speculative": (SPECULATIVE_DIAGRAM_AGENT,),
+    "compiled": (COMPILED_DIAGRAM_AGENT,),
+}
+
+
+class NamedAgent(BaseChatAgent):
+    """Answers with its name."""
+
+    @property
+    def produced_message_types(self):
+        return (TextMessage,)
+
+    async def on_messages(self, messages: Sequence[BaseChatMessage],
+                          cancellation_token: CancellationToken) -> Response:
+        return Response(chat_message=TextMessage(content=f"answer of {self.name}", source=self.name))
+
+    async def on_reset(self, cancellation_token: CancellationToken) -> None:
+        pass
+
+
+class TestCreateTeam(unittest.TestCase):
+
+    def test_round_robin_run_is_one_round_in_every_diagram_mode(self):
+        for mode, diagram_templates in DIAGRAM_MODES.items():
+            with self.subTest(mode=mode):
+                templates = (QUESTIONER_AGENT, USER_INPUT_AGENT, ARCHITECT_AGENT, *diagram_templates,
+                             USER_APPROVAL_AGENT)
+                agents = [NamedAgent(template.name, template.description) for template in templates]
+                with mock.patch.object(ag_multi_agent, "TEAM_STRATEGY", "round_robin"), \
+                        mock.patch.object(ag_multi_agent, "get_participants", return_value=agents):
+                    team = ag_multi_agent.create_team(mock.Mock(), ExternalTermination())
+
+                async def run():
+                    first = await team.run(task="Design an AI assistant.")
+                    second = await team.run(task="Add a cache.")
+                    return first, second
+
+                first, second = asyncio.run(run())
+
+                names = [template.name for template in templates]
+                self.assertEqual([message.source for message in first.messages], ["user", *names])
+                # The next message starts over with the questioner
+                self.assertEqual([message.source for message in second.messages], ["user", *names])
+
+
+class TestPresentCachedArchitecture(unittest.TestCase):
+
+    def present(self, answer: str):
+        cached = CachedArchitecture("cached-1", "A web app", "Use App Service.", None, 0.97, 12.0)
+        semantic_cache = mock.Mock(invalidate_async=mock.AsyncMock())
+        with mock.patch.object(ag_multi_agent.cl, "Message", return_value=mock.Mock(send=mock.AsyncMock())), \
+                mock.patch.object(ag_multi_agent, "process_response_content", new=mock.AsyncMock()), \
+                mock.patch.object(ag_multi_agent, "user_action_func", new=mock.AsyncMock(return_value=answer)), \
+                mock.patch.object(ag_multi_agent, "get_semantic_cache", return_value=semantic_cache):
+            approved = asyncio.run(ag_multi_agent.present_cached_architecture(cached))
+        return approved, semantic_cache.invalidate_async
+
+    def test_rejected_architecture_is_invalidated(self):
+        approved, invalidate = self.present("REJECT.")
+
+        self.assertFalse(approved)
+        invalidate.assert_awaited_once_with("cached-1")
+
+    def test_unanswered_architecture_is_kept(self):
+        for answer in ("User did not provide any input within the time limit.", "User did not provide any input."):
+            with self.subTest(answer=answer):
+                approved, invalidate = self.present(answer)
+
+                self.assertFalse(approved)
+                invalidate.assert_not_awaited()
+
+    def test_approved_architecture_is_kept(self):
+        approved, invalidate = self.present("APPROVE.")
+
+        self.assertTrue(approved)
+        invalidate.assert_not_awaited()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,154 @@
+import sys
+sys.path.append('../')
+import asyncio
+import unittest
+from typing import Tuple
+import httpx
+from ag_render_backends import (
+    FallbackRenderBackend, LocalMermaidRenderBackend, RenderBackend, parse_flowchart, rank_nodes)
+
+
+class SlowRenderBackend(RenderBackend):
+    """A backend that never answers in time."""
+
+    name = "slow"
+
+    def __init__(self):
+        self.calls = 0
+
+    def supports(self, diagram_type: str, output_format: str, diagram_code: str = '') -> bool:
+        return True
+
+    async def render(self, diagram_code: str, diagram_type: str = 'mermaid',
+                     output_format: str = 'png') -> Tuple[bytes, str]:
+        self.calls += 1
+        await asyncio.sleep(10)
+        return b"", output_format
+
+
+class FailingRenderBackend(SlowRenderBackend):
+    """A backend answering every request with an error status."""
+
+    name = "failing"
+
+    def __init__(self, status_code: int):
+        super().__init__()
+        self.status_code = status_code
+
+    async def render(self, diagram_code: str, diagram_type: str = 'mermaid',
+                     output_format: str = 'png') -> Tuple[bytes, str]:
+        self.calls += 1
+        request = httpx.Request("POST", "https://kroki.io/mermaid/svg")
+        response = httpx.Response(self.status_code, request=request)
+        raise httpx.HTTPStatusError(f"{self.status_code}", request=request, response=response)
+
+
+class TestLocalMermaidRenderBackend(unittest.TestCase):
+    def setUp(self):
+        self.mermaid_code = """
+        %%{init: {'theme':'neutral'}}%%
+        flowchart TD
+            A[User Interface] -->|User Input| B[Azure Functions]
+            B -->|Invoke Search| C[Azure Cognitive Search]
+            B -- Log Data --> D{Azure Application Insights}
+            C --> A
+        """
+
+    def test_parse_flowchart(self):
+        direction, nodes, edges = parse_flowchart(self.mermaid_code)
+
+        self.assertEqual(direction, "TD")
+        self.assertEqual(nodes["A"], ("User Interface", "rect"))
+        self.assertEqual(nodes["D"], ("Azure Application Insights", "rhombus"))
+        self.assertIn(("A", "B", "-->", "User Input"), edges)
+        self.assertIn(("B", "D", "-->", "Log Data"), edges)
+        self.assertIn(("C", "A", "-->", ""), edges)
+
+    def test_parse_errors(self):
+        with self.assertRaises(ValueError):
+            parse_flowchart("A --> B")
+        with self.assertRaises(ValueError):
+            parse_flowchart("graph TD\n A --> B &")
+
+    def test_rank_nodes_ignores_cycles(self):
+        ranks = rank_nodes(["A", "B", "C"], [("A", "B"), ("B", "C"), ("C", "A")])
+
+        self.assertEqual(ranks, {"A": 0, "B": 1, "C": 2})
+
+    def test_render_svg(self):
+        data, output_format = asyncio.run(
+            LocalMermaidRenderBackend().render(self.mermaid_code, output_format="png"))
+
+        self.assertEqual(output_format, "svg")
+        self.assertTrue(data.startswith(b"<svg"))
+        self.assertIn(b"Azure Cognitive Search", data)
+
+    def test_invisible_links_are_not_drawn(self):
+        data, _ = asyncio.run(LocalMermaidRenderBackend().render("graph LR\n A ~~~ B", output_format="svg"))
+
+        self.assertNotIn(b"<line", data)
+        self.assertEqual(data.count(b"<text"), 2)
+
+    def test_supports_only_flowcharts(self):
+        backend = LocalMermaidRenderBackend()
+
+        self.assertTrue(backend.supports("mermaid", "svg", self.mermaid_code))
+        self.assertTrue(backend.supports("mermaid", "svg", "graph LR\n A --> B"))
+        self.assertFalse(backend.supports("mermaid", "svg", "sequenceDiagram\n A->>B: Hello"))
+        self.assertFalse(backend.supports("mermaid", "svg", "classDiagram\n A <|-- B"))
+        self.assertFalse(backend.supports("plantuml", "svg", "@startuml\nA -> B\n@enduml"))
+
+
+class TestFallbackRenderBackend(unittest.TestCase):
+    def test_falls_back_when_primary_is_slow(self):
+        primary = SlowRenderBackend()
+        backend = FallbackRenderBackend(
+            primary, LocalMermaidRenderBackend(), timeout=0.05, cooldown=60)
+
+        async def run():
+            first = await backend.render("graph LR\n A --> B", output_format="svg")
+            second = await backend.render("graph LR\n A --> C", output_format="svg")
+            return first, second
+        first, second = asyncio.run(run())
+
+        self.assertEqual(first[1], "svg")
+        self.assertEqual(second[1], "svg")
+        # The primary is skipped during the cooldown
+        self.assertEqual(primary.calls, 1)
+        self.assertEqual(backend.fallbacks, 2)
+
+    def test_falls_back_when_primary_is_unavailable(self):
+        for status_code in (503, 429):
+            primary = FailingRenderBackend(status_code)
+            backend = FallbackRenderBackend(primary, LocalMermaidRenderBackend(), cooldown=60)
+
+            data, output_format = asyncio.run(backend.render("graph LR\n A --> B", output_format="svg"))
+
+            self.assertEqual(output_format, "svg")
+            self.assertGreater(backend.primary_down_until, 0)
+            self.assertEqual(backend.fallbacks, 1)
+
+    def test_client_errors_are_raised_without_cooldown(self):
+        primary = FailingRenderBackend(400)
+        backend = FallbackRenderBackend(primary, LocalMermaidRenderBackend(), cooldown=60)
+
+        for _ in range(2):
+            with self.assertRaises(httpx.HTTPStatusError):
+                asyncio.run(backend.render("graph LR\n A --> B", output_format="svg"))
+
+        self.assertEqual(primary.calls, 2)
+        self.assertEqual(backend.primary_down_until, 0)
+        self.assertEqual(backend.fallbacks, 0)
+
+    def test_other_diagrams_are_not_drawn_locally(self):
+        primary = FailingRenderBackend(503)
+        backend = FallbackRenderBackend(primary, LocalMermaidRenderBackend(), cooldown=60)
+
+        with self.assertRaises(httpx.HTTPStatusError):
+            asyncio.run(backend.render("sequenceDiagram\n A->>B: Hello", output_format="svg"))
+
+        self.assertEqual(backend.fallbacks, 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
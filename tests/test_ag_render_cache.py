@@ -0,0 +1,106 @@
+import sys
+sys.path.append('../')
+import asyncio
+import os
+import shutil
+import tempfile
+import unittest
+from ag_files_store import FilesStore, RENDER_FILENAME_PATTERN
+from ag_render_cache import RenderCache
+
+
+class TestRenderCache(unittest.TestCase):
+    def setUp(self):
+        self.files_dir = tempfile.mkdtemp()
+        self.store = FilesStore(self.files_dir)
+        self.cache = RenderCache(self.store, max_bytes=100)
+
+    def tearDown(self):
+        shutil.rmtree(self.files_dir, ignore_errors=True)
+
+    def write(self, filename: str, size: int) -> None:
+        asyncio.run(self.store.write(filename, b"x" * size))
+        asyncio.run(self.cache.add(filename, size))
+
+    def test_filename_is_deterministic(self):
+        first = self.cache.filename_for("graph TD\n A-->B", "mermaid", "png")
+        second = self.cache.filename_for("graph TD\n A-->B", "mermaid", "png")
+        other = self.cache.filename_for("graph TD\n A-->B", "mermaid", "svg")
+
+        self.assertEqual(first, second)
+        self.assertNotEqual(first, other)
+        self.assertTrue(RENDER_FILENAME_PATTERN.match(first))
+        self.assertTrue(other.endswith(".svg"))
+
+    def test_hit_and_miss(self):
+        filename = self.cache.filename_for("graph TD\n A-->B")
+
+        self.assertFalse(self.cache.lookup(filename))
+        self.write(filename, 10)
+        self.assertTrue(self.cache.lookup(filename))
+
+        stats = self.cache.stats()
+        self.assertEqual(stats["hits"], 1)
+        self.assertEqual(stats["misses"], 1)
+        self.assertEqual(stats["bytes"], 10)
+
+    def test_lru_eviction_by_bytes(self):
+        first = self.cache.filename_for("A")
+        second = self.cache.filename_for("B")
+        third = self.cache.filename_for("C")
+        self.write(first, 40)
+        self.write(second, 40)
+
+        # Touch the first entry so the second one is the least recently used
+        self.assertTrue(self.cache.lookup(first))
+        self.write(third, 40)
+
+        self.assertTrue(os.path.exists(os.path.join(self.files_dir, first)))
+        self.assertFalse(os.path.exists(os.path.join(self.files_dir, second)))
+        self.assertEqual(self.cache.stats()["evictions"], 1)
+        self.assertEqual(self.cache.stats()["bytes"], 80)
+
+    def test_files_in_use_are_not_evicted(self):
+        first = self.cache.filename_for("A")
+        second = self.cache.filename_for("B")
+        third = self.cache.filename_for("C")
+        self.cache.in_use = {first}.__contains__
+        self.write(first, 40)
+        self.write(second, 40)
+        self.write(third, 40)
+
+        self.assertTrue(os.path.exists(os.path.join(self.files_dir, first)))
+        self.assertFalse(os.path.exists(os.path.join(self.files_dir, second)))
+        self.assertTrue(self.cache.lookup(first))
+
+    def test_removed_file_is_a_miss(self):
+        filename = self.cache.filename_for("A")
+        self.write(filename, 10)
+        self.store.remove(filename)
+
+        self.assertFalse(self.cache.lookup(filename))
+        self.assertEqual(self.cache.stats()["entries"], 0)
+
+    def test_file_of_another_format_is_found_under_the_request(self):
+        requested = self.cache.filename_for("A", "mermaid", "png")
+        rendered = self.cache.filename_for("A", "mermaid", "svg")
+        asyncio.run(self.store.write(rendered, b"x" * 10))
+        asyncio.run(self.cache.add(rendered, 10, requested))
+
+        self.assertEqual(self.cache.lookup(requested), rendered)
+        self.assertEqual(self.cache.lookup(rendered), rendered)
+
+        # Evicting the file drops the alias with it
+        self.write(self.cache.filename_for("B"), 95)
+        self.assertIsNone(self.cache.lookup(requested))
+
+    def test_existing_files_are_indexed(self):
+        filename = self.cache.filename_for("A")
+        self.write(filename, 10)
+
+        cache = RenderCache(FilesStore(self.files_dir), max_bytes=100)
+        self.assertTrue(cache.lookup(filename))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,73 @@
+import sys
+sys.path.append('../')
+import asyncio
+import unittest
+from unittest.mock import AsyncMock, MagicMock, patch
+from autogen_core.models import CreateResult, SystemMessage, UserMessage
+from autogen_ext.models.replay import ReplayChatCompletionClient
+from ag_response_cache import ResponseCacheClient, TTLCacheStore
+
+
+class TestResponseCacheClient(unittest.TestCase):
+
+    def setUp(self):
+        self.store = TTLCacheStore(ttl=60, max_entries=2)
+        self.replay = ReplayChatCompletionClient(["First answer", "Second answer", "Third answer"])
+        self.replay.set_cached_bool_value(False)
+        self.client = ResponseCacheClient(self.replay, "gpt-4o-mini", self.store)
+
+    def stream(self, client, content: str):
+        messages = [
+            SystemMessage(content="You are an Azure architect."),
+            UserMessage(content=content, source="user"),
+        ]
+
+        async def run():
+            return [item async for item in client.create_stream(messages)]
+        return asyncio.run(run())
+
+    def test_stream_is_replayed_from_cache(self):
+        first = self.stream(self.client, "Design an AI assistant.")
+        # Whitespace differences do not change the cache key
+        second = self.stream(self.client, "  Design an   AI assistant.\n")
+
+        self.assertEqual(first[:-1], second[:-1])
+        self.assertIsInstance(second[-1], CreateResult)
+        self.assertTrue(second[-1].cached)
+        self.assertEqual(self.store.stats()["hits"], 1)
+
+    def test_model_is_part_of_the_key(self):
+        self.stream(self.client, "Design an AI assistant.")
+        other_model = ResponseCacheClient(self.replay, "mistral-small-2503", self.store)
+        result = self.stream(other_model, "Design an AI assistant.")
+
+        self.assertFalse(result[-1].cached)
+        self.assertEqual(result[-1].content, "Second answer")
+
+    def test_size_bound_and_ttl(self):
+        self.stream(self.client, "A")
+        self.stream(self.client, "B")
+        self.stream(self.client, "C")
+        self.assertEqual(self.store.stats()["evictions"], 1)
+
+        self.store.ttl = -1
+        self.store.set("key", [])
+        self.assertIsNone(self.store.get("key"))
+
+
+    def test_closing_the_wrapper_keeps_the_pooled_client_open(self):
+        from ag_model_builder import ModelClientPool
+        pool = ModelClientPool()
+        with patch("ag_model_builder.create_model_client", side_effect=lambda *args: MagicMock(close=AsyncMock())):
+            pooled = pool.acquire("gpt-4o-mini")
+        client = ResponseCacheClient(pooled, "gpt-4o-mini", self.store)
+
+        asyncio.run(client.close())
+
+        pooled.close.assert_not_awaited()
+        self.assertEqual(pool.live_count(), 1)
+        asyncio.run(pool.close_all())
+        pooled.close.assert_awaited_once()
+
+if __name__ == "__main__":
+    unittest.main()
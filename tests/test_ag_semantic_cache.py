@@ -0,0 +1,71 @@
+import sys
+sys.path.append('../')
+import time
+import unittest
+from unittest.mock import MagicMock
+from ag_semantic_cache import ArchitectureSession, SemanticArchitectureCache
+
+
+class TestSemanticArchitectureCache(unittest.TestCase):
+
+    def setUp(self):
+        self.db = MagicMock()
+        self.cache = SemanticArchitectureCache(self.db, threshold=0.9, ttl=3600)
+
+    def query_result(self, distance: float, created: float):
+        return {
+            "ids": [["entry"]],
+            "documents": [["Design an AI assistant.\nWeb app, SQL database"]],
+            "metadatas": [[{
+                "architecture": "Use App Service and Azure SQL.",
+                "diagram_filename": "0f8fad5b-d9cb-469f-a165-70867728950e.png",
+                "generation_seconds": 42.0,
+                "created": created,
+            }]],
+            "distances": [[distance]],
+        }
+
+    def test_hit_above_threshold(self):
+        self.db.query_documents.return_value = self.query_result(0.1, time.time())
+
+        cached = self.cache.lookup("Design an AI assistant.\nWeb app, SQL")
+
+        self.assertIsNotNone(cached)
+        self.assertAlmostEqual(cached.similarity, 0.95)
+        self.assertEqual(cached.architecture, "Use App Service and Azure SQL.")
+        self.assertEqual(self.cache.stats()["hit_rate"], 1.0)
+        self.assertEqual(self.cache.stats()["latency_saved_seconds"], 42.0)
+
+    def test_miss_below_threshold(self):
+        self.db.query_documents.return_value = self.query_result(0.5, time.time())
+
+        self.assertIsNone(self.cache.lookup("Build a data pipeline."))
+        self.assertEqual(self.cache.stats()["hit_rate"], 0.0)
+
+    def test_expired_entry_is_invalidated(self):
+        self.db.query_documents.return_value = self.query_result(0.1, time.time() - 7200)
+
+        self.assertIsNone(self.cache.lookup("Design an AI assistant."))
+        self.db.delete_documents.assert_called_once_with("architecture_cache", ids=["entry"])
+
+    def test_store_approved_session(self):
+        session = ArchitectureSession("Design an AI assistant.")
+        session.add_answer("Web app, SQL database")
+        session.add_output("architect_agent", "Use App Service and Azure SQL.")
+        session.add_output("illustrator_agent", "Diagram: 0f8fad5b-d9cb-469f-a165-70867728950e.png")
+
+        entry_id = self.cache.store(session)
+
+        self.assertIsNotNone(entry_id)
+        kwargs = self.db.upsert_documents.call_args.kwargs
+        self.assertEqual(kwargs["documents"], ["Design an AI assistant.\nWeb app, SQL database"])
+        self.assertEqual(kwargs["metadatas"][0]["diagram_filename"],
+                         "0f8fad5b-d9cb-469f-a165-70867728950e.png")
+
+    def test_session_without_architecture_is_not_stored(self):
+        self.assertIsNone(self.cache.store(ArchitectureSession("Hello")))
+        self.db.upsert_documents.assert_not_called()
+
+
+if __name__ == "__main__":
+    unittest.main()
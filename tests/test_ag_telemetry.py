@@ -0,0 +1,134 @@
+import sys
+sys.path.append('../')
+import asyncio
+import json
+import os
+import tempfile
+import unittest
+import urllib.request
+from ag_telemetry import Telemetry, TurnTracker, set_telemetry, traced
+
+
+class TestTelemetry(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.spans_path = os.path.join(self.temp_dir.name, "spans.jsonl")
+        self.telemetry = Telemetry(spans_path=self.spans_path)
+        set_telemetry(self.telemetry)
+
+    def tearDown(self):
+        set_telemetry(None)
+        self.temp_dir.cleanup()
+
+    def exported_spans(self):
+        self.telemetry.flush()
+        with open(self.spans_path, encoding="utf-8") as file:
+            return [span for line in file
+                    for span in json.loads(line)["resourceSpans"][0]["scopeSpans"][0]["spans"]]
+
+    def test_traced_calls_are_children_of_the_current_span(self):
+        @traced("kroki.request")
+        async def render():
+            return b"image"
+
+        @traced("tool.render_diagram")
+        async def render_diagram():
+            return await render()
+
+        self.assertEqual(asyncio.run(render_diagram()), b"image")
+
+        kroki, tool = self.exported_spans()
+        self.assertEqual((kroki["name"], tool["name"]), ("kroki.request", "tool.render_diagram"))
+        self.assertEqual(kroki["parentSpanId"], tool["spanId"])
+        self.assertEqual(kroki["traceId"], tool["traceId"])
+
+    def test_failed_calls_are_marked(self):
+        @traced("chroma.query")
+        def query():
+            raise ValueError("no collection")
+
+        with self.assertRaises(ValueError):
+            query()
+
+        span, = self.exported_spans()
+        self.assertEqual(span["status"], {"code": 2, "message": "ValueError: no collection"})
+        self.assertIn('architect_span_errors_total{span="chroma.query"} 1', self.telemetry.render_prometheus())
+
+    def test_disabled_telemetry_records_nothing(self):
+        telemetry = Telemetry(enabled=False, spans_path=self.spans_path)
+        with telemetry.span("tool.render_diagram") as span:
+            self.assertIsNone(span)
+        telemetry.flush()
+
+        self.assertFalse(os.path.exists(self.spans_path))
+        self.assertEqual(telemetry.render_prometheus(), "\n")
+
+    def test_turns_of_a_run(self):
+        tracker = TurnTracker(self.telemetry, "session-1", "selector")
+        tracker.message("user")
+        tracker.selection(["architect_agent"])
+        tracker.chunk("architect_agent")
+        tracker.chunk("architect_agent")
+        tracker.message("architect_agent", prompt_tokens=1200, completion_tokens=300)
+        tracker.close()
+
+        decision, turn, run = self.exported_spans()
+        self.assertEqual(run["attributes"][0], {"key": "session.id", "value": {"stringValue": "session-1"}})
+        self.assertEqual(turn["parentSpanId"], run["spanId"])
+        self.assertEqual(decision["parentSpanId"], run["spanId"])
+        attributes = {attribute["key"]: attribute["value"] for attribute in turn["attributes"]}
+        self.assertEqual(attributes["gen_ai.agent.name"], {"stringValue": "architect_agent"})
+        self.assertEqual(attributes["gen_ai.usage.input_tokens"], {"intValue": "1200"})
+        self.assertIn("agent.time_to_first_token_ms", attributes)
+
+        metrics = self.telemetry.render_prometheus()
+        self.assertIn('architect_agent_prompt_tokens_total{agent="architect_agent"} 1200', metrics)
+        self.assertIn('architect_agent_completion_tokens_total{agent="architect_agent"} 300', metrics)
+        self.assertIn('architect_selector_decisions_total{previous="",selected="architect_agent"} 1', metrics)
+        self.assertIn('architect_agent_time_to_first_token_seconds_count{agent="architect_agent"} 1', metrics)
+        self.assertNotIn('agent="user"', metrics)
+
+    def test_metrics_are_labelled_with_the_worker(self):
+        telemetry = Telemetry(spans_path=self.spans_path, worker="4242")
+        with telemetry.span("chroma.query"):
+            pass
+        telemetry.increment("agent_turns_total", agent="architect_agent")
+        telemetry.flush()
+
+        metrics = telemetry.render_prometheus()
+        self.assertIn('architect_agent_turns_total{agent="architect_agent",worker="4242"} 1', metrics)
+        self.assertIn('architect_span_duration_seconds_count{span="chroma.query",worker="4242"} 1', metrics)
+        self.assertIn('architect_span_duration_seconds_bucket{span="chroma.query",worker="4242",le="+Inf"} 1', metrics)
+        with open(self.spans_path, encoding="utf-8") as file:
+            resource = json.loads(file.readline())["resourceSpans"][0]["resource"]
+        self.assertIn({"key": "service.instance.id", "value": {"stringValue": "4242"}}, resource["attributes"])
+
+    def test_each_worker_serves_its_metrics_on_its_own_port(self):
+        first = Telemetry(worker="1")
+        second = Telemetry(worker="2")
+        first.increment("agent_turns_total")
+        second.increment("agent_turns_total")
+        try:
+            first.start(port=19464)
+            second.start(port=first.port)
+
+            self.assertNotEqual(first.port, second.port)
+            for telemetry in (first, second):
+                with urllib.request.urlopen(f"http://127.0.0.1:{telemetry.port}/metrics") as response:
+                    body = response.read().decode("utf-8")
+                self.assertIn(f'architect_agent_turns_total{{worker="{telemetry.worker}"}} 1', body)
+        finally:
+            first.stop()
+            second.stop()
+
+    def test_runs_of_a_session_share_a_trace(self):
+        first = TurnTracker(self.telemetry, "session-1", "round_robin")
+        second = TurnTracker(self.telemetry, "session-1", "round_robin")
+
+        self.assertEqual(first.run.trace_id, second.run.trace_id)
+        self.assertEqual(len(first.run.trace_id), 32)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -4,9 +4,53 @@ import zlib
 import base64
 import unittest
 import os
+import shutil
+import tempfile
+import threading
 import asyncio
-from unittest.mock import patch, MagicMock
-from ag_tools_builder import generate_mermaid_diagram, generate_mermaid_diagram, encode_base64
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest.mock import patch
+import ag_tools_builder
+from ag_files_store import FilesStore
+from ag_kroki_client import KrokiClient, set_kroki_client
+from ag_render_backends import (FallbackRenderBackend, KrokiRenderBackend, LocalMermaidRenderBackend,
+                                set_render_backend)
+from ag_render_cache import RenderCache
+from ag_tools_builder import generate_mermaid_diagram, encode_base64
+
+# Call the tool without the Chainlit step wrapper, which needs a UI context
+generate_mermaid_diagram = generate_mermaid_diagram.__wrapped__
+
+
+class StubKrokiServer:
+    """A local HTTP server that answers Kroki render requests."""
+
+    def __init__(self):
+        self.requests = []
+        self.status_codes = []
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers["Content-Length"]))
+                stub.requests.append((self.path, body.decode("utf-8")))
+                status = stub.status_codes.pop(0) if stub.status_codes else 200
+                self.send_response(status)
+                self.end_headers()
+                self.wfile.write(f"fake_image_data {self.path}".encode("utf-8"))
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}"
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
 
 class TestGenerateMermaidDiagram(unittest.TestCase):
     def setUp(self):
@@ -29,89 +73,92 @@ class TestGenerateMermaidDiagram(unittest.TestCase):
         }
         """
         self.output_formats = ["png", "svg"]
-        self.diagrams_dir = os.path.join(os.path.dirname(
-            os.path.dirname(os.path.abspath(__file__))), 'diagrams')
-        os.makedirs(self.diagrams_dir, exist_ok=True)
-
-    @patch("src.tools.requests.post")
-    def test_generate_mermaid_diagram(self, mock_post):
-        # Mock the response content
-        mock_post.return_value = MagicMock(
-            status_code=200, content=b"fake_image_data")
-
-        # Run the coroutine using asyncio
-        filename = asyncio.run(
-            generate_mermaid_diagram(self.valid_mermaid_code))
-
-        self.assertTrue(filename.endswith(".png"))
-
-        # Check if the correct URL was called
-        mock_post.assert_called_with(
-            "https://kroki.io/mermaid/png",
-            data=self.valid_mermaid_code
-        )
-
-        # Check if file exists and clean up
-        file_path = os.path.join(self.diagrams_dir, filename)
-        self.assertTrue(os.path.exists(file_path))
-        os.remove(file_path)
-
-    @patch("src.tools.requests.post")
-    def test_with_different_diagram_type(self, mock_post):
-        # Mock the response content
-        mock_post.return_value = MagicMock(
-            status_code=200, content=b"fake_graphviz_data")
-
-        # Run the coroutine using asyncio
-        filename = asyncio.run(generate_mermaid_diagram(
-            self.valid_graphviz_code,
-            diagram_type="graphviz"
-        ))
-        self.assertTrue(filename.endswith(".png"))
-
-        # Check if the correct URL was called
-        mock_post.assert_called_with(
-            "https://kroki.io/graphviz/png",
-            data=self.valid_graphviz_code
-        )
-
-        # Check if file exists and clean up
-        file_path = os.path.join(self.diagrams_dir, filename)
-        self.assertTrue(os.path.exists(file_path))
-        os.remove(file_path)
-
-    @patch("src.tools.requests.post")
-    def test_with_different_output_format(self, mock_post):
-        # Mock the response content
-        mock_post.return_value = MagicMock(
-            status_code=200, content=b"fake_svg_data")
-
-        # Run the coroutine using asyncio
-        filename = asyncio.run(generate_mermaid_diagram(
-            self.valid_mermaid_code,
-            output_format="svg"
-        ))
-        self.assertTrue(filename.endswith(".svg"))
-
-        # Check if the correct URL was called
-        mock_post.assert_called_with(
-            "https://kroki.io/mermaid/svg",
-            data=self.valid_mermaid_code
-        )
-
-        # Check if file exists and clean up
-        file_path = os.path.join(self.diagrams_dir, filename)
+        self.diagrams_dir = tempfile.mkdtemp()
+        self.kroki = StubKrokiServer()
+
+        # Render into a temporary directory through the stub Kroki server
+        store = FilesStore(self.diagrams_dir)
+        self.patches = [
+            patch.object(ag_tools_builder, "files_store", store),
+            patch.object(ag_tools_builder, "render_cache", RenderCache(store)),
+        ]
+        for p in self.patches:
+            p.start()
+        set_render_backend(KrokiRenderBackend())
+
+    def tearDown(self):
+        for p in self.patches:
+            p.stop()
+        set_render_backend(None)
+        set_kroki_client(None)
+        self.kroki.stop()
+        shutil.rmtree(self.diagrams_dir, ignore_errors=True)
+
+    def generate(self, *args, **kwargs):
+        async def run():
+            set_kroki_client(KrokiClient(base_url=self.kroki.url, backoff=0.01))
+            return await generate_mermaid_diagram(*args, **kwargs)
+        return asyncio.run(run())
+
+    def test_generate_mermaid_diagram(self):
+        result = self.generate(self.valid_mermaid_code)
+
+        self.assertTrue(result["valid"])
+        self.assertTrue(result["filename"].endswith(".png"))
+
+        # Check if the correct endpoint was called
+        self.assertEqual(self.kroki.requests[0][0], "/mermaid/png")
+
+        # Check if file exists
+        file_path = os.path.join(self.diagrams_dir, result["filename"])
         self.assertTrue(os.path.exists(file_path))
-        os.remove(file_path)
 
-    @patch("src.tools.requests.post")
-    def test_request_failure(self, mock_post):
-        # Mock a failed request
-        mock_post.side_effect = Exception("Request failed")
+    def test_with_different_diagram_type(self):
+        result = self.generate(self.valid_graphviz_code, diagram_type="graphviz")
+
+        self.assertTrue(result["filename"].endswith(".png"))
+        self.assertEqual(self.kroki.requests[0][0], "/graphviz/png")
+
+    def test_with_different_output_format(self):
+        result = self.generate(self.valid_mermaid_code, output_format="svg")
+
+        self.assertTrue(result["filename"].endswith(".svg"))
+        self.assertEqual(self.kroki.requests[0][0], "/mermaid/svg")
+
+    def test_repeated_render_is_cached(self):
+        first = self.generate(self.valid_mermaid_code)
+        second = self.generate(self.valid_mermaid_code)
+
+        self.assertEqual(first["filename"], second["filename"])
+        self.assertEqual(len(self.kroki.requests), 1)
 
-        # Test exception handling
-        with self.assertRaises(Exception):
-            asyncio.run(generate_mermaid_diagram(self.valid_mermaid_code))
+    def test_fallback_render_is_cached_for_the_requested_format(self):
+        self.kroki.status_codes = [503] * 10
+        backend = FallbackRenderBackend(KrokiRenderBackend(), LocalMermaidRenderBackend(), cooldown=60)
+        set_render_backend(backend)
+
+        first = self.generate(self.valid_mermaid_code, output_format="png")
+        second = self.generate(self.valid_mermaid_code, output_format="png")
+
+        self.assertTrue(first["filename"].endswith(".svg"))
+        self.assertEqual(second["filename"], first["filename"])
+        self.assertEqual(backend.fallbacks, 1)
+
+    def test_transient_error_is_retried(self):
+        self.kroki.status_codes = [503]
+
+        result = self.generate(self.valid_mermaid_code)
+
+        self.assertTrue(result["valid"])
+        self.assertEqual(len(self.kroki.requests), 2)
+
+    def test_request_failure(self):
+        self.kroki.status_codes = [400]
+
+        result = self.generate(self.valid_mermaid_code)
+
+        self.assertFalse(result["valid"])
+        self.assertIn("400", result["error"])
 
     def test_real_api_call(self):
         """Test with a real API call to verify integration with Kroki."""
@@ -123,24 +170,23 @@ class TestGenerateMermaidDiagram(unittest.TestCase):
             C-->D;
         """
 
-        # Make a real API call (no mocking) - using PNG format instead of SVG
-        filename = asyncio.run(generate_mermaid_diagram(
-            simple_diagram, output_format="png"))
+        # Make a real API call (no stub) - using PNG format instead of SVG
+        async def run():
+            set_kroki_client(KrokiClient())
+            return await generate_mermaid_diagram(simple_diagram, output_format="png")
+        result = asyncio.run(run())
 
         # Verify the file exists
-        file_path = os.path.join(self.diagrams_dir, filename)
+        file_path = os.path.join(self.diagrams_dir, result["filename"])
         self.assertTrue(os.path.exists(file_path))
 
         # Verify file has content (non-zero size)
         self.assertTrue(os.path.getsize(file_path) > 0)
 
         # Print the filename and size for debugging
-        print(f"Generated diagram saved as {filename}")
+        print(f"Generated diagram saved as {result['filename']}")
         print(f"File size: {os.path.getsize(file_path)} bytes")
 
-        # Cleanup
-        os.remove(file_path)
-
 
 class TestEncodeBase64(unittest.TestCase):
     def setUp(self):
@@ -0,0 +1,74 @@
+import sys
+sys.path.append('../')
+import asyncio
+import json
+import os
+import tempfile
+import time
+import unittest
+from ag_watchdog import LoopWatchdog
+
+
+def read_index_blocking():
+    time.sleep(0.15)
+
+
+async def handle_message():
+    read_index_blocking()
+    await asyncio.sleep(0.05)
+
+
+class TestLoopWatchdog(unittest.TestCase):
+
+    def run_watched(self, coroutine_function, app_dir):
+        watchdog = LoopWatchdog(threshold=0.05, interval=0.01, app_dir=app_dir)
+
+        async def run():
+            watchdog.start()
+            try:
+                await coroutine_function()
+            finally:
+                watchdog.stop()
+
+        asyncio.run(run())
+        return watchdog
+
+    def test_stall_is_attributed_to_the_blocking_call_site(self):
+        watchdog = self.run_watched(handle_message, os.path.dirname(os.path.abspath(__file__)))
+
+        report = watchdog.report()
+        self.assertEqual(report["stalls"], 1)
+        self.assertGreaterEqual(report["max_lag_ms"], 100)
+        offender = report["offenders"][0]
+        self.assertIn("in read_index_blocking", offender["app_frame"])
+        self.assertEqual(offender["blocking_frame"], offender["app_frame"])
+        self.assertIn("in handle_message", offender["stack"][1])
+        self.assertIn("read_index_blocking", watchdog.format_report())
+
+    def test_code_outside_the_application_is_reported_as_such(self):
+        watchdog = self.run_watched(handle_message, tempfile.gettempdir())
+
+        offender = watchdog.report()["offenders"][0]
+        self.assertEqual(offender["app_frame"], "outside the application")
+
+    def test_no_stall_without_blocking_calls(self):
+        async def idle():
+            await asyncio.sleep(0.2)
+
+        watchdog = self.run_watched(idle, os.path.dirname(os.path.abspath(__file__)))
+
+        self.assertEqual(watchdog.report(), {"stalls": 0, "total_lag_ms": 0, "max_lag_ms": 0,
+                                             "threshold_ms": 50, "offenders": []})
+
+    def test_report_is_written_as_json(self):
+        watchdog = self.run_watched(handle_message, os.path.dirname(os.path.abspath(__file__)))
+
+        with tempfile.TemporaryDirectory() as temp_dir:
+            path = os.path.join(temp_dir, "telemetry", "loop_stalls.json")
+            watchdog.write_report(path)
+            with open(path, encoding="utf-8") as file:
+                self.assertEqual(json.load(file)["stalls"], 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,48 @@
+import sys
+sys.path.append('../')
+sys.path.append('../benchmarks')
+import unittest
+from load_test import ramp, saturation
+
+
+def step(users, throughput, p95, sessions=10, errors=0):
+    return {"users": users, "sessions": sessions, "errors": errors, "throughput_per_s": throughput,
+            "p95_s": p95, "first_error": "RuntimeError: boom" if errors else ""}
+
+
+class TestLoadTest(unittest.TestCase):
+
+    def test_ramp_grows_geometrically_up_to_the_maximum(self):
+        self.assertEqual(ramp(1, 2, 20), [1, 2, 4, 8, 16])
+        self.assertEqual(ramp(1, 1.2, 4), [1, 2, 3, 4])
+
+    def test_scaling_curve_is_not_saturated(self):
+        curve = [step(1, 0.1, 9.0), step(2, 0.2, 9.1), step(4, 0.38, 9.3)]
+
+        self.assertIsNone(saturation(curve, min_gain=0.05, max_slowdown=3, max_error_rate=0.01))
+
+    def test_flat_throughput_is_saturated(self):
+        curve = [step(16, 1.3, 9.7), step(32, 2.1, 13.5), step(64, 2.15, 24.0)]
+
+        reason = saturation(curve, min_gain=0.05, max_slowdown=3, max_error_rate=0.01)
+
+        self.assertIn("throughput of 2.15/s", reason)
+        self.assertIn("32 users", reason)
+
+    def test_latency_collapse_is_saturated(self):
+        curve = [step(1, 0.1, 9.0), step(64, 2.3, 24.0), step(128, 3.0, 49.0)]
+
+        reason = saturation(curve, min_gain=0.05, max_slowdown=3, max_error_rate=0.01)
+
+        self.assertTrue(reason.startswith("p95 latency of 49 s"))
+
+    def test_failed_sessions_are_saturated(self):
+        curve = [step(1, 0.1, 9.0, sessions=10, errors=1)]
+
+        reason = saturation(curve, min_gain=0.05, max_slowdown=3, max_error_rate=0.01)
+
+        self.assertEqual(reason, "1 of 10 sessions failed, first with RuntimeError: boom")
+
+
+if __name__ == "__main__":
+    unittest.main()
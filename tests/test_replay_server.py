@@ -0,0 +1,90 @@
+import sys
+sys.path.append('../')
+sys.path.append('../benchmarks')
+import asyncio
+import base64
+import json
+import unittest
+import httpx
+from replay_server import Fixture, ReplayServer
+
+PNG = b"\x89PNG\r\n\x1a\nimage"
+
+FIXTURE = {
+    "name": "session",
+    "responses": [
+        {"system": "diagram specialist", "tools": True,
+         "chunks": [[5, {"role": "assistant", "tool_calls": [
+             {"index": 0, "id": "call_1", "type": "function",
+              "function": {"name": "render", "arguments": "{\"code\": \"A\"}"}}]}]]},
+        {"system": "diagram specialist", "after_tool": True,
+         "chunks": [[5, {"role": "assistant", "content": "Rendered "}], [5, {"content": "it."}]],
+         "usage": {"prompt_tokens": 10, "completion_tokens": 2, "total_tokens": 12}},
+    ],
+    "kroki": {"mermaid/png": {"delay_ms": 1, "body": base64.b64encode(PNG).decode()}},
+}
+
+
+class TestReplayServer(unittest.TestCase):
+
+    def replay(self, requests):
+        async def run():
+            server = ReplayServer(Fixture(FIXTURE), speed=10)
+            url = await server.start()
+            try:
+                async with httpx.AsyncClient(base_url=url) as client:
+                    return [await request(client) for request in requests], server.stats()
+            finally:
+                await server.close()
+        return asyncio.run(run())
+
+    def test_stream_is_matched_by_system_message_and_tool_result(self):
+        body = {"stream": True, "messages": [
+            {"role": "system", "content": "You are a diagram specialist."},
+            {"role": "user", "content": "Draw it"},
+            {"role": "tool", "tool_call_id": "call_1", "content": "ok"}]}
+
+        async def request(client):
+            response = await client.post("/chat/completions", json=body)
+            return [line[6:] for line in response.text.splitlines() if line.startswith("data: ")]
+
+        (events,), stats = self.replay([request])
+
+        self.assertEqual(events[-1], "[DONE]")
+        chunks = [json.loads(event) for event in events[:-1]]
+        self.assertEqual("".join(chunk["choices"][0]["delta"].get("content", "") for chunk in chunks), "Rendered it.")
+        self.assertEqual(chunks[-1]["choices"][0]["finish_reason"], "stop")
+        self.assertEqual(chunks[-1]["usage"]["completion_tokens"], 2)
+        self.assertEqual(stats, {"requests": 1, "unmatched": 0})
+
+    def test_completion_assembles_tool_calls(self):
+        body = {"tools": [{"type": "function", "function": {"name": "render"}}], "messages": [
+            {"role": "system", "content": "You are a diagram specialist."},
+            {"role": "user", "content": "Draw it"}]}
+
+        async def request(client):
+            return (await client.post("/v1/chat/completions?api-version=1", json=body)).json()
+
+        (completion,), _ = self.replay([request])
+
+        choice = completion["choices"][0]
+        self.assertEqual(choice["finish_reason"], "tool_calls")
+        self.assertEqual(choice["message"]["tool_calls"][0]["function"],
+                         {"name": "render", "arguments": "{\"code\": \"A\"}"})
+
+    def test_kroki_renders_and_unmatched_requests(self):
+        async def render(client):
+            return (await client.post("/mermaid/png", content=b"flowchart TD")).content
+
+        async def unknown(client):
+            return (await client.post("/chat/completions", json={"messages": []})).status_code
+
+        (image, status), stats = self.replay([render, unknown])
+
+        self.assertEqual(image, PNG)
+        self.assertEqual(status, 400)
+        self.assertEqual(stats, {"requests": 2, "unmatched": 1})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,40 @@
+import sys
+sys.path.append('../')
+sys.path.append('../benchmarks')
+import unittest
+from run_benchmark import ScriptedUser, compare, percentile
+
+
+class TestRunBenchmark(unittest.TestCase):
+
+    def test_percentile(self):
+        values = [0.5, 0.1, 0.4, 0.2, 0.3]
+
+        self.assertEqual(percentile(values, 50), 0.3)
+        self.assertEqual(percentile(values, 95), 0.5)
+        self.assertEqual(percentile([1.0], 99), 1.0)
+
+    def test_compare_reports_regressions_beyond_tolerance_and_noise(self):
+        baseline = {"fixture": "session",
+                    "ag": {"4": {"p50_s": 8.0, "p95_s": 9.0, "throughput_per_s": 0.45,
+                                 "loop_blocked_ms": 10.0, "memory_per_session_kb": 150.0}}}
+        results = {"ag": {"4": {"p50_s": 8.2, "p95_s": 11.0, "throughput_per_s": 0.3,
+                                "loop_blocked_ms": 25.0, "memory_per_session_kb": 160.0}},
+                   "sk": {"4": {"p50_s": 20.0}}}
+
+        regressions = compare(results, baseline, tolerance=0.15)
+
+        self.assertEqual(len(regressions), 2)
+        self.assertTrue(regressions[0].startswith("ag at 4 users: p95_s 9 -> 11"))
+        self.assertTrue(regressions[1].startswith("ag at 4 users: throughput_per_s"))
+
+    def test_scripted_user_runs_out_of_answers(self):
+        user = ScriptedUser(["answer"], ["approve"])
+
+        self.assertEqual(user.next_input(), "answer")
+        self.assertIsNone(user.next_input())
+        self.assertEqual(user.next_action(), "approve")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,178 @@
+import sys
+sys.path.append('../')
+import asyncio
+import os
+import tempfile
+import unittest
+from unittest import mock
+import chainlit as cl
+import chainlit.socket
+from chainlit.context import init_ws_context
+from chainlit.session import WebsocketSession
+from session_store import (MemorySessionStore, RedisConnection, RedisSessionStore, SessionStore,
+                           SqliteSessionStore, session_key)
+
+
+class RedisStandIn:
+    """Local stand-in for a Redis server, keeping the keys in memory."""
+
+    def __init__(self):
+        self.values = {}
+        self.commands = []
+        self.server = None
+
+    async def start(self) -> str:
+        self.server = await asyncio.start_server(self.serve, "127.0.0.1", 0)
+        return f"redis://:secret@127.0.0.1:{self.server.sockets[0].getsockname()[1]}/2"
+
+    async def serve(self, reader, writer):
+        # Requests are arrays of bulk strings, parsed like replies
+        connection = RedisConnection(reader, writer)
+        try:
+            while True:
+                command, *args = await connection._read_reply()
+                self.commands.append(command.decode())
+                if command == b"GET":
+                    value = self.values.get(args[0])
+                    writer.write(b"$-1\r\n" if value is None else b"$%d\r\n%s\r\n" % (len(value), value))
+                elif command == b"SET":
+                    self.values[args[0]] = args[1]
+                    writer.write(b"+OK\r\n")
+                elif command == b"DEL":
+                    writer.write(b":%d\r\n" % (self.values.pop(args[0], None) is not None))
+                elif command in (b"AUTH", b"SELECT"):
+                    writer.write(b"+OK\r\n")
+                else:
+                    writer.write(b"-ERR unknown command\r\n")
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            writer.close()
+
+    async def close(self):
+        self.server.close()
+        await self.server.wait_closed()
+
+
+class FailingSessionStore(SessionStore):
+
+    async def get(self, session_id):
+        raise ConnectionError("store unavailable")
+
+    async def set(self, session_id, value):
+        raise ConnectionError("store unavailable")
+
+    async def delete(self, session_id):
+        raise ConnectionError("store unavailable")
+
+
+STATE = {"team": {"type": "TeamState", "agent_states": {"architect_agent": {"llm_context": {"messages": []}}}},
+         "prompt_history": "Design an AI assistant."}
+
+
+class TestSessionStore(unittest.TestCase):
+
+    def test_memory_store_expires_and_evicts_sessions(self):
+        async def run():
+            store = MemorySessionStore(ttl=60, max_entries=2)
+            for session_id in ("a", "b", "c"):
+                await store.save(session_id, STATE)
+            evicted = await store.load("a")
+            kept = await store.load("c")
+            store.ttl = -1
+            await store.save("d", STATE)
+            return evicted, kept, await store.load("d"), store.stats()
+
+        evicted, kept, expired, stats = asyncio.run(run())
+
+        self.assertIsNone(evicted)
+        self.assertEqual(kept, STATE)
+        self.assertIsNone(expired)
+        self.assertEqual(stats, {"loads": 3, "hits": 1, "saves": 4, "errors": 0})
+
+    def test_sqlite_store_is_shared_between_workers(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            path = os.path.join(temp_dir, "sessions", "sessions.db")
+
+            async def run():
+                worker_a = SqliteSessionStore(path, ttl=60)
+                worker_b = SqliteSessionStore(path, ttl=60)
+                await worker_a.save("thread", STATE)
+                resumed = await worker_b.load("thread")
+                await worker_b.delete("thread")
+                deleted = await worker_a.load("thread")
+                expired_store = SqliteSessionStore(path, ttl=-1)
+                await expired_store.save("old", STATE)
+                expired = await worker_a.load("old")
+                for store in (worker_a, worker_b, expired_store):
+                    await store.close()
+                return resumed, deleted, expired
+
+            resumed, deleted, expired = asyncio.run(run())
+
+        self.assertEqual(resumed, STATE)
+        self.assertIsNone(deleted)
+        self.assertIsNone(expired)
+
+    def test_redis_store_speaks_the_redis_protocol(self):
+        async def run():
+            server = RedisStandIn()
+            url = await server.start()
+            worker_a = RedisSessionStore(url, ttl=60)
+            worker_b = RedisSessionStore(url, ttl=60)
+            await worker_a.save("thread", STATE)
+            resumed = await worker_b.load("thread")
+            await worker_b.delete("thread")
+            deleted = await worker_a.load("thread")
+            await worker_a.close()
+            await worker_b.close()
+            await server.close()
+            return server, resumed, deleted
+
+        server, resumed, deleted = asyncio.run(run())
+
+        self.assertEqual(resumed, STATE)
+        self.assertIsNone(deleted)
+        self.assertEqual(list(server.values), [])
+        # Each worker authenticates and selects the database once, then reuses its connection
+        self.assertEqual(server.commands, ["AUTH", "SELECT", "SET", "AUTH", "SELECT", "GET", "DEL", "GET"])
+
+    def test_reconnected_session_resumes_on_another_worker(self):
+        auth = {"sessionId": "session-1", "clientType": "webapp"}
+
+        async def run():
+            store = MemorySessionStore()
+            await chainlit.socket.connect("socket-1", {}, auth)
+            init_ws_context("socket-1")
+            first_thread = cl.context.session.thread_id
+            await store.save(session_key(), STATE)
+            # The worker that held the session is gone, the client reconnects elsewhere
+            await WebsocketSession.get("socket-1").delete()
+            await chainlit.socket.connect("socket-2", {}, auth)
+            init_ws_context("socket-2")
+            resumed = await store.load(session_key())
+            second_thread = cl.context.session.thread_id
+            await WebsocketSession.get("socket-2").delete()
+            return first_thread, second_thread, resumed
+
+        with mock.patch.object(chainlit.socket, "require_login", return_value=False):
+            first_thread, second_thread, resumed = asyncio.run(run())
+
+        # A new thread id is generated, the session id is what the client sends again
+        self.assertNotEqual(first_thread, second_thread)
+        self.assertEqual(resumed, STATE)
+
+    def test_failing_store_is_treated_as_empty(self):
+        async def run():
+            store = FailingSessionStore()
+            await store.save("thread", STATE)
+            return await store.load("thread"), store.stats()
+
+        with self.assertLogs("session_store", level="WARNING"):
+            state, stats = asyncio.run(run())
+
+        self.assertIsNone(state)
+        self.assertEqual(stats["errors"], 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
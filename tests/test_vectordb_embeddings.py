@@ -0,0 +1,109 @@
+import sys
+sys.path.append('../')
+import os
+import shutil
+import tempfile
+import unittest
+import numpy as np
+from chromadb.api.types import Documents, EmbeddingFunction, Embeddings
+from vectordb_embeddings import EmbeddingStore, MemoizedEmbeddingFunction
+
+
+class CountingEmbeddingFunction(EmbeddingFunction[Documents]):
+    def __init__(self):
+        self.embedded = []
+
+    def __call__(self, input: Documents) -> Embeddings:
+        self.embedded.extend(input)
+        return [np.array([len(text), text.count(" "), 1.0], dtype=np.float32) for text in input]
+
+    @staticmethod
+    def name() -> str:
+        return "counting"
+
+
+class TestMemoizedEmbeddingFunction(unittest.TestCase):
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.function = CountingEmbeddingFunction()
+
+    def tearDown(self):
+        shutil.rmtree(self.path, ignore_errors=True)
+
+    def test_only_unseen_texts_are_embedded(self):
+        memoized = MemoizedEmbeddingFunction(self.function)
+
+        first = memoized(["Azure Front Door", "Cosmos DB", "Azure Front Door"])
+        second = memoized(["Cosmos DB", "API Management"])
+
+        self.assertEqual(self.function.embedded, ["Azure Front Door", "Cosmos DB", "API Management"])
+        np.testing.assert_array_equal(first[0], first[2])
+        np.testing.assert_array_equal(first[1], second[0])
+        self.assertEqual(memoized.stats()["memory_hits"], 1)
+        self.assertEqual(memoized.stats()["misses"], 3)
+
+    def test_memory_tier_is_lru(self):
+        memoized = MemoizedEmbeddingFunction(self.function, max_memory_entries=2)
+
+        memoized(["A", "B"])
+        memoized(["A"])
+        memoized(["C"])
+        memoized(["A", "B"])
+
+        self.assertEqual(self.function.embedded, ["A", "B", "C", "B"])
+
+    def test_vectors_persist_across_instances(self):
+        memoized = MemoizedEmbeddingFunction(self.function, EmbeddingStore(self.path))
+        expected = memoized(["Azure Front Door", "Cosmos DB"])
+
+        function = CountingEmbeddingFunction()
+        memoized = MemoizedEmbeddingFunction(function, EmbeddingStore(self.path))
+        vectors = memoized(["Cosmos DB", "Azure Front Door", "Event Hubs"])
+
+        self.assertEqual(function.embedded, ["Event Hubs"])
+        np.testing.assert_array_equal(vectors[0], expected[1])
+        np.testing.assert_array_equal(vectors[1], expected[0])
+        self.assertEqual(memoized.stats()["store_hits"], 2)
+        self.assertEqual(len(EmbeddingStore(self.path)), 3)
+
+    def test_interrupted_write_is_ignored(self):
+        store = EmbeddingStore(self.path)
+        MemoizedEmbeddingFunction(self.function, store)(["A", "B"])
+        # A vector written without its hash
+        with open(store.vectors_path, "ab") as f:
+            f.write(np.zeros(3, dtype=np.float32).tobytes())
+
+        self.assertEqual(len(EmbeddingStore(self.path)), 2)
+
+    def test_vectors_after_an_interrupted_write_match_their_texts(self):
+        store = EmbeddingStore(self.path)
+        expected = MemoizedEmbeddingFunction(self.function, store)(["A", "B"])
+        # A vector written without its hash, then the process crashed
+        with open(store.vectors_path, "ab") as f:
+            f.write(np.full(3, 9, dtype=np.float32).tobytes())
+
+        memoized = MemoizedEmbeddingFunction(self.function, EmbeddingStore(self.path))
+        vectors = memoized(["A", "Cosmos DB"])
+        reloaded = MemoizedEmbeddingFunction(self.function, EmbeddingStore(self.path))(["Cosmos DB", "B"])
+
+        np.testing.assert_array_equal(vectors[0], expected[0])
+        np.testing.assert_array_equal(vectors[1], [9, 1, 1])
+        np.testing.assert_array_equal(reloaded[0], [9, 1, 1])
+        np.testing.assert_array_equal(reloaded[1], expected[1])
+
+    def test_usable_as_collection_embedding_function(self):
+        import chromadb
+        memoized = MemoizedEmbeddingFunction(self.function)
+        collection = chromadb.EphemeralClient().get_or_create_collection(
+            "memoized", embedding_function=memoized)
+
+        collection.add(ids=["1", "2"], documents=["Azure Front Door", "Cosmos DB"])
+        result = collection.query(query_texts=["Cosmos DB"], n_results=1)
+
+        self.assertEqual(result["ids"][0], ["2"])
+        self.assertEqual(self.function.embedded, ["Azure Front Door", "Cosmos DB"])
+
+
+if __name__ == "__main__":
+    unittest.main()
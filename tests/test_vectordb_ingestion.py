@@ -0,0 +1,140 @@
+import sys
+sys.path.append('../')
+import asyncio
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+from unittest.mock import MagicMock
+from vectordb_ingestion import DocumentIngestor, IngestionCheckpoint, SourceDocument, chunk_text
+from vectordb_provider import PersistentChromaDBClient
+
+
+class TestChunkText(unittest.TestCase):
+
+    def test_short_text_is_one_chunk(self):
+        self.assertEqual(chunk_text("  Azure Front Door  "), ["Azure Front Door"])
+        self.assertEqual(chunk_text("   "), [])
+
+    def test_long_text_is_split_at_breaks_with_overlap(self):
+        text = "\n\n".join(f"Paragraph {i} " + "word " * 30 for i in range(10))
+
+        chunks = chunk_text(text, chunk_size=200, overlap=20)
+
+        self.assertGreater(len(chunks), 1)
+        self.assertTrue(all(len(chunk) <= 200 for chunk in chunks))
+        self.assertTrue(chunks[0].startswith("Paragraph 0"))
+        self.assertIn("Paragraph 9", chunks[-1])
+
+
+class TestDocumentIngestor(unittest.TestCase):
+
+    def setUp(self):
+        self.db = MagicMock()
+        self.batches = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.lock = threading.Lock()
+
+    def embed(self, texts):
+        with self.lock:
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        self.batches.append(len(texts))
+        with self.lock:
+            self.in_flight -= 1
+        return [[float(len(text)), 1.0] for text in texts]
+
+    def documents(self, count):
+        return [SourceDocument(f"doc{i}", f"Document {i}", {"title": f"Title {i}"}) for i in range(count)]
+
+    def test_ingest_in_batches(self):
+        ingestor = DocumentIngestor(self.db, "guidance", embedder=self.embed, batch_size=4,
+                                    max_concurrency=2)
+
+        report = asyncio.run(ingestor.ingest(self.documents(10)))
+
+        self.assertEqual(report.documents, 10)
+        self.assertEqual(report.chunks, 10)
+        self.assertEqual(sorted(self.batches), [2, 4, 4])
+        self.assertLessEqual(self.max_in_flight, 2)
+        self.assertEqual(self.db.upsert_embeddings.call_count, 3)
+        kwargs = self.db.upsert_embeddings.call_args_list[0].kwargs
+        self.assertEqual(kwargs["ids"][0], "doc0#0")
+        self.assertEqual(kwargs["metadatas"][0], {"title": "Title 0", "source_id": "doc0", "chunk": 0})
+        self.assertGreater(report.docs_per_second, 0)
+
+    def test_ingest_async_iterator(self):
+        async def documents():
+            for document in self.documents(3):
+                yield document
+
+        ingestor = DocumentIngestor(self.db, "guidance", embedder=self.embed, batch_size=2)
+        report = asyncio.run(ingestor.ingest(documents()))
+
+        self.assertEqual(report.documents, 3)
+
+    def test_resume_from_checkpoint(self):
+        path = os.path.join(tempfile.mkdtemp(), "checkpoint.log")
+        ingestor = DocumentIngestor(self.db, "guidance", embedder=self.embed, batch_size=4,
+                                    checkpoint=IngestionCheckpoint(path))
+        asyncio.run(ingestor.ingest(self.documents(5)))
+
+        ingestor = DocumentIngestor(self.db, "guidance", embedder=self.embed, batch_size=4,
+                                    checkpoint=IngestionCheckpoint(path))
+        report = asyncio.run(ingestor.ingest(self.documents(8)))
+
+        self.assertEqual(report.skipped, 5)
+        self.assertEqual(report.documents, 3)
+
+    def test_failed_batch_is_not_checkpointed(self):
+        path = os.path.join(tempfile.mkdtemp(), "checkpoint.log")
+        self.db.upsert_embeddings.side_effect = [None, RuntimeError("disk full")]
+        ingestor = DocumentIngestor(self.db, "guidance", embedder=self.embed, batch_size=2,
+                                    max_concurrency=1, checkpoint=IngestionCheckpoint(path))
+
+        with self.assertRaises(RuntimeError):
+            asyncio.run(ingestor.ingest(self.documents(6)))
+
+        checkpoint = IngestionCheckpoint(path)
+        self.assertIn("doc1", checkpoint)
+        self.assertNotIn("doc2", checkpoint)
+
+
+class TestReingestion(unittest.TestCase):
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.db = PersistentChromaDBClient(db_path=self.path)
+        self.db.client.get_or_create_collection("guidance", embedding_function=None)
+
+    def tearDown(self):
+        shutil.rmtree(self.path, ignore_errors=True)
+
+    def ingest(self, text):
+        ingestor = DocumentIngestor(self.db, "guidance", embedder=lambda texts: [[float(len(text)), 1.0]
+                                                                                  for text in texts],
+                                    chunk_size=200, chunk_overlap=20)
+        asyncio.run(ingestor.ingest([SourceDocument("doc", text), SourceDocument("other", "Cosmos DB")]))
+
+    def test_shorter_document_replaces_every_old_chunk(self):
+        self.ingest("\n\n".join(f"Paragraph {i} " + "word " * 30 for i in range(10)))
+        self.assertGreater(len(self.db.get_all_documents("guidance", where={"source_id": "doc"})["ids"]), 2)
+
+        self.ingest("Azure Front Door")
+
+        documents = self.db.get_all_documents("guidance", include=["documents"])
+        self.assertEqual(sorted(documents["ids"]), ["doc#0", "other#0"])
+        self.assertEqual(self.db.get_lexical_index("guidance").search("paragraph", 10), [])
+
+    def test_emptied_document_is_removed(self):
+        self.ingest("Azure Front Door")
+
+        self.ingest("   ")
+
+        self.assertEqual(self.db.get_all_documents("guidance")["ids"], ["other#0"])
+
+
+if __name__ == "__main__":
+    unittest.main()
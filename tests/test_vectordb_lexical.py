@@ -0,0 +1,97 @@
+import sys
+sys.path.append('../')
+import os
+import shutil
+import tempfile
+import unittest
+from vectordb_lexical import BM25Index, tokenize
+
+
+DOCUMENTS = {
+    "cosmos": "Azure Cosmos DB is a globally distributed NoSQL database.",
+    "frontdoor": "Azure Front Door routes global HTTP traffic to the closest backend.",
+    "apim": "API Management (APIM) publishes APIs behind a gateway in front of backends.",
+    "sql": "Azure SQL Database is a managed relational database.",
+}
+
+
+class TestBM25Index(unittest.TestCase):
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.index_path = os.path.join(self.path, "guidance.jsonl")
+        self.index = BM25Index(self.index_path)
+        self.index.add(list(DOCUMENTS), list(DOCUMENTS.values()))
+
+    def tearDown(self):
+        shutil.rmtree(self.path, ignore_errors=True)
+
+    def test_tokenize(self):
+        self.assertEqual(tokenize("Cosmos-DB, Front Door"), ["cosmos", "db", "front", "door"])
+
+    def test_exact_service_names_rank_first(self):
+        self.assertEqual(self.index.search("Cosmos DB")[0][0], "cosmos")
+        self.assertEqual(self.index.search("front door")[0][0], "frontdoor")
+        self.assertEqual(self.index.search("APIM")[0][0], "apim")
+        self.assertEqual(self.index.search("kubernetes"), [])
+
+    def test_add_replaces_and_remove_deletes(self):
+        self.index.add(["cosmos"], ["Azure Cache for Redis"])
+        self.index.remove(["sql", "missing"])
+
+        self.assertEqual(len(self.index), 3)
+        self.assertNotIn("cosmos", [document_id for document_id, _ in self.index.search("cosmos")])
+        self.assertEqual(self.index.search("redis")[0][0], "cosmos")
+        self.assertEqual(self.index.search("relational"), [])
+
+    def test_reload_replays_log(self):
+        self.index.remove(["sql"])
+        self.index.add(["frontdoor"], ["Azure Front Door with WAF policies"])
+
+        reloaded = BM25Index(self.index_path)
+        self.assertEqual(len(reloaded), 3)
+        self.assertEqual(reloaded.search("waf"), self.index.search("waf"))
+        self.assertEqual(reloaded.search("database"), self.index.search("database"))
+
+    def test_compact_keeps_live_documents(self):
+        self.index.remove(["sql"])
+        self.index.compact()
+
+        with open(self.index_path, encoding="utf-8") as f:
+            self.assertEqual(len(f.readlines()), 3)
+        self.assertEqual(BM25Index(self.index_path).search("Cosmos DB"), self.index.search("Cosmos DB"))
+
+
+    def test_changes_of_other_workers_are_searched(self):
+        other_worker = BM25Index(self.index_path)
+
+        other_worker.add(["redis"], ["Azure Cache for Redis keeps sessions in memory."])
+        self.index.remove(["sql"])
+
+        self.assertEqual(self.index.search("redis")[0][0], "redis")
+        self.assertEqual(other_worker.search("relational"), [])
+        self.assertEqual(len(self.index), len(other_worker))
+
+    def test_log_compacted_by_another_worker_is_reloaded(self):
+        other_worker = BM25Index(self.index_path)
+        other_worker.remove(["cosmos"])
+        other_worker.compact()
+        other_worker.add(["redis"], ["Azure Cache for Redis"])
+
+        self.assertEqual(self.index.search("cosmos"), [])
+        self.assertEqual(self.index.search("redis")[0][0], "redis")
+        self.assertEqual(len(self.index), 4)
+
+    def test_line_being_written_is_applied_once_complete(self):
+        line = '{"id":"redis","terms":{"redis":1}}\n'
+        with open(self.index_path, "a", encoding="utf-8") as f:
+            f.write(line[:10])
+        self.assertEqual(self.index.search("redis"), [])
+
+        with open(self.index_path, "a", encoding="utf-8") as f:
+            f.write(line[10:])
+        self.assertEqual(self.index.search("redis")[0][0], "redis")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,6 +1,10 @@
 import unittest
 from unittest.mock import MagicMock
+import os
+import shutil
 import sys
+import tempfile
+import numpy as np
 sys.path.append('../')
 
 
@@ -58,5 +62,169 @@ class TestPersistentChromaDBClient(unittest.TestCase):
         )
 
 
+class TestDocumentPagination(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        # Clients are shared per database path, so the database outlives the tests.
+        cls.tmp = tempfile.mkdtemp()
+        cls.db_path = os.path.join(cls.tmp, "db")
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.tmp, ignore_errors=True)
+
+    def setUp(self):
+        from vectordb_provider import PersistentChromaDBClient
+        self.client = PersistentChromaDBClient(self.db_path)
+        self.client.create_collection("guidance", "Azure guidance")
+        self.client.upsert_embeddings(
+            "guidance",
+            ids=[f"id{i}" for i in range(25)],
+            embeddings=[[float(i), 1.0, 0.5] for i in range(25)],
+            documents=[f"chunk {i} \u00e9" for i in range(25)],
+            metadatas=[{"source": "waf" if i % 2 else "caf", "chunk": i} for i in range(25)])
+
+    def tearDown(self):
+        for collection in self.client.get_client().list_collections():
+            self.client.delete_collection(collection.name)
+
+    def test_iter_pages(self):
+        pages = list(self.client.iter_pages("guidance", page_size=10))
+
+        self.assertEqual([len(page["ids"]) for page in pages], [10, 10, 5])
+
+    def test_iter_documents_with_projection_and_filter(self):
+        documents = list(self.client.iter_documents("guidance", page_size=4, include=["metadatas"],
+                                                    where={"source": "waf"}))
+
+        self.assertEqual(len(documents), 12)
+        self.assertEqual(set(documents[0]), {"id", "metadata"})
+        self.assertTrue(all(document["metadata"]["source"] == "waf" for document in documents))
+
+    def test_existing_collection_is_resolved_once(self):
+        from vectordb_provider import PersistentChromaDBClient
+        client = PersistentChromaDBClient(self.db_path)
+        client.get_collection = MagicMock(wraps=client.get_collection)
+
+        self.assertEqual(len(list(client.iter_documents("guidance"))), 25)
+        self.assertEqual(len(client.get_all_documents("guidance")["ids"]), 25)
+        client.get_collection.assert_called_once_with("guidance")
+
+    def test_existing_collection_queries_use_the_memoized_embeddings(self):
+        from chromadb.utils.embedding_functions import DefaultEmbeddingFunction
+        from vectordb_embeddings import MemoizedEmbeddingFunction
+        from vectordb_provider import PersistentChromaDBClient
+        embedded = []
+
+        class CountingEmbeddingFunction(DefaultEmbeddingFunction):
+            def __call__(self, input):
+                embedded.extend(input)
+                return [np.array([1.0, 1.0, 0.5], dtype=np.float32) for _ in input]
+
+        # A collection created by an earlier run of the app
+        client = PersistentChromaDBClient(self.db_path)
+        client._embedding_function = MemoizedEmbeddingFunction(CountingEmbeddingFunction())
+        client.query_documents("guidance", query_texts=["Front Door"], n_results=1)
+        result = client.query_documents("guidance", query_texts=["Front Door"], n_results=1)
+
+        self.assertEqual(embedded, ["Front Door"])
+        self.assertEqual(result["ids"], [["id1"]])
+
+    def test_clients_are_shared_per_path(self):
+        from vectordb_provider import PersistentChromaDBClient
+        client = PersistentChromaDBClient(os.path.join(self.db_path, "..", "db"))
+
+        self.assertIs(client.get_client(), self.client.get_client())
+        self.assertIsNot(PersistentChromaDBClient(os.path.join(self.tmp, "other")).get_client(),
+                         self.client.get_client())
+
+    def test_clients_are_shared_per_settings(self):
+        from chromadb.config import Settings
+        from vectordb_provider import get_chroma_client
+        path = os.path.join(self.tmp, "settings")
+        client = get_chroma_client(path, settings=Settings(anonymized_telemetry=False))
+
+        self.assertIs(get_chroma_client(path, settings=Settings(anonymized_telemetry=False)), client)
+        # Chroma refuses a second client of the directory with other settings
+        with self.assertRaises(ValueError):
+            get_chroma_client(path, settings=Settings(anonymized_telemetry=False, allow_reset=True))
+
+    def test_get_all_documents(self):
+        result = self.client.get_all_documents("guidance")
+
+        self.assertEqual(len(result["ids"]), 25)
+        self.assertEqual(len(result["documents"]), 25)
+
+    def test_export_import_round_trip(self):
+        path = os.path.join(self.tmp, "guidance.zip")
+
+        self.assertEqual(self.client.export_collection("guidance", path, page_size=10), 25)
+        self.assertEqual(self.client.import_collection(path, "guidance_restored"), 25)
+
+        original = {record["id"]: record for record in self.client.iter_documents(
+            "guidance", include=["documents", "metadatas", "embeddings"])}
+        restored = list(self.client.iter_documents(
+            "guidance_restored", include=["documents", "metadatas", "embeddings"]))
+        self.assertEqual(len(restored), 25)
+        for record in restored:
+            self.assertEqual(record["document"], original[record["id"]]["document"])
+            self.assertEqual(record["metadata"], original[record["id"]]["metadata"])
+            self.assertEqual(list(record["embedding"]), list(original[record["id"]]["embedding"]))
+
+
+class TestHybridSearch(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.tmp = tempfile.mkdtemp()
+        cls.db_path = os.path.join(cls.tmp, "db")
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.tmp, ignore_errors=True)
+
+    def setUp(self):
+        from vectordb_provider import PersistentChromaDBClient
+        self.client = PersistentChromaDBClient(self.db_path)
+        self.client.create_collection("architectures", "Architectures")
+        self.client.upsert_embeddings(
+            "architectures",
+            ids=["cosmos", "frontdoor", "apim"],
+            embeddings=[[1.0, 0.0, 0.0], [0.0, 1.0, 0.0], [0.0, 0.0, 1.0]],
+            documents=["Globally distributed data on Cosmos DB",
+                       "Global routing with Azure Front Door",
+                       "APIs published through APIM"],
+            metadatas=[{"tier": "data"}, {"tier": "edge"}, {"tier": "edge"}])
+
+    def tearDown(self):
+        for collection in self.client.get_client().list_collections():
+            self.client.delete_collection(collection.name)
+
+    def test_keyword_query_takes_lexical_path(self):
+        collection = self.client._collection("architectures")
+        collection.query = MagicMock(wraps=collection.query)
+
+        results = self.client.hybrid_search("architectures", "Front Door", n_results=2)
+
+        self.assertEqual(results[0]["id"], "frontdoor")
+        self.assertEqual(results[0]["metadata"], {"tier": "edge"})
+        collection.query.assert_not_called()
+
+    def test_long_query_fuses_vector_ranking(self):
+        results = self.client.hybrid_search(
+            "architectures", "which service should publish our partner APIs",
+            n_results=3, query_embedding=[0.0, 0.0, 1.0])
+
+        self.assertEqual(results[0]["id"], "apim")
+        self.assertGreater(results[0]["score"], results[-1]["score"])
+
+    def test_index_follows_deletes(self):
+        self.client.delete_documents("architectures", where={"tier": "edge"})
+
+        self.assertEqual(len(self.client.get_lexical_index("architectures")), 1)
+        self.assertEqual(self.client.get_lexical_index("architectures").search("APIM"), [])
+
+
 if __name__ == "__main__":
     unittest.main()
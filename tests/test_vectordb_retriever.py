@@ -0,0 +1,77 @@
+import sys
+sys.path.append('../')
+import asyncio
+import time
+import unittest
+from unittest.mock import MagicMock
+from vectordb_retriever import GuidanceRetriever, format_guidance
+
+
+class TestGuidanceRetriever(unittest.TestCase):
+
+    def setUp(self):
+        self.db = MagicMock()
+        self.db.query_documents.return_value = {
+            "ids": [["waf#0", "caf#3"]],
+            "documents": [["Use availability zones.", "Define a landing zone."]],
+            "metadatas": [[{"title": "Reliability", "source": "waf/reliability.md"},
+                           {"title": "Landing zones", "source": "caf/landing-zones.md"}]],
+            "distances": [[0.2, 0.6]],
+        }
+        self.embedded = []
+
+    def embed(self, texts):
+        self.embedded.extend(texts)
+        return [[1.0, 0.0] for _ in texts]
+
+    def test_search(self):
+        retriever = GuidanceRetriever(self.db, "guidance", top_k=2, embedder=self.embed)
+
+        chunks = retriever.search("Highly available web app")
+
+        self.assertEqual([chunk.title for chunk in chunks], ["Reliability", "Landing zones"])
+        self.assertAlmostEqual(chunks[0].similarity, 0.9)
+        self.db.query_documents.assert_called_once_with(
+            "guidance", query_embeddings=[[1.0, 0.0]], n_results=2)
+
+    def test_query_embeddings_are_cached(self):
+        retriever = GuidanceRetriever(self.db, "guidance", query_cache_size=1, embedder=self.embed)
+
+        retriever.search("Highly available  web app")
+        retriever.search("highly available web app")
+        retriever.search("Data lake")
+        retriever.search("Highly available web app")
+
+        # The queries are embedded as written, the normalized query is only the cache key
+        self.assertEqual(self.embedded, ["Highly available  web app", "Data lake", "Highly available web app"])
+        self.assertEqual(retriever.stats()["cache_hits"], 1)
+        self.assertEqual(retriever.stats()["cached_queries"], 1)
+
+    def test_latency_budget(self):
+        def slow_embed(texts):
+            time.sleep(0.3)
+            return self.embed(texts)
+
+        retriever = GuidanceRetriever(self.db, "guidance", latency_budget_ms=50, embedder=slow_embed)
+
+        async def retrieve():
+            started = time.perf_counter()
+            chunks = await retriever.retrieve("Data lake")
+            return chunks, time.perf_counter() - started
+
+        chunks, elapsed = asyncio.run(retrieve())
+
+        self.assertEqual(chunks, [])
+        self.assertLess(elapsed, 0.3)
+        self.assertEqual(retriever.stats()["over_budget"], 1)
+
+    def test_failures_return_no_guidance(self):
+        self.db.query_documents.side_effect = ValueError("Collection azure_guidance does not exist")
+        retriever = GuidanceRetriever(self.db, "guidance", embedder=self.embed)
+
+        self.assertEqual(asyncio.run(retriever.retrieve("Data lake")), [])
+        self.assertEqual(format_guidance([]), "No relevant guidance found.")
+
+
+if __name__ == "__main__":
+    unittest.main()
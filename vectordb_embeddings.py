@@ -0,0 +1,215 @@
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+import numpy as np
+from chromadb.api.types import Documents, EmbeddingFunction, Embeddings, Space
+from chromadb.utils import embedding_functions
+
+
+# Opt-in switch of the embedding memoization.
+EMBEDDING_CACHE_ENABLED = os.getenv("EMBEDDING_CACHE_ENABLED", "false").lower() in ("1", "true", "yes")
+
+# Size of a content hash in the index file.
+DIGEST_SIZE = 32
+
+
+class EmbeddingStore:
+    """
+    Persistent store of embeddings by content hash.
+
+    Vectors are appended to a float32 file read through a memory map, and
+    the content hashes to an index file whose n-th hash is the key of the
+    n-th vector. Both files are append-only, the rows of a write interrupted
+    between the two are truncated on the next load, so that the vectors
+    appended next are at the rows of their hashes.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.vectors_path = os.path.join(path, "vectors.f32")
+        self.index_path = os.path.join(path, "index.bin")
+        self.meta_path = os.path.join(path, "meta.json")
+        self.dimension: Optional[int] = None
+        self.rows: Dict[bytes, int] = {}
+        self._map: Optional[np.memmap] = None
+        os.makedirs(path, exist_ok=True)
+        self._load()
+
+    def __len__(self) -> int:
+        return len(self.rows)
+
+    def __contains__(self, digest: bytes) -> bool:
+        return digest in self.rows
+
+    def get(self, digest: bytes) -> Optional[np.ndarray]:
+        """
+        Get the vector of a content hash.
+        """
+        row = self.rows.get(digest)
+        if row is None:
+            return None
+        if self._map is None or row >= self._map.shape[0]:
+            self._remap()
+        return np.array(self._map[row])
+
+    def put_many(self, digests: List[bytes], vectors: List[np.ndarray]) -> None:
+        """
+        Append the vectors of new content hashes.
+        """
+        new = [(digest, vector) for digest, vector in zip(digests, vectors) if digest not in self.rows]
+        if not new:
+            return
+        if self.dimension is None:
+            self.dimension = len(new[0][1])
+            with open(self.meta_path, "w", encoding="utf-8") as f:
+                json.dump({"dimension": self.dimension}, f)
+        data = np.asarray([vector for _, vector in new], dtype=np.float32)
+        if data.shape[1] != self.dimension:
+            raise ValueError(f"Expected embeddings of dimension {self.dimension}, got {data.shape[1]}")
+        # Vectors first, so an indexed hash always has its vector
+        with open(self.vectors_path, "ab") as f:
+            f.write(data.tobytes())
+        with open(self.index_path, "ab") as f:
+            f.write(b"".join(digest for digest, _ in new))
+        for digest, _ in new:
+            self.rows[digest] = len(self.rows)
+
+    def _load(self) -> None:
+        if not os.path.exists(self.meta_path):
+            return
+        with open(self.meta_path, encoding="utf-8") as f:
+            self.dimension = json.load(f)["dimension"]
+        index = b""
+        if os.path.exists(self.index_path):
+            with open(self.index_path, "rb") as f:
+                index = f.read()
+        vectors = os.path.getsize(self.vectors_path) // (4 * self.dimension) \
+            if os.path.exists(self.vectors_path) else 0
+        count = min(len(index) // DIGEST_SIZE, vectors)
+        # Drop the rows of an interrupted write, appending after them would
+        # shift every later vector away from its hash
+        if vectors > count:
+            os.truncate(self.vectors_path, count * 4 * self.dimension)
+        if len(index) > count * DIGEST_SIZE:
+            os.truncate(self.index_path, count * DIGEST_SIZE)
+        self.rows = {index[row * DIGEST_SIZE:(row + 1) * DIGEST_SIZE]: row for row in range(count)}
+
+    def _remap(self) -> None:
+        rows = os.path.getsize(self.vectors_path) // (4 * self.dimension)
+        self._map = np.memmap(self.vectors_path, dtype=np.float32, mode="r", shape=(rows, self.dimension))
+
+
+class MemoizedEmbeddingFunction(EmbeddingFunction[Documents]):
+    """
+    Embedding function that only runs the wrapped model on texts it has not seen.
+
+    Texts are keyed by the hash of the model name and their content. Recent
+    vectors stay in an in-memory LRU tier of `max_memory_entries` entries,
+    all vectors in the optional persistent store.
+    """
+
+    def __init__(self,
+                 function: EmbeddingFunction[Documents],
+                 store: Optional[EmbeddingStore] = None,
+                 max_memory_entries: int = 10000):
+        self.function = function
+        self.store = store
+        self.max_memory_entries = max_memory_entries
+        self.memory: "OrderedDict[bytes, np.ndarray]" = OrderedDict()
+        self.memory_hits = 0
+        self.store_hits = 0
+        self.misses = 0
+        self._prefix = f"{function.name()}\0".encode("utf-8")
+        self._lock = threading.Lock()
+
+    def __call__(self, input: Documents) -> Embeddings:
+        digests = [hashlib.sha256(self._prefix + text.encode("utf-8")).digest() for text in input]
+        vectors: List[Optional[np.ndarray]] = [None] * len(input)
+        missing: Dict[bytes, List[int]] = {}
+        with self._lock:
+            for position, digest in enumerate(digests):
+                vector = self.memory.get(digest)
+                if vector is not None:
+                    self.memory.move_to_end(digest)
+                    self.memory_hits += 1
+                elif self.store is not None and digest in self.store:
+                    vector = self.store.get(digest)
+                    self._remember(digest, vector)
+                    self.store_hits += 1
+                if vector is None:
+                    missing.setdefault(digest, []).append(position)
+                else:
+                    vectors[position] = vector
+
+        if missing:
+            # Embed each unseen text once, in a single batch
+            texts = [input[positions[0]] for positions in missing.values()]
+            embedded = [np.asarray(vector, dtype=np.float32) for vector in self.function(texts)]
+            with self._lock:
+                self.misses += len(texts)
+                for (digest, positions), vector in zip(missing.items(), embedded):
+                    self._remember(digest, vector)
+                    for position in positions:
+                        vectors[position] = vector
+                if self.store is not None:
+                    self.store.put_many(list(missing), embedded)
+        return vectors  # type: ignore
+
+    def stats(self) -> Dict[str, int]:
+        """
+        Get the memoization counters.
+        """
+        with self._lock:
+            return {
+                "memory_hits": self.memory_hits,
+                "store_hits": self.store_hits,
+                "misses": self.misses,
+                "memory_entries": len(self.memory),
+                "stored": len(self.store) if self.store is not None else 0,
+            }
+
+    def name(self) -> str:  # type: ignore[override]
+        return self.function.name()
+
+    def get_config(self) -> Dict[str, Any]:
+        return self.function.get_config()
+
+    def is_legacy(self) -> bool:
+        return self.function.is_legacy()
+
+    def default_space(self) -> Space:
+        return self.function.default_space()
+
+    def supported_spaces(self) -> List[Space]:
+        return self.function.supported_spaces()
+
+    def _remember(self, digest: bytes, vector: np.ndarray) -> None:
+        self.memory[digest] = vector
+        self.memory.move_to_end(digest)
+        while len(self.memory) > self.max_memory_entries:
+            self.memory.popitem(last=False)
+
+
+_embedding_function: Optional[EmbeddingFunction[Documents]] = None
+_embedding_function_lock = threading.Lock()
+
+
+def get_embedding_function() -> EmbeddingFunction[Documents]:
+    """
+    Get the process-wide default embedding function, memoized if enabled.
+    """
+    global _embedding_function
+    with _embedding_function_lock:
+        if _embedding_function is not None:
+            return _embedding_function
+        function = embedding_functions.DefaultEmbeddingFunction()
+        if EMBEDDING_CACHE_ENABLED:
+            function = MemoizedEmbeddingFunction(
+                function,
+                EmbeddingStore(os.path.join(os.getenv("EMBEDDING_CACHE_DIR", "embeddings"), function.name())),
+                max_memory_entries=int(os.getenv("EMBEDDING_CACHE_MAX_ENTRIES", 10000)))
+        _embedding_function = function
+        return _embedding_function
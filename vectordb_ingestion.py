@@ -0,0 +1,324 @@
+import argparse
+import asyncio
+import hashlib
+import logging
+import os
+import time
+from typing import (AsyncIterable, AsyncIterator, Callable, Dict, Iterable, List, NamedTuple,
+                    Optional, Set, Tuple, Union)
+from vectordb_provider import PersistentChromaDBClient
+
+
+# Extensions of the guidance files converted by markitdown.
+SOURCE_EXTENSIONS = (".md", ".markdown", ".html", ".htm")
+
+# Embeds a batch of texts; run on a worker thread.
+Embedder = Callable[[List[str]], List[List[float]]]
+
+
+class SourceDocument(NamedTuple):
+    id: str
+    text: str
+    metadata: Optional[Dict[str, Union[str, int, float, bool]]] = None
+
+
+class IngestionReport(NamedTuple):
+    documents: int
+    skipped: int
+    chunks: int
+    seconds: float
+
+    @property
+    def docs_per_second(self) -> float:
+        return self.documents / self.seconds if self.seconds else 0.0
+
+
+def chunk_text(text: str, chunk_size: int = 1000, overlap: int = 100) -> List[str]:
+    """
+    Split a text into chunks of about `chunk_size` characters, overlapping by
+    `overlap` characters, cutting at paragraph or line breaks when possible.
+    """
+    text = text.strip()
+    if len(text) <= chunk_size:
+        return [text] if text else []
+    chunks = []
+    start = 0
+    while start < len(text):
+        end = min(start + chunk_size, len(text))
+        if end < len(text):
+            # Prefer a paragraph break, then a line break, in the second half of the chunk
+            for separator in ("\n\n", "\n", " "):
+                cut = text.rfind(separator, start + chunk_size // 2, end)
+                if cut != -1:
+                    end = cut
+                    break
+        chunk = text[start:end].strip()
+        if chunk:
+            chunks.append(chunk)
+        if end >= len(text):
+            break
+        start = max(end - overlap, start + 1)
+    return chunks
+
+
+def default_embedder(db: PersistentChromaDBClient) -> Embedder:
+    """
+    Embed with the default embedding function of the database.
+    """
+    embedding_function = db.get_default_embedding_function()
+    return lambda texts: [list(map(float, vector)) for vector in embedding_function(texts)]
+
+
+def embeddings_client_embedder(client) -> Embedder:
+    """
+    Embed with an Azure AI Inference EmbeddingsClient, see `create_embeddings_client`.
+    """
+    def embed(texts: List[str]) -> List[List[float]]:
+        response = client.embed(input=texts)
+        return [item.embedding for item in sorted(response.data, key=lambda item: item.index)]
+    return embed
+
+
+class IngestionCheckpoint:
+    """
+    Append-only log of the ids of the documents fully ingested, so that an
+    interrupted ingestion resumes where it stopped.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.done: Set[str] = set()
+        if os.path.exists(path):
+            with open(path, encoding='utf-8') as f:
+                self.done = {line.rstrip('\n') for line in f if line.strip()}
+        self._file = None
+
+    def __contains__(self, document_id: str) -> bool:
+        return document_id in self.done
+
+    def mark(self, document_ids: List[str]) -> None:
+        """
+        Record that documents are fully ingested.
+        """
+        if not document_ids:
+            return
+        if self._file is None:
+            self._file = open(self.path, 'a', encoding='utf-8')
+        self._file.write(''.join(f"{document_id}\n" for document_id in document_ids))
+        self._file.flush()
+        self.done.update(document_ids)
+
+    def close(self) -> None:
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+class DocumentIngestor:
+    """
+    Stream documents into a collection: chunk them, embed the chunks in
+    batches of `batch_size` with at most `max_concurrency` batches in flight,
+    and upsert each batch as soon as it is embedded.
+
+    Memory stays bounded by the batches in flight. Chunk ids derive from the
+    document id, so re-ingesting a document replaces its chunks, and the
+    chunks past the end of its new version are deleted.
+    """
+
+    def __init__(self,
+                 db: PersistentChromaDBClient,
+                 collection_name: str,
+                 embedder: Optional[Embedder] = None,
+                 chunk_size: int = 1000,
+                 chunk_overlap: int = 100,
+                 batch_size: int = 64,
+                 max_concurrency: int = 4,
+                 checkpoint: Optional[IngestionCheckpoint] = None):
+        self.db = db
+        self.collection_name = collection_name
+        self.embedder = embedder or default_embedder(db)
+        self.chunk_size = chunk_size
+        self.chunk_overlap = chunk_overlap
+        self.batch_size = batch_size
+        self.max_concurrency = max_concurrency
+        self.checkpoint = checkpoint
+
+    async def ingest(self, documents: Union[Iterable[SourceDocument], AsyncIterable[SourceDocument]]
+                     ) -> IngestionReport:
+        """
+        Ingest documents, skipping the ones the checkpoint has already seen.
+        """
+        started = time.perf_counter()
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+        write_lock = asyncio.Lock()
+        tasks: Set[asyncio.Task] = set()
+        # Chunks of each document not upserted yet
+        pending: Dict[str, int] = {}
+        counts = {"documents": 0, "skipped": 0, "chunks": 0}
+
+        async def process(batch: List[tuple]) -> None:
+            try:
+                embeddings = await asyncio.to_thread(self.embedder, [chunk[2] for chunk in batch])
+                async with write_lock:
+                    await asyncio.to_thread(
+                        self.db.upsert_embeddings,
+                        self.collection_name,
+                        ids=[chunk[1] for chunk in batch],
+                        embeddings=embeddings,
+                        documents=[chunk[2] for chunk in batch],
+                        metadatas=[chunk[3] for chunk in batch])
+                    completed = []
+                    for document_id, *_ in batch:
+                        pending[document_id] -= 1
+                        if pending[document_id] == 0:
+                            del pending[document_id]
+                            completed.append(document_id)
+                    counts["documents"] += len(completed)
+                    counts["chunks"] += len(batch)
+                    if self.checkpoint is not None:
+                        self.checkpoint.mark(completed)
+            finally:
+                semaphore.release()
+
+        async def submit(batch: List[tuple]) -> None:
+            await semaphore.acquire()
+            # Surface embedding or write failures without waiting for the end
+            for task in [task for task in tasks if task.done()]:
+                tasks.discard(task)
+                task.result()
+            tasks.add(asyncio.create_task(process(batch)))
+
+        batch: List[tuple] = []
+        try:
+            async for document in _aiter(documents):
+                if self.checkpoint is not None and document.id in self.checkpoint:
+                    counts["skipped"] += 1
+                    continue
+                chunks = chunk_text(document.text, self.chunk_size, self.chunk_overlap)
+                # A shorter new version would leave the last chunks of the old one behind
+                async with write_lock:
+                    await asyncio.to_thread(
+                        self.db.delete_documents,
+                        self.collection_name,
+                        where={"$and": [{"source_id": document.id}, {"chunk": {"$gte": len(chunks)}}]})
+                if not chunks:
+                    continue
+                pending[document.id] = pending.get(document.id, 0) + len(chunks)
+                for index, chunk in enumerate(chunks):
+                    metadata = dict(document.metadata or {})
+                    metadata.update({"source_id": document.id, "chunk": index})
+                    batch.append((document.id, f"{document.id}#{index}", chunk, metadata))
+                    if len(batch) >= self.batch_size:
+                        await submit(batch)
+                        batch = []
+            if batch:
+                await submit(batch)
+            if tasks:
+                await asyncio.gather(*tasks)
+        finally:
+            for task in tasks:
+                task.cancel()
+            if self.checkpoint is not None:
+                self.checkpoint.close()
+
+        report = IngestionReport(counts["documents"], counts["skipped"], counts["chunks"],
+                                 time.perf_counter() - started)
+        logging.info(f"Ingested {report.documents} documents ({report.chunks} chunks) into "
+                     f"{self.collection_name} at {report.docs_per_second:.1f} docs/sec, "
+                     f"skipped {report.skipped}")
+        return report
+
+
+async def _aiter(documents: Union[Iterable[SourceDocument], AsyncIterable[SourceDocument]]
+                 ) -> AsyncIterator[SourceDocument]:
+    if hasattr(documents, "__aiter__"):
+        async for document in documents:
+            yield document
+    else:
+        for document in documents:
+            yield document
+
+
+def find_source_files(paths: List[str], extensions: Tuple[str, ...] = SOURCE_EXTENSIONS) -> List[str]:
+    """
+    Get the files with the given extensions in files and directories, recursively.
+    """
+    files = []
+    for path in paths:
+        if os.path.isfile(path):
+            files.append(path)
+            continue
+        for root, _, names in os.walk(path):
+            files.extend(os.path.join(root, name) for name in sorted(names)
+                         if name.lower().endswith(extensions))
+    return files
+
+
+def source_id(path: str) -> str:
+    """
+    Get the document id of a source file, stable across runs.
+    """
+    return hashlib.sha256(os.path.abspath(path).encode("utf-8")).hexdigest()[:32]
+
+
+def convert_file(path: str) -> SourceDocument:
+    """
+    Convert a markdown or HTML file to a document with markitdown.
+    """
+    from markitdown import MarkItDown
+    result = MarkItDown().convert(path)
+    text = result.text_content or ""
+    title = result.title or next(
+        (line.lstrip("#").strip() for line in text.splitlines() if line.startswith("#")),
+        os.path.basename(path))
+    return SourceDocument(source_id(path), text, {"title": title, "source": path})
+
+
+async def convert_files(paths: List[str]) -> AsyncIterator[SourceDocument]:
+    """
+    Convert files one by one on a worker thread, skipping the ones that fail.
+    """
+    for path in paths:
+        try:
+            yield await asyncio.to_thread(convert_file, path)
+        except Exception as e:
+            logging.error(f"Could not convert {path}: {str(e)}")
+
+
+def main() -> None:
+    """
+    Build the Azure guidance index from local markdown and HTML files.
+    """
+    from vectordb_retriever import GUIDANCE_COLLECTION
+    parser = argparse.ArgumentParser(description=main.__doc__.strip())
+    parser.add_argument("paths", nargs="+", help="Files or directories to ingest")
+    parser.add_argument("--collection", default=GUIDANCE_COLLECTION)
+    parser.add_argument("--chunk-size", type=int, default=1000)
+    parser.add_argument("--chunk-overlap", type=int, default=100)
+    parser.add_argument("--batch-size", type=int, default=64)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--checkpoint", default=None,
+                        help="Checkpoint file to resume an interrupted ingestion")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    db = PersistentChromaDBClient()
+    db.create_collection(args.collection, "Azure architecture guidance")
+    checkpoint = IngestionCheckpoint(args.checkpoint) if args.checkpoint else None
+    ingestor = DocumentIngestor(
+        db, args.collection,
+        chunk_size=args.chunk_size,
+        chunk_overlap=args.chunk_overlap,
+        batch_size=args.batch_size,
+        max_concurrency=args.concurrency,
+        checkpoint=checkpoint)
+    # Files already ingested are not converted again
+    files = find_source_files(args.paths)
+    pending = [path for path in files if checkpoint is None or source_id(path) not in checkpoint]
+    report = asyncio.run(ingestor.ingest(convert_files(pending)))
+    print(f"Ingested {report.documents} documents ({report.chunks} chunks), "
+          f"skipped {len(files) - len(pending)}, {report.docs_per_second:.1f} docs/sec")
+
+
+if __name__ == "__main__":
+    main()
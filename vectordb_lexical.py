@@ -0,0 +1,215 @@
+import json
+import math
+import os
+import re
+import threading
+from collections import Counter
+from typing import Dict, Iterable, List, Optional, Tuple
+
+
+# Words of a text: lowercase letters and digits, so "Cosmos DB" and "cosmos-db" match.
+TOKEN_PATTERN = re.compile(r'[a-z0-9]+')
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    Split a text into lowercase terms.
+    """
+    return TOKEN_PATTERN.findall(text.lower())
+
+
+class BM25Index:
+    """
+    Inverted index of a collection, scoring documents with Okapi BM25.
+
+    Changes are appended to a JSON lines log, replayed on load and compacted
+    once superseded entries outnumber the live documents. The postings map
+    each term to the term frequency of each document, by document number.
+
+    The log can be shared by the workers of a node: every read or change
+    first applies the entries the other workers appended since, and reloads
+    the log after another worker compacted it.
+    """
+
+    def __init__(self, path: Optional[str] = None, k1: float = 1.5, b: float = 0.75):
+        self.path = path
+        self.k1 = k1
+        self.b = b
+        self.numbers: Dict[str, int] = {}
+        self.ids: Dict[int, str] = {}
+        self.lengths: Dict[int, int] = {}
+        self.terms: Dict[int, Dict[str, int]] = {}
+        self.postings: Dict[str, Dict[int, int]] = {}
+        self.total_length = 0
+        self.log_entries = 0
+        self._next_number = 0
+        # Log file read so far, by device and inode, and the position read up to
+        self._log_id: Optional[Tuple[int, int]] = None
+        self._offset = 0
+        self._lock = threading.Lock()
+        self._refresh()
+
+    def __len__(self) -> int:
+        with self._lock:
+            self._refresh()
+            return len(self.numbers)
+
+    def add(self, ids: List[str], documents: List[Optional[str]]) -> None:
+        """
+        Index documents, replacing the ones with the same ids.
+        """
+        entries = []
+        with self._lock:
+            self._refresh()
+            for document_id, document in zip(ids, documents):
+                counts = dict(Counter(tokenize(document or "")))
+                self._add(document_id, counts)
+                entries.append({"id": document_id, "terms": counts})
+            self._append(entries)
+
+    def remove(self, ids: Iterable[str]) -> None:
+        """
+        Remove documents from the index.
+        """
+        with self._lock:
+            self._refresh()
+            removed = [document_id for document_id in ids if self._remove(document_id)]
+            self._append([{"delete": document_id} for document_id in removed])
+
+    def search(self, query: str, n_results: int = 10) -> List[Tuple[str, float]]:
+        """
+        Get the ids of the best matching documents with their BM25 scores, best first.
+        """
+        with self._lock:
+            self._refresh()
+            if not self.numbers:
+                return []
+            count = len(self.numbers)
+            average_length = self.total_length / count
+            scores: Dict[int, float] = {}
+            for term in set(tokenize(query)):
+                postings = self.postings.get(term)
+                if not postings:
+                    continue
+                idf = math.log(1 + (count - len(postings) + 0.5) / (len(postings) + 0.5))
+                for number, frequency in postings.items():
+                    norm = self.k1 * (1 - self.b + self.b * self.lengths[number] / average_length)
+                    scores[number] = scores.get(number, 0.0) + \
+                        idf * frequency * (self.k1 + 1) / (frequency + norm)
+            best = sorted(scores.items(), key=lambda item: (-item[1], item[0]))[:n_results]
+            return [(self.ids[number], score) for number, score in best]
+
+    def compact(self) -> None:
+        """
+        Rewrite the log with only the live documents.
+        """
+        with self._lock:
+            self._refresh()
+            self._compact()
+
+    def _add(self, document_id: str, counts: Dict[str, int]) -> None:
+        self._remove(document_id)
+        number = self._next_number
+        self._next_number += 1
+        self.numbers[document_id] = number
+        self.ids[number] = document_id
+        self.terms[number] = counts
+        self.lengths[number] = sum(counts.values())
+        self.total_length += self.lengths[number]
+        for term, frequency in counts.items():
+            self.postings.setdefault(term, {})[number] = frequency
+
+    def _remove(self, document_id: str) -> bool:
+        number = self.numbers.pop(document_id, None)
+        if number is None:
+            return False
+        del self.ids[number]
+        self.total_length -= self.lengths.pop(number)
+        for term in self.terms.pop(number):
+            postings = self.postings[term]
+            del postings[number]
+            if not postings:
+                del self.postings[term]
+        return True
+
+    def _append(self, entries: List[dict]) -> None:
+        if not self.path or not entries:
+            return
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        data = "".join(json.dumps(entry, separators=(",", ":")) + "\n" for entry in entries).encode("utf-8")
+        with open(self.path, "ab") as f:
+            start = f.tell()
+            f.write(data)
+            f.flush()
+            end = f.tell()
+            log_id = _file_id(os.fstat(f.fileno()))
+        self.log_entries += len(entries)
+        # Entries of other workers written in between are read by the next refresh,
+        # which applies these ones again
+        if self._log_id in (None, log_id) and start == self._offset and end == start + len(data):
+            self._log_id = log_id
+            self._offset = end
+        if self.log_entries > 2 * len(self.numbers) + 1000:
+            self._compact()
+
+    def _compact(self) -> None:
+        if not self.path:
+            return
+        temp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            for number, document_id in self.ids.items():
+                f.write(json.dumps({"id": document_id, "terms": self.terms[number]},
+                                   separators=(",", ":")) + "\n")
+            f.flush()
+            stat = os.fstat(f.fileno())
+        os.replace(temp_path, self.path)
+        self._log_id = _file_id(stat)
+        self._offset = stat.st_size
+        self.log_entries = len(self.numbers)
+
+    def _refresh(self) -> None:
+        # Apply the entries appended to the log since it was last read
+        if not self.path:
+            return
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return
+        if _file_id(stat) == self._log_id and stat.st_size == self._offset:
+            return
+        with open(self.path, "rb") as f:
+            log_id = _file_id(os.fstat(f.fileno()))
+            if log_id != self._log_id:
+                # A new or compacted log, replayed from the start
+                self._clear()
+                self._log_id = log_id
+                self._offset = 0
+            f.seek(self._offset)
+            data = f.read()
+        # A line without its line break is still being written
+        end = data.rfind(b"\n") + 1
+        self._offset += end
+        for line in data[:end].splitlines():
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                # Line cut by an interrupted write
+                continue
+            if "delete" in entry:
+                self._remove(entry["delete"])
+            else:
+                self._add(entry["id"], entry["terms"])
+            self.log_entries += 1
+
+    def _clear(self) -> None:
+        self.numbers.clear()
+        self.ids.clear()
+        self.lengths.clear()
+        self.terms.clear()
+        self.postings.clear()
+        self.total_length = 0
+        self.log_entries = 0
+
+
+def _file_id(stat: os.stat_result) -> Tuple[int, int]:
+    return stat.st_dev, stat.st_ino
@@ -1,14 +1,117 @@
+import io
+import json
 import os
+import threading
+import zipfile
 from datetime import datetime
-from chromadb import PersistentClient, ClientAPI, Collection
+from typing import Dict, Iterator, List, Optional, Tuple
+import numpy as np
+from chromadb import HttpClient, PersistentClient, ClientAPI, Collection
+from chromadb.config import Settings
 from chromadb.utils import embedding_functions
 import logging
+from vectordb_embeddings import get_embedding_function
+from vectordb_lexical import BM25Index, tokenize
+
+
+# Version of the export archive format.
+EXPORT_FORMAT_VERSION = 1
+
+# Name of each included field in the documents of iter_documents.
+RECORD_FIELDS = {"documents": "document", "metadatas": "metadata", "embeddings": "embedding",
+                 "uris": "uri", "data": "data"}
+
+# Database directory, by default next to this module rather than in the working directory.
+CHROMA_DB_PATH = os.getenv("CHROMA_DB_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "db"))
+
+# Host of a Chroma server to connect to instead of opening the database in process.
+CHROMA_SERVER_HOST = os.getenv("CHROMA_SERVER_HOST")
+CHROMA_SERVER_PORT = int(os.getenv("CHROMA_SERVER_PORT", 8000))
+
+# Directory of the lexical indexes, by default in the database directory.
+LEXICAL_INDEX_DIR = os.getenv("LEXICAL_INDEX_DIR")
+
+# Queries of at most this many terms are answered from the lexical index alone when it has matches.
+LEXICAL_ONLY_MAX_TERMS = int(os.getenv("LEXICAL_ONLY_MAX_TERMS", 3))
+
+# Rank constant of the reciprocal rank fusion of the lexical and vector rankings.
+RRF_K = 60
+
+
+# Process-wide Chroma clients by location and settings, and lexical indexes by path.
+_clients: Dict[tuple, ClientAPI] = {}
+_lexical_indexes: Dict[str, BM25Index] = {}
+_registry_lock = threading.Lock()
+
+
+def get_chroma_client(db_path: Optional[str] = None,
+                      host: Optional[str] = None,
+                      port: Optional[int] = None,
+                      settings: Optional[Settings] = None) -> ClientAPI:
+    """
+    Get the process-wide client of a database directory, or of a Chroma server if a host is given.
+
+    Clients with different settings are not shared. Chroma itself refuses to
+    open one database directory with two different settings.
+    """
+    host = host or CHROMA_SERVER_HOST
+    if host:
+        key = ("http", host, port or CHROMA_SERVER_PORT, _settings_key(settings))
+    else:
+        key = ("persistent", os.path.abspath(db_path or CHROMA_DB_PATH), _settings_key(settings))
+    with _registry_lock:
+        client = _clients.get(key)
+        if client is None:
+            # Chroma fills the location in the settings it is given, not in the caller's
+            settings = Settings(**_settings_values(settings)) if settings is not None else Settings()
+            if host:
+                client = HttpClient(host=key[1], port=key[2], settings=settings)
+            else:
+                client = PersistentClient(key[1], settings=settings)
+            _clients[key] = client
+        return client
+
+
+def _settings_key(settings: Optional[Settings]) -> str:
+    if settings is None:
+        return ""
+    return json.dumps(_settings_values(settings), sort_keys=True, default=str)
+
+
+def _settings_values(settings: Settings) -> dict:
+    return settings.model_dump() if hasattr(settings, "model_dump") else settings.dict()
+
+
+def _lexical_index(path: str) -> Tuple[BM25Index, bool]:
+    # Returns the shared index of a path, and whether it was just created
+    with _registry_lock:
+        index = _lexical_indexes.get(path)
+        if index is not None:
+            return index, False
+        index = BM25Index(path)
+        _lexical_indexes[path] = index
+        return index, True
 
 
 class PersistentChromaDBClient:
-    def __init__(self):
-        self.client = PersistentClient("db")
-        self.embedding_function = embedding_functions.DefaultEmbeddingFunction()
+    def __init__(self,
+                 db_path: Optional[str] = None,
+                 host: Optional[str] = None,
+                 port: Optional[int] = None,
+                 settings: Optional[Settings] = None):
+        self.db_path = db_path or CHROMA_DB_PATH
+        self.client = get_chroma_client(self.db_path, host, port, settings)
+        self.lexical_index_dir = LEXICAL_INDEX_DIR or os.path.join(os.path.abspath(self.db_path), "lexical")
+        self._embedding_function = None
+        self.collections = {}
+        self.lexical_indexes: Dict[str, BM25Index] = {}
+
+    @property
+    def embedding_function(self):
+        # The shared model is only resolved when a collection needs it.
+        if self._embedding_function is None:
+            self._embedding_function = get_embedding_function()
+        return self._embedding_function
 
     def get_client(self) -> ClientAPI:
         return self.client
@@ -17,7 +120,33 @@ class PersistentChromaDBClient:
         """
         Get a collection from the database.
         """
-        return self.client.get_collection(name=collection_name)
+        return self.client.get_collection(name=collection_name, embedding_function=self.embedding_function)
+
+    def _collection(self, collection_name: str) -> Collection:
+        # Collections are resolved once, not on every read or write.
+        collection = self.collections.get(collection_name)
+        if collection is None:
+            collection = self.get_collection(collection_name)
+            self.collections[collection_name] = collection
+        return collection
+
+    def get_lexical_index(self, collection_name: str) -> BM25Index:
+        """
+        Get the lexical index of a collection, built from its documents the first time.
+        """
+        index = self.lexical_indexes.get(collection_name)
+        if index is None:
+            path = self._lexical_index_path(collection_name)
+            exists = os.path.exists(path)
+            index, created = _lexical_index(path)
+            if created and not exists:
+                for page in self.iter_pages(collection_name, include=["documents"]):
+                    index.add(page["ids"], page["documents"])
+            self.lexical_indexes[collection_name] = index
+        return index
+
+    def _lexical_index_path(self, collection_name: str) -> str:
+        return os.path.join(self.lexical_index_dir, f"{collection_name}.jsonl")
 
     def get_default_embedding_function(self):
         """
@@ -33,19 +162,28 @@ class PersistentChromaDBClient:
         """
         Create a collection in the database.
         """
-        return self.client.get_or_create_collection(name=collection_name,
-                                                    embedding_function=embedding_function or
-                                                    self.embedding_function,
-                                                    metadata={
-                                                        "description": description,
-                                                        "created": str(datetime.now())
-                                                    })
+        collection = self.client.get_or_create_collection(name=collection_name,
+                                                          embedding_function=embedding_function or
+                                                          self.embedding_function,
+                                                          metadata={
+                                                              "description": description,
+                                                              "created": str(datetime.now())
+                                                          })
+        self.collections[collection_name] = collection
+        return collection
 
     def delete_collection(self, collection_name: str) -> None:
         """
         Delete a collection from the database.
         """
+        self.collections.pop(collection_name, None)
+        self.lexical_indexes.pop(collection_name, None)
         self.client.delete_collection(name=collection_name)
+        path = self._lexical_index_path(collection_name)
+        with _registry_lock:
+            _lexical_indexes.pop(path, None)
+        if os.path.exists(path):
+            os.remove(path)
 
     def add_documents(self,
                       collection_name: str,
@@ -56,15 +194,255 @@ class PersistentChromaDBClient:
         """
         Add documents to a collection.
         """
-        collection = self.get_collection(collection_name)
+        collection = self._collection(collection_name)
+        index = self.get_lexical_index(collection_name)
         collection.add(ids=ids,
                        documents=documents,
                        metadatas=metadatas,
                        )
+        index.add(ids, documents)
 
-    def get_all_documents(self, collection_name: str) -> list:
+    def upsert_documents(self,
+                         collection_name: str,
+                         ids: list,
+                         documents: list,
+                         metadatas: list = None
+                         ) -> None:
+        """
+        Add documents to a collection, replacing the ones with the same ids.
+        """
+        collection = self._collection(collection_name)
+        index = self.get_lexical_index(collection_name)
+        collection.upsert(ids=ids,
+                          documents=documents,
+                          metadatas=metadatas,
+                          )
+        index.add(ids, documents)
+
+    def upsert_embeddings(self,
+                          collection_name: str,
+                          ids: list,
+                          embeddings: list,
+                          documents: list,
+                          metadatas: list = None
+                          ) -> None:
+        """
+        Add documents with precomputed embeddings to a collection, replacing the ones with the same ids.
+        """
+        collection = self._collection(collection_name)
+        index = self.get_lexical_index(collection_name)
+        collection.upsert(ids=ids,
+                          embeddings=embeddings,
+                          documents=documents,
+                          metadatas=metadatas,
+                          )
+        index.add(ids, documents)
+
+    def query_documents(self,
+                        collection_name: str,
+                        query_texts: list = None,
+                        n_results: int = 10,
+                        where: dict = None,
+                        query_embeddings: list = None
+                        ) -> dict:
+        """
+        Get the documents most similar to the query texts or embeddings, with their distances.
+        """
+        collection = self._collection(collection_name)
+        return collection.query(query_texts=query_texts,
+                                query_embeddings=query_embeddings,
+                                n_results=n_results,
+                                where=where,
+                                include=["documents", "metadatas", "distances"],
+                                )
+
+    def hybrid_search(self,
+                      collection_name: str,
+                      query: str,
+                      n_results: int = 10,
+                      where: dict = None,
+                      query_embedding: list = None
+                      ) -> List[dict]:
+        """
+        Get the documents best matching a query, fusing the BM25 and vector rankings.
+
+        Short keyword queries with lexical matches skip the embedding search.
+        Each document is a dict with its "id", "document", "metadata" and
+        fused "score", best first.
+        """
+        collection = self._collection(collection_name)
+        candidates = n_results if where is None else n_results * 4
+        lexical = self.get_lexical_index(collection_name).search(query, candidates)
+        rankings = [[document_id for document_id, _ in lexical]]
+        if not lexical or len(tokenize(query)) > LEXICAL_ONLY_MAX_TERMS:
+            result = collection.query(query_texts=None if query_embedding else [query],
+                                      query_embeddings=[query_embedding] if query_embedding else None,
+                                      n_results=n_results,
+                                      where=where,
+                                      include=[])
+            rankings.append(result["ids"][0] if result["ids"] else [])
+
+        scores: Dict[str, float] = {}
+        for ranking in rankings:
+            for rank, document_id in enumerate(ranking):
+                scores[document_id] = scores.get(document_id, 0.0) + 1 / (RRF_K + rank + 1)
+        if not scores:
+            return []
+        found = collection.get(ids=list(scores), where=where, include=["documents", "metadatas"])
+        records = [{"id": document_id, "document": document, "metadata": metadata,
+                    "score": scores[document_id]}
+                   for document_id, document, metadata in
+                   zip(found["ids"], found["documents"], found["metadatas"])]
+        records.sort(key=lambda record: -record["score"])
+        return records[:n_results]
+
+    def delete_documents(self,
+                         collection_name: str,
+                         ids: list = None,
+                         where: dict = None
+                         ) -> None:
+        """
+        Delete documents from a collection by id or metadata filter.
+        """
+        collection = self._collection(collection_name)
+        if where is not None:
+            ids = collection.get(ids=ids, where=where, include=[])["ids"]
+            if not ids:
+                return
+        collection.delete(ids=ids, where=where)
+        if ids is not None:
+            self.get_lexical_index(collection_name).remove(ids)
+
+    def iter_pages(self,
+                   collection_name: str,
+                   page_size: int = 1000,
+                   include: list = None,
+                   where: dict = None
+                   ) -> Iterator[dict]:
+        """
+        Get the documents of a collection page by page, with only the `include`d fields.
+        """
+        collection = self._collection(collection_name)
+        include = ["documents", "metadatas"] if include is None else include
+        offset = 0
+        while True:
+            page = collection.get(limit=page_size, offset=offset, where=where, include=include)
+            if not page["ids"]:
+                return
+            yield page
+            if len(page["ids"]) < page_size:
+                return
+            offset += len(page["ids"])
+
+    def iter_documents(self,
+                       collection_name: str,
+                       page_size: int = 1000,
+                       include: list = None,
+                       where: dict = None
+                       ) -> Iterator[dict]:
+        """
+        Get the documents of a collection one by one, holding one page in memory at a time.
+
+        Each document is a dict with its "id" and the `include`d fields,
+        named in the singular: "document", "metadata", "embedding".
+        """
+        for page in self.iter_pages(collection_name, page_size, include, where):
+            fields = [field for field in page["included"] if page.get(field) is not None]
+            for index, document_id in enumerate(page["ids"]):
+                record = {"id": document_id}
+                for field in fields:
+                    record[RECORD_FIELDS[field]] = page[field][index]
+                yield record
+
+    def get_all_documents(self, collection_name: str, include: list = None, where: dict = None) -> dict:
         """
         Get all documents from a collection.
         """
-        collection = self.get_collection(collection_name)
-        return collection.get_all_documents()
+        result = {"ids": []}
+        for page in self.iter_pages(collection_name, include=include, where=where):
+            result["ids"].extend(page["ids"])
+            for field in page["included"]:
+                if page.get(field) is not None:
+                    result.setdefault(field, []).extend(page[field])
+        return result
+
+    def export_collection(self, collection_name: str, path: str, page_size: int = 1000) -> int:
+        """
+        Export a collection with its embeddings to a columnar archive, page by page.
+
+        Returns the number of exported documents.
+        """
+        collection = self._collection(collection_name)
+        count = 0
+        with zipfile.ZipFile(path, "w", zipfile.ZIP_STORED) as archive:
+            pages = self.iter_pages(collection_name, page_size,
+                                    include=["documents", "metadatas", "embeddings"])
+            for number, page in enumerate(pages):
+                archive.writestr(f"{number:06d}.npz", _pack_page(page))
+                count += len(page["ids"])
+            archive.writestr("collection.json", json.dumps({
+                "version": EXPORT_FORMAT_VERSION,
+                "name": collection_name,
+                "metadata": collection.metadata,
+                "count": count,
+            }))
+        return count
+
+    def import_collection(self, path: str, collection_name: str = None) -> int:
+        """
+        Restore a collection exported with `export_collection`, without re-embedding.
+
+        Returns the number of imported documents.
+        """
+        count = 0
+        with zipfile.ZipFile(path) as archive:
+            manifest = json.loads(archive.read("collection.json"))
+            if manifest["version"] != EXPORT_FORMAT_VERSION:
+                raise ValueError(f"Unsupported export format version: {manifest['version']}")
+            collection_name = collection_name or manifest["name"]
+            self.create_collection(collection_name, (manifest["metadata"] or {}).get("description"))
+            for member in sorted(name for name in archive.namelist() if name.endswith(".npz")):
+                ids, embeddings, documents, metadatas = _unpack_page(archive.read(member))
+                self.upsert_embeddings(collection_name, ids=ids, embeddings=embeddings,
+                                       documents=documents,
+                                       metadatas=metadatas if any(metadatas) else None)
+                count += len(ids)
+        return count
+
+
+def _pack_strings(values: List[str]) -> Tuple[np.ndarray, np.ndarray]:
+    # UTF-8 bytes of all values, and the end offset of each value
+    encoded = [value.encode("utf-8") for value in values]
+    offsets = np.cumsum([len(value) for value in encoded], dtype=np.int64)
+    return np.frombuffer(b"".join(encoded), dtype=np.uint8), offsets
+
+
+def _unpack_strings(data: np.ndarray, offsets: np.ndarray) -> List[str]:
+    blob = data.tobytes()
+    starts = np.concatenate(([0], offsets[:-1])) if len(offsets) else offsets
+    return [blob[start:end].decode("utf-8") for start, end in zip(starts, offsets)]
+
+
+def _pack_page(page: dict) -> bytes:
+    documents = page["documents"]
+    columns = {}
+    for name, values in (("ids", page["ids"]),
+                         ("documents", [document or "" for document in documents]),
+                         ("metadatas", [json.dumps(metadata) for metadata in page["metadatas"]])):
+        columns[name], columns[f"{name}_offsets"] = _pack_strings(values)
+    columns["documents_null"] = np.array([document is None for document in documents], dtype=bool)
+    columns["embeddings"] = np.asarray(page["embeddings"], dtype=np.float32)
+    buffer = io.BytesIO()
+    np.savez_compressed(buffer, **columns)
+    return buffer.getvalue()
+
+
+def _unpack_page(data: bytes) -> Tuple[list, list, list, list]:
+    columns = np.load(io.BytesIO(data), allow_pickle=False)
+    ids = _unpack_strings(columns["ids"], columns["ids_offsets"])
+    documents = [None if null else document for document, null in
+                 zip(_unpack_strings(columns["documents"], columns["documents_offsets"]),
+                     columns["documents_null"])]
+    metadatas = [json.loads(metadata) for metadata in
+                 _unpack_strings(columns["metadatas"], columns["metadatas_offsets"])]
+    return ids, columns["embeddings"].tolist(), documents, metadatas
@@ -0,0 +1,167 @@
+import asyncio
+import logging
+import os
+import re
+import threading
+from collections import OrderedDict
+from typing import Dict, List, NamedTuple, Optional
+from vectordb_ingestion import Embedder, default_embedder
+from vectordb_provider import PersistentChromaDBClient
+
+
+# Opt-in switch of the guidance retrieval tool, the index is built offline.
+GUIDANCE_RETRIEVAL_ENABLED = os.getenv("GUIDANCE_RETRIEVAL_ENABLED", "false").lower() in ("1", "true", "yes")
+
+# Collection of the Azure guidance index.
+GUIDANCE_COLLECTION = os.getenv("GUIDANCE_COLLECTION", "azure_guidance")
+
+
+class GuidanceChunk(NamedTuple):
+    text: str
+    title: str
+    source: str
+    similarity: float
+
+
+class GuidanceRetriever:
+    """
+    Retrieve the chunks of the guidance index most relevant to a query.
+
+    Query embeddings are kept in an LRU cache, and a retrieval that does not
+    finish within `latency_budget_ms` returns no guidance rather than
+    delaying the turn; the search finishes in the background and warms the
+    cache for the next query.
+    """
+
+    def __init__(self,
+                 db: PersistentChromaDBClient,
+                 collection_name: str = GUIDANCE_COLLECTION,
+                 top_k: int = 4,
+                 latency_budget_ms: float = 300.0,
+                 query_cache_size: int = 256,
+                 embedder: Optional[Embedder] = None):
+        self.db = db
+        self.collection_name = collection_name
+        self.top_k = top_k
+        self.latency_budget_ms = latency_budget_ms
+        self.query_cache_size = query_cache_size
+        self.embedder = embedder or default_embedder(db)
+        self.query_cache: "OrderedDict[str, List[float]]" = OrderedDict()
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.over_budget = 0
+        self._lock = threading.Lock()
+
+    def embed_query(self, query: str) -> List[float]:
+        """
+        Get the embedding of a query, from the cache when it was seen before.
+        """
+        # Queries differing only in case and spacing share an embedding, the
+        # first one seen is embedded as written.
+        key = re.sub(r'\s+', ' ', query).strip().lower()
+        with self._lock:
+            embedding = self.query_cache.get(key)
+            if embedding is not None:
+                self.query_cache.move_to_end(key)
+                self.cache_hits += 1
+                return embedding
+            self.cache_misses += 1
+        embedding = self.embedder([query])[0]
+        with self._lock:
+            self.query_cache[key] = embedding
+            while len(self.query_cache) > self.query_cache_size:
+                self.query_cache.popitem(last=False)
+        return embedding
+
+    def search(self, query: str, top_k: Optional[int] = None) -> List[GuidanceChunk]:
+        """
+        Get the most relevant guidance chunks, most similar first.
+        """
+        result = self.db.query_documents(
+            self.collection_name,
+            query_embeddings=[self.embed_query(query)],
+            n_results=top_k or self.top_k)
+        if not result["ids"] or not result["ids"][0]:
+            return []
+        return [
+            GuidanceChunk(
+                text=document,
+                title=(metadata or {}).get("title", ""),
+                source=(metadata or {}).get("source", ""),
+                similarity=1 - distance / 2)
+            for document, metadata, distance in zip(
+                result["documents"][0], result["metadatas"][0], result["distances"][0])
+        ]
+
+    async def retrieve(self, query: str, top_k: Optional[int] = None) -> List[GuidanceChunk]:
+        """
+        Search without blocking the event loop, within the latency budget.
+        """
+        search = asyncio.ensure_future(asyncio.to_thread(self.search, query, top_k))
+        try:
+            return await asyncio.wait_for(asyncio.shield(search), self.latency_budget_ms / 1000)
+        except asyncio.TimeoutError:
+            self.over_budget += 1
+            logging.warning(f"Guidance retrieval exceeded its {self.latency_budget_ms:.0f} ms budget")
+            search.add_done_callback(lambda task: task.cancelled() or task.exception())
+            return []
+        except Exception as e:
+            logging.error(f"Guidance retrieval failed: {str(e)}")
+            return []
+
+    def stats(self) -> Dict[str, int]:
+        """
+        Get the query cache and latency budget counters.
+        """
+        with self._lock:
+            return {
+                "cache_hits": self.cache_hits,
+                "cache_misses": self.cache_misses,
+                "cached_queries": len(self.query_cache),
+                "over_budget": self.over_budget,
+            }
+
+
+def format_guidance(chunks: List[GuidanceChunk]) -> str:
+    """
+    Format guidance chunks for a model, with their sources.
+    """
+    if not chunks:
+        return "No relevant guidance found."
+    return "\n\n".join(
+        f"[{index}] {chunk.title or chunk.source}\nSource: {chunk.source}\n{chunk.text}"
+        for index, chunk in enumerate(chunks, start=1))
+
+
+_guidance_retriever: Optional[GuidanceRetriever] = None
+
+
+def get_guidance_retriever() -> GuidanceRetriever:
+    """
+    Get the process-wide guidance retriever.
+    """
+    global _guidance_retriever
+    if _guidance_retriever is None:
+        _guidance_retriever = GuidanceRetriever(
+            PersistentChromaDBClient(),
+            top_k=int(os.getenv("GUIDANCE_TOP_K", 4)),
+            latency_budget_ms=float(os.getenv("GUIDANCE_LATENCY_BUDGET_MS", 300)))
+    return _guidance_retriever
+
+
+def warm_up_guidance() -> None:
+    """
+    Load the index and the embedding model before the first turn needs them.
+    """
+    try:
+        get_guidance_retriever().embed_query("Azure architecture")
+    except Exception as e:
+        logging.error(f"Guidance retrieval warm up failed: {str(e)}")
+
+
+async def search_guidance(query: str) -> str:
+    """
+    Get the formatted guidance most relevant to a query, within the latency budget.
+    """
+    retriever = await asyncio.to_thread(get_guidance_retriever)
+    return format_guidance(await retriever.retrieve(query))